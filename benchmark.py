@@ -0,0 +1,247 @@
+"""Нагрузочные замеры встраивания и извлечения.
+
+Каждый вариант (размер изображения, нагрузка, bits_per_channel, шифрование, потоки)
+выполняется в отдельном процессе, чтобы пиковая память (RSS) относилась
+только к нему. Результат - JSON со временем этапов, MB/s и RSS.
+
+    python benchmark.py --megapixels 0.1 1 10 --bits 1 2 --output bench.json
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_processor import ImageProcessor
+from key_cache import KeyCache, DEFAULT_KDF_ITERATIONS
+from lsb_algorithm import LSBAlgorithm
+from payload_header import HEADER_SIZE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_VERSION = 1
+
+# Этапы в порядке выполнения
+STAGES = ('decode', 'kdf', 'embed', 'encode', 'extract')
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковая память процесса в МБ (None, если недоступно).
+
+    В Linux берется VmHWM: ru_maxrss сохраняет максимум и через exec, то есть
+    включает память родительского процесса.
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в КБ, в macOS - в байтах
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def synthetic_cover(path: str, megapixels: float, seed: int = 0) -> tuple:
+    """Шумовое RGB-изображение 4:3 с заданным числом мегапикселей"""
+    width = max(8, int(round((megapixels * 1e6 * 4 / 3) ** 0.5)))
+    height = max(8, int(round(megapixels * 1e6 / width)))
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(path, compress_level=1)
+    return width, height
+
+
+def _timed(stages: dict, name: str, func):
+    """Выполнение с записью лучшего времени этапа"""
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    stages[name] = min(elapsed, stages.get(name, elapsed))
+    return result
+
+
+def run_case(case: dict, cover: str) -> dict:
+    """Один вариант замера на готовом изображении; выполняется в отдельном процессе"""
+    result = dict(case)
+    k = case['bits_per_channel']
+    password = BENCHMARK_PASSWORD if case['encrypted'] else None
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, 'output.png')
+        with Image.open(cover) as image:
+            width, height = image.size
+        result.update(width=width, height=height)
+
+        payload = os.urandom(case['payload_bytes'])
+        # Заголовок занимает HEADER_SIZE * 8 каналов по 1 биту
+        capacity = width * height * 3 * k // 8 - HEADER_SIZE * k
+        if case['encrypted']:
+            # Параметры KDF, контроль ключа, nonce и тег (режим шифрования по умолчанию)
+            capacity -= LSBAlgorithm.encrypted_size(0, LSBAlgorithm(k).encryption_flags())
+        if len(payload) > capacity:
+            result.update(status='skipped', reason=f"Нагрузка больше вместимости ({capacity} байт)")
+            return result
+
+        for _ in range(case['repeat']):
+            # Новый кеш ключей в каждом повторе: KDF измеряется отдельно от встраивания
+            lsb = LSBAlgorithm(k, case['kdf_iterations'], key_cache=KeyCache(), workers=case.get('threads', 1))
+            processor = ImageProcessor()
+
+            def decode():
+                processor.load_image(cover)
+                processor.convert_to_native()
+                return processor.get_channels()
+
+            pixels = _timed(stages, 'decode', decode)
+            channels = pixels.reshape(-1)
+            if password:
+                _timed(stages, 'kdf', lambda: lsb.key_cache.encryption_key(password, lsb.kdf_iterations))
+            _timed(stages, 'embed', lambda: lsb.embed_data(channels, payload, password))
+            _timed(stages, 'encode', lambda: processor.save_channels(output, pixels, processor.size, processor.mode))
+
+            def extract():
+                reader = ImageProcessor()
+                reader.load_image(output)
+                return lsb.extract_data(reader.get_channels(writable=False).reshape(-1), password)
+
+            if _timed(stages, 'extract', extract) != payload:
+                raise ValueError("Извлеченная нагрузка не совпадает со встроенной")
+
+            if case.get('legacy'):
+                rows = _timed(stages, 'get_pixels', processor.get_pixels)
+                _timed(stages, 'save_image', lambda: processor.save_image(output, rows, processor.size))
+
+    megabytes = len(payload) / 1e6
+    embed_total = stages['decode'] + stages.get('kdf', 0) + stages['embed'] + stages['encode']
+    result.update(
+        status='ok',
+        stages={name: round(value, 6) for name, value in stages.items()},
+        embed_mb_s=round(megabytes / embed_total, 3),
+        extract_mb_s=round(megabytes / stages['extract'], 3),
+        image_mb_s=round(width * height * 3 / 1e6 / embed_total, 3),
+        peak_rss_mb=peak_rss_mb(),
+    )
+    return result
+
+
+def build_cases(args) -> List[dict]:
+    encrypted = {'plain': [False], 'encrypted': [True], 'both': [False, True]}[args.encryption]
+    return [
+        {
+            'megapixels': megapixels,
+            'payload_bytes': payload_bytes,
+            'bits_per_channel': bits,
+            'encrypted': flag,
+            'kdf_iterations': args.kdf_iterations,
+            'repeat': args.repeat,
+            'legacy': args.legacy,
+            'threads': threads,
+        }
+        for megapixels in args.megapixels
+        for payload_bytes in args.payload_bytes
+        for bits in args.bits
+        for flag in encrypted
+        for threads in args.threads
+    ]
+
+
+def run_benchmark(cases: List[dict], progress=None) -> dict:
+    """Выполнение вариантов, каждого в своем процессе.
+
+    Изображения создаются заранее в этом процессе, чтобы их генерация не
+    попадала в RSS вариантов. Процессы запускаются через spawn: при fork
+    ru_maxrss потомка включает пиковую память родителя.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        covers = {}
+        for index, case in enumerate(cases, 1):
+            megapixels = case['megapixels']
+            if megapixels not in covers:
+                covers[megapixels] = os.path.join(workdir, f'cover_{len(covers)}.png')
+                synthetic_cover(covers[megapixels], megapixels)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    result = executor.submit(run_case, case, covers[megapixels]).result()
+                except Exception as e:
+                    result = dict(case, status='error', error=str(e))
+            results.append(result)
+            if progress:
+                progress(index, len(cases), result)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': Image.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'stages': list(STAGES),
+        'cases': results,
+    }
+
+
+def _print_progress(done: int, total: int, result: dict) -> None:
+    label = (f"{result['megapixels']} MP, {result['payload_bytes']} B, k={result['bits_per_channel']}, "
+             f"{'шифр.' if result['encrypted'] else 'без шифр.'}, потоков: {result.get('threads', 1)}")
+    if result['status'] == 'ok':
+        status = f"встраивание {result['embed_mb_s']} MB/s, RSS {result['peak_rss_mb']} МБ"
+    else:
+        status = result.get('reason') or f"ОШИБКА: {result.get('error')}"
+    print(f"[{done}/{total}] {label}: {status}", file=sys.stderr)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='benchmark', description="StegoLab: замеры производительности")
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[0.1, 1, 10],
+                        help="Размеры синтетических изображений в мегапикселях")
+    parser.add_argument('--payload-bytes', type=int, nargs='+', default=[1024, 65536],
+                        help="Размеры нагрузки в байтах")
+    parser.add_argument('--bits', type=int, nargs='+', default=[1, 2, 3, 4], choices=range(1, 5),
+                        help="Значения bits_per_channel")
+    parser.add_argument('--encryption', choices=('plain', 'encrypted', 'both'), default='both')
+    parser.add_argument('--kdf-iterations', type=int, default=DEFAULT_KDF_ITERATIONS)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1],
+                        help="Число потоков записи и чтения битов внутри изображения")
+    parser.add_argument('--repeat', type=int, default=3, help="Повторов варианта (берется лучшее время)")
+    parser.add_argument('--legacy', action='store_true',
+                        help="Замерять также get_pixels/save_image (списки кортежей)")
+    parser.add_argument('--output', help="Файл для JSON (по умолчанию - стандартный вывод)")
+    parser.add_argument('--quiet', action='store_true', help="Не выводить прогресс")
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    report = run_benchmark(build_cases(args), None if args.quiet else _print_progress)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if any(case['status'] == 'error' for case in report['cases']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
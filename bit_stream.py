@@ -0,0 +1,283 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+import numpy as np
+
+# Сколько каналов обрабатывается за один векторный шаг (кратно 8)
+CHUNK_CHANNELS = 1 << 20
+
+# Наименьшая полоса каналов для отдельного потока при параллельной обработке
+PARALLEL_MIN_CHANNELS = 1 << 20
+
+
+def _keep_mask(dtype: np.dtype, bits_per_channel: int):
+    """Маска старших битов канала, которые не должны меняться"""
+    full = np.iinfo(dtype).max
+    return dtype.type(full ^ ((1 << bits_per_channel) - 1))
+
+
+def _values_to_bits(values: np.ndarray, bits_per_channel: int) -> np.ndarray:
+    """Младшие биты значений каналов в виде плоского массива битов"""
+    k = bits_per_channel
+    bits = np.empty((values.size, k), dtype=np.uint8)
+    for j in range(k):
+        bits[:, j] = (values >> (k - 1 - j)) & 1
+    return bits.reshape(-1)
+
+
+def _bands(channels: int, workers: int) -> List[Tuple[int, int]]:
+    """Деление каналов на полосы по одной на поток; границы кратны 8 каналам"""
+    count = max(1, min(workers, channels // PARALLEL_MIN_CHANNELS))
+    step = max(8, -(-channels // count // 8) * 8)
+    return [(start, min(channels, start + step)) for start in range(0, channels, step)]
+
+
+def _store_values(channels: np.ndarray, position: int, data, bits_per_channel: int, keep) -> None:
+    """Запись упакованных байтов (кратно bits_per_channel) в каналы с позиции position"""
+    k = bits_per_channel
+    step = CHUNK_CHANNELS * k // 8
+    for start in range(0, len(data), step):
+        groups = np.unpackbits(np.frombuffer(data[start:start + step], dtype=np.uint8)).reshape(-1, k)
+        values = np.zeros(groups.shape[0], dtype=channels.dtype)
+        for j in range(k):
+            values |= groups[:, j] << (k - 1 - j)
+        target = channels[position:position + values.size]
+        target &= keep
+        target |= values
+        position += values.size
+
+
+def _load_values(channels: np.ndarray, start: int, end: int, bits_per_channel: int, mask) -> bytes:
+    """Упакованные байты младших битов каналов [start, end); число бит кратно 8"""
+    parts = []
+    for first in range(start, end, CHUNK_CHANNELS):
+        values = channels[first:min(end, first + CHUNK_CHANNELS)] & mask
+        parts.append(np.packbits(_values_to_bits(values, bits_per_channel)).tobytes())
+    return b''.join(parts)
+
+
+def patch_bits(channels: np.ndarray, bits_per_channel: int, bit_offset: int, data: bytes) -> None:
+    """Перезапись байтов с произвольной битовой позиции потока.
+
+    Соседние биты в общих с данными каналах сохраняются, поэтому так можно
+    обновить уже записанный заголовок после потоковой записи нагрузки.
+    """
+    k = bits_per_channel
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    first = bit_offset // k
+    last = -(-(bit_offset + bits.size) // k)
+    if last > channels.size:
+        raise ValueError("Данные не помещаются в изображение")
+
+    mask = channels.dtype.type((1 << k) - 1)
+    current = _values_to_bits(channels[first:last] & mask, k)
+    start = bit_offset - first * k
+    current[start:start + bits.size] = bits
+
+    writer = LSBWriter(channels, k, first)
+    writer._store(current.reshape(-1, k))
+
+
+class LSBWriter:
+    """Последовательная запись байтов в младшие биты каналов.
+
+    Данные принимаются упакованными байтами; биты, не заполнившие группу
+    из bits_per_channel, переносятся в следующий вызов write(). В нестрогом
+    режиме (strict=False) не поместившиеся биты ждут следующего блока
+    каналов, переданного в rebind().
+
+    С workers > 1 большие записи делятся на полосы каналов, которые
+    заполняются параллельно в потоках (NumPy отпускает GIL); результат
+    совпадает с последовательной записью.
+    """
+
+    def __init__(self, channels: np.ndarray, bits_per_channel: int, position: int = 0, strict: bool = True,
+                 workers: int = 1):
+        self.channels = channels
+        self.bits_per_channel = bits_per_channel
+        self.position = position
+        self.strict = strict
+        self.workers = workers
+        self._pending = np.empty(0, dtype=np.uint8)
+        self._keep = _keep_mask(channels.dtype, bits_per_channel)
+
+    @property
+    def pending_bits(self) -> int:
+        """Число бит, ещё не записанных в каналы"""
+        return self._pending.size
+
+    def write(self, data: bytes) -> None:
+        """Запись упакованных байтов"""
+        view = memoryview(data).cast('B')
+        if self.workers > 1 and len(view) * 8 >= 2 * PARALLEL_MIN_CHANNELS * self.bits_per_channel:
+            view = self._write_parallel(view)
+        step = CHUNK_CHANNELS * self.bits_per_channel // 8
+        for start in range(0, len(view), step):
+            self._write_bits(np.unpackbits(np.frombuffer(view[start:start + step], dtype=np.uint8)))
+
+    def _write_parallel(self, view: memoryview) -> memoryview:
+        """Параллельная запись выровненной части данных; возвращает остаток"""
+        k = self.bits_per_channel
+        # Первые байты пишутся последовательно, пока не останется незаписанных бит
+        head = next(n for n in range(k) if (self._pending.size + 8 * n) % k == 0)
+        if head:
+            self._write_bits(np.unpackbits(np.frombuffer(view[:head], dtype=np.uint8)))
+        if self._pending.size:
+            return view[head:]
+
+        # Каждые k байт занимают ровно 8 каналов
+        body = (len(view) - head) // k * k
+        if not self.strict:
+            body = min(body, (self.channels.size - self.position) // 8 * k)
+        if self.position + body * 8 // k > self.channels.size:
+            raise ValueError("Данные не помещаются в изображение")
+
+        data = view[head:head + body]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(_store_values, self.channels, self.position + start,
+                                       data[start * k // 8:end * k // 8], k, self._keep)
+                       for start, end in _bands(body * 8 // k, self.workers)]
+            for future in futures:
+                future.result()
+        self.position += body * 8 // k
+        return view[head + body:]
+
+    def flush(self) -> None:
+        """Дописывает незавершённую группу битов, дополняя её нулями"""
+        extra = -self._pending.size % self.bits_per_channel
+        if extra:
+            self._pending = np.concatenate((self._pending, np.zeros(extra, dtype=np.uint8)))
+        if self._pending.size:
+            bits, self._pending = self._pending, np.empty(0, dtype=np.uint8)
+            self._write_bits(bits)
+
+    def set_bits_per_channel(self, bits_per_channel: int) -> None:
+        """Смена числа битов на канал на границе канала (после заголовка)"""
+        if bits_per_channel == self.bits_per_channel:
+            return
+        if self._pending.size:
+            raise ValueError("Глубину записи можно менять только на границе канала")
+        self.bits_per_channel = bits_per_channel
+        self._keep = _keep_mask(self.channels.dtype, bits_per_channel)
+
+    def rebind(self, channels: np.ndarray) -> None:
+        """Продолжение потока в следующем блоке каналов (например, полосе изображения)"""
+        self.channels = channels
+        self.position = 0
+        self._keep = _keep_mask(channels.dtype, self.bits_per_channel)
+        if self._pending.size >= self.bits_per_channel:
+            bits, self._pending = self._pending, np.empty(0, dtype=np.uint8)
+            self._write_bits(bits)
+
+    def _write_bits(self, bits: np.ndarray) -> None:
+        if self._pending.size:
+            bits = np.concatenate((self._pending, bits))
+
+        k = self.bits_per_channel
+        whole = bits.size // k
+        if not self.strict:
+            whole = min(whole, self.channels.size - self.position)
+        self._pending = bits[whole * k:]
+        if whole:
+            self._store(bits[:whole * k].reshape(whole, k))
+
+    def _store(self, groups: np.ndarray) -> None:
+        k = self.bits_per_channel
+        count = groups.shape[0]
+        end = self.position + count
+        if end > self.channels.size:
+            raise ValueError("Данные не помещаются в изображение")
+
+        # Собираем значения по k бит из битовых групп
+        values = np.zeros(count, dtype=self.channels.dtype)
+        for j in range(k):
+            values |= groups[:, j] << (k - 1 - j)
+
+        target = self.channels[self.position:end]
+        target &= self._keep
+        target |= values
+        self.position = end
+
+
+class LSBReader:
+    """Последовательное чтение байтов из младших битов каналов.
+
+    С workers > 1 большие чтения выполняются полосами каналов в потоках.
+    """
+
+    def __init__(self, channels: np.ndarray, bits_per_channel: int, position: int = 0, workers: int = 1):
+        self.channels = channels
+        self.bits_per_channel = bits_per_channel
+        self.position = position
+        self.workers = workers
+        self._pending = np.empty(0, dtype=np.uint8)
+        self._mask = channels.dtype.type((1 << bits_per_channel) - 1)
+
+    @property
+    def pending_bits(self) -> int:
+        """Число прочитанных, но ещё не выданных бит"""
+        return self._pending.size
+
+    def set_bits_per_channel(self, bits_per_channel: int) -> None:
+        """Смена числа битов на канал на границе канала (после заголовка)"""
+        if bits_per_channel == self.bits_per_channel:
+            return
+        if self._pending.size:
+            raise ValueError("Глубину чтения можно менять только на границе канала")
+        self.bits_per_channel = bits_per_channel
+        self._mask = self.channels.dtype.type((1 << bits_per_channel) - 1)
+
+    def rebind(self, channels: np.ndarray) -> None:
+        """Продолжение чтения из следующего блока каналов"""
+        self.channels = channels
+        self.position = 0
+        self._mask = channels.dtype.type((1 << self.bits_per_channel) - 1)
+
+    def read(self, count: int) -> bytes:
+        """Чтение count байтов; при нехватке каналов возвращает меньше"""
+        result = bytearray()
+        if self.workers > 1 and count * 8 >= 2 * PARALLEL_MIN_CHANNELS * self.bits_per_channel:
+            result += self._read_parallel(count)
+        return bytes(result) + self._read_serial(count - len(result))
+
+    def _read_serial(self, count: int) -> bytes:
+        k = self.bits_per_channel
+        result = bytearray()
+        while len(result) < count:
+            need_bits = (count - len(result)) * 8 - self._pending.size
+            available = self.channels.size - self.position
+            used = min(max(0, -(-need_bits // k)), available, CHUNK_CHANNELS)
+            if used == 0 and self._pending.size < 8:
+                break
+
+            values = self.channels[self.position:self.position + used] & self._mask
+            self.position += used
+
+            bits = _values_to_bits(values, k)
+            if self._pending.size:
+                bits = np.concatenate((self._pending, bits))
+
+            whole = min(bits.size // 8, count - len(result))
+            result += np.packbits(bits[:whole * 8]).tobytes()
+            self._pending = bits[whole * 8:]
+
+        return bytes(result)
+
+    def _read_parallel(self, count: int) -> bytes:
+        """Параллельное чтение выровненной части из count байт"""
+        k = self.bits_per_channel
+        # Первые байты читаются последовательно, пока не останется непрочитанных бит
+        head = b''
+        while self._pending.size and len(head) < k:
+            head += self._read_serial(1)
+        if self._pending.size:
+            return head
+
+        body = min(count - len(head), (self.channels.size - self.position) // 8 * k) // k * k
+        start, channels = self.position, body * 8 // k
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            parts = executor.map(lambda band: _load_values(self.channels, start + band[0], start + band[1], k,
+                                                          self._mask),
+                                 _bands(channels, self.workers))
+            data = b''.join(parts)
+        self.position += channels
+        return head + data
@@ -0,0 +1,66 @@
+from typing import Optional
+import numpy as np
+from PIL import ImageMode
+
+# Режимы, в которых данные встраиваются без преобразования изображения
+NATIVE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'I;16')
+
+# Тип значения канала для режимов с глубиной больше 8 бит
+_MODE_DTYPES = {'I;16': np.dtype('<u2')}
+
+
+def native_mode(mode: str, has_transparency: bool = False) -> str:
+    """Режим, в котором обрабатывается изображение исходного режима mode"""
+    if mode in NATIVE_MODES:
+        return mode
+    if mode == 'PA' or (mode == 'P' and has_transparency):
+        return 'RGBA'
+    if mode == '1':
+        return 'L'
+    return 'RGB'
+
+
+def mode_dtype(mode: str) -> np.dtype:
+    """Тип значения канала в буфере Image.tobytes()"""
+    return _MODE_DTYPES.get(mode, np.dtype(np.uint8))
+
+
+class ChannelLayout:
+    """Набор каналов изображения, в младшие биты которых встраиваются данные.
+
+    Маска задается строкой имен каналов режима (например, 'RGB' или 'RGBA'
+    для RGBA, 'LA' для LA). По умолчанию используются все каналы, кроме
+    альфа-канала. Порядок каналов в потоке - по пикселям, внутри пикселя
+    в порядке маски.
+    """
+
+    def __init__(self, mode: str, mask: Optional[str] = None):
+        if mode not in NATIVE_MODES:
+            raise ValueError(f"Неподдерживаемый режим изображения: {mode}")
+        bands = ImageMode.getmode(mode).bands
+        if mask is None:
+            mask = ''.join(band for band in bands if band != 'A')
+        if not mask or len(set(mask)) != len(mask) or any(band not in bands for band in mask):
+            raise ValueError(f"Неверная маска каналов '{mask}' для режима {mode}")
+
+        self.mode = mode
+        self.mask = mask
+        self.bands = bands
+        self.indices = [bands.index(band) for band in mask]
+        # Все каналы в исходном порядке: плоский массив - представление без копии
+        self.full = self.indices == list(range(len(bands)))
+
+    @property
+    def channels_per_pixel(self) -> int:
+        return len(self.indices)
+
+    def select(self, pixels: np.ndarray) -> np.ndarray:
+        """Плоский массив используемых каналов из массива (высота, ширина, каналы)"""
+        if self.full:
+            return pixels.reshape(-1)
+        return pixels[..., self.indices].reshape(-1)
+
+    def restore(self, pixels: np.ndarray, channels: np.ndarray) -> None:
+        """Возврат измененных каналов в массив пикселей (для неполной маски)"""
+        if not self.full:
+            pixels[..., self.indices] = channels.reshape(pixels.shape[:2] + (len(self.indices),))
@@ -0,0 +1,385 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+
+from steganography import Steganography
+from lsb_algorithm import CIPHER_CHOICES, DEFAULT_CIPHER
+from key_cache import DEFAULT_KDF_ITERATIONS
+from image_processor import SAVE_PROFILES, LOSSLESS_FORMATS
+from instrumentation import StageCollector, format_summary, merge_summaries
+from ecc import DEFAULT_ECC_DEPTH
+from compression import COMPRESSION_CHOICES, DEFAULT_COMPRESSION, DEFAULT_MAX_DECOMPRESSED_SIZE
+from steganalysis import analyze_image, DEFAULT_THRESHOLD
+from payload_header import FLAG_NAMES
+
+
+def _expand_inputs(pattern: str) -> List[str]:
+    """Список изображений из каталога или glob-шаблона"""
+    stego = Steganography()
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and stego.validate_image_format(p))
+
+
+def _read_manifest(path: str) -> List[dict]:
+    """Чтение CSV-манифеста с колонками cover, payload, output"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    if rows and 'cover' not in rows[0]:
+        raise ValueError("Манифест должен содержать колонку 'cover'")
+    return rows
+
+
+def _output_for(cover: str, output_dir: str, suffix: str, root: str) -> str:
+    """Путь результата в output_dir; подкаталоги cover относительно root сохраняются"""
+    name = os.path.splitext(os.path.basename(cover))[0]
+    subdir = os.path.relpath(os.path.dirname(os.path.abspath(cover)), root)
+    return os.path.normpath(os.path.join(output_dir, subdir, name + suffix))
+
+
+def _input_root(covers: List[str]) -> str:
+    """Общий каталог исходных изображений"""
+    directories = [os.path.dirname(os.path.abspath(cover)) for cover in covers]
+    try:
+        return os.path.commonpath(directories) if directories else os.getcwd()
+    except ValueError:  # Разные диски в Windows
+        return os.getcwd()
+
+
+def _mark_duplicate_outputs(jobs: List[dict]) -> None:
+    """Задания с общим выходным файлом завершаются ошибкой, а не перезаписывают друг друга"""
+    targets = {}
+    for job in jobs:
+        if job['output']:
+            targets.setdefault(os.path.normcase(os.path.abspath(job['output'])), []).append(job)
+    for duplicates in targets.values():
+        if len(duplicates) > 1:
+            for job in duplicates:
+                job['error'] = f"Выходной файл {job['output']} совпадает с результатом другого задания"
+
+
+def collect_jobs(args) -> List[dict]:
+    """Формирует список заданий из аргументов командной строки"""
+    if args.manifest:
+        rows = _read_manifest(args.manifest)
+    else:
+        rows = [{'cover': path} for path in _expand_inputs(args.input)]
+
+    root = _input_root([row['cover'] for row in rows])
+    jobs = []
+    for row in rows:
+        job = {
+            'action': args.command,
+            'cover': row['cover'],
+            'payload': row.get('payload') or getattr(args, 'payload', None),
+            'message': getattr(args, 'message', None),
+            'output': row.get('output'),
+            'password': args.password,
+            'bits': args.bits,
+            'kdf_iterations': getattr(args, 'kdf_iterations', DEFAULT_KDF_ITERATIONS),
+            'binary': getattr(args, 'binary', False),
+            'strip_height': getattr(args, 'strip_height', None),
+            'scatter': getattr(args, 'scatter', False),
+            'channels': args.channels,
+            'profile': getattr(args, 'profile', 'default'),
+            'keep_metadata': not getattr(args, 'strip_metadata', False),
+            'jpeg': getattr(args, 'jpeg', False),
+            'ecc': getattr(args, 'ecc', None),
+            'ecc_depth': getattr(args, 'ecc_depth', DEFAULT_ECC_DEPTH),
+            'compression': getattr(args, 'compression', DEFAULT_COMPRESSION),
+            'cipher': getattr(args, 'cipher', DEFAULT_CIPHER),
+            'max_decompressed_size': getattr(args, 'max_output', DEFAULT_MAX_DECOMPRESSED_SIZE >> 20) << 20,
+            'threads': getattr(args, 'threads', 1),
+            'threshold': getattr(args, 'threshold', DEFAULT_THRESHOLD),
+            'timings': getattr(args, 'timings', False),
+            'profile_dir': getattr(args, 'profile_dir', None),
+        }
+        if not job['output'] and args.output_dir:
+            if args.command == 'embed':
+                # Формат несжатого исходного изображения сохраняется (BMP и TIFF пишутся через mmap)
+                extension = os.path.splitext(job['cover'])[1].lower()
+                suffix = '.jpg' if job['jpeg'] else extension if extension in LOSSLESS_FORMATS else '.png'
+            else:
+                suffix = '.bin' if args.binary else '.txt'
+            job['output'] = _output_for(job['cover'], args.output_dir, suffix, root)
+        jobs.append(job)
+    _mark_duplicate_outputs(jobs)
+    return jobs
+
+
+def _embed_job(stego: Steganography, job: dict, result: dict) -> None:
+    if not job['output']:
+        raise ValueError("Не указан выходной файл")
+
+    if job.get('binary'):
+        if not job.get('payload'):
+            raise ValueError("Не указан файл нагрузки")
+        result['bytes'] = stego.embed_file(job['cover'], job['payload'], job['output'], job.get('password'))
+        return
+
+    if job.get('payload'):
+        with open(job['payload'], encoding='utf-8') as f:
+            text = f.read()
+    else:
+        text = job.get('message') or ''
+    stego.embed_message(job['cover'], text, job['output'], job.get('password'))
+
+
+def _extract_job(stego: Steganography, job: dict, result: dict) -> None:
+    if job.get('binary'):
+        if not job.get('output'):
+            raise ValueError("Не указан выходной файл")
+        result['bytes'] = stego.extract_file(job['cover'], job['output'], job.get('password'))
+        return
+
+    text = stego.extract_message(job['cover'], job.get('password'))
+    if job.get('output'):
+        with open(job['output'], 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        result['message'] = text
+
+
+def run_job(job: dict) -> dict:
+    """Выполнение одного задания; ошибки возвращаются в результате"""
+    result = {'action': job['action'], 'cover': job['cover'], 'output': job.get('output')}
+    started = time.perf_counter()
+    collector = None
+    if job.get('timings') or job.get('profile_dir'):
+        collector = StageCollector(profile=bool(job.get('profile_dir')))
+    try:
+        if job.get('error'):
+            raise ValueError(job['error'])
+        if job.get('output'):
+            # Подкаталоги результатов повторяют подкаталоги исходных изображений
+            os.makedirs(os.path.dirname(os.path.abspath(job['output'])), exist_ok=True)
+        stego = Steganography(bits_per_channel=job['bits'], kdf_iterations=job['kdf_iterations'],
+                              strip_height=job.get('strip_height'), scatter=job.get('scatter', False),
+                              channel_mask=job.get('channels'), save_profile=job.get('profile', 'default'),
+                              keep_metadata=job.get('keep_metadata', True), instrumentation=collector,
+                              ecc_symbols=job.get('ecc'), ecc_depth=job.get('ecc_depth', DEFAULT_ECC_DEPTH),
+                              compression=job.get('compression', DEFAULT_COMPRESSION),
+                              workers=job.get('threads', 1), cipher=job.get('cipher', DEFAULT_CIPHER),
+                              max_decompressed_size=job.get('max_decompressed_size', DEFAULT_MAX_DECOMPRESSED_SIZE))
+        if job['action'] == 'embed':
+            _embed_job(stego, job, result)
+        elif job['action'] == 'scan':
+            result.update(analyze_image(job['cover'], job.get('channels'),
+                                        job.get('threshold', DEFAULT_THRESHOLD)))
+        elif job['action'] == 'probe':
+            result.update(stego.probe(job['cover']))
+        elif job['action'] == 'capacity':
+            result.update(stego.get_image_info(job['cover']))
+            if job.get('jpeg'):
+                result['max_bytes'] = stego.calculate_jpeg_capacity(job['cover'])
+        else:
+            _extract_job(stego, job, result)
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    if collector is not None:
+        result['stages'] = collector.summary()
+        if job.get('profile_dir'):
+            name = os.path.splitext(os.path.basename(job['cover']))[0]
+            collector.dump_profile(os.path.join(job['profile_dir'], f"{name}.{job['action']}.prof"))
+    return result
+
+
+def run_batch(jobs: List[dict], workers: int, results_path: Optional[str] = None,
+              progress=None) -> List[dict]:
+    """Параллельное выполнение заданий в пуле процессов"""
+    results = []
+    results_file = open(results_path, 'w', encoding='utf-8') if results_path else None
+    try:
+        def record(result):
+            results.append(result)
+            if results_file:
+                results_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                results_file.flush()
+            if progress:
+                progress(len(results), len(jobs), result)
+
+        if workers == 1:
+            for job in jobs:
+                record(run_job(job))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(run_job, job) for job in jobs]
+                for future in as_completed(futures):
+                    record(future.result())
+    finally:
+        if results_file:
+            results_file.close()
+    return results
+
+
+def _print_progress(done: int, total: int, result: dict) -> None:
+    status = 'OK' if result['status'] == 'ok' else f"ОШИБКА: {result['error']}"
+    print(f"[{done}/{total}] {result['cover']}: {status}", file=sys.stderr)
+
+
+def _print_capacity(results: List[dict]) -> None:
+    """Таблица вместимости в стандартный вывод"""
+    for result in results:
+        if result['status'] == 'ok':
+            print(f"{result['cover']}\t{result['width']}x{result['height']}\t{result['mode']}\t"
+                  f"{result['max_bytes']}")
+        else:
+            print(f"{result['cover']}\tОШИБКА: {result['error']}")
+
+
+def _print_scan(results: List[dict]) -> None:
+    """Таблица стегоанализа: балл и оценки методов"""
+    for result in sorted(results, key=lambda r: r['cover']):
+        if result['status'] == 'ok':
+            verdict = 'ПОДОЗРИТЕЛЬНО' if result['suspicious'] else 'чисто'
+            print(f"{result['cover']}\t{result['score']:.3f}\t{verdict}\t"
+                  f"rs={result['rs']:.3f} spa={result['spa']:.3f} chi2={result['chi_square_length']:.3f}")
+        else:
+            print(f"{result['cover']}\tОШИБКА: {result['error']}")
+
+
+def _print_probe(results: List[dict]) -> None:
+    """Таблица заголовков: версия, битов на канал, длина нагрузки и флаги"""
+    for result in sorted(results, key=lambda r: r['cover']):
+        if result['status'] != 'ok':
+            print(f"{result['cover']}\tОШИБКА: {result['error']}")
+        elif not result['found']:
+            print(f"{result['cover']}\tнет данных")
+        else:
+            flags = ','.join(name for name in FLAG_NAMES.values() if result[name]) or '-'
+            print(f"{result['cover']}\tv{result['version']}\t{result['bits_per_channel']} бит\t"
+                  f"{result['length']}\t{flags}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='stegolab', description="StegoLab: пакетная обработка изображений")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_sources(sub):
+        source = sub.add_mutually_exclusive_group(required=True)
+        source.add_argument('--input', help="Каталог или glob-шаблон с изображениями")
+        source.add_argument('--manifest', help="CSV-манифест с колонками cover, payload, output")
+        sub.add_argument('--bits', type=int, default=1, choices=range(1, 5), help="Битов на канал")
+        sub.add_argument('--channels', help="Маска каналов, например RGBA или LA (по умолчанию без альфа-канала)")
+        sub.add_argument('--results', help="Файл результатов (JSON Lines)")
+
+    def add_ecc(sub):
+        sub.add_argument('--ecc', type=int, metavar='N',
+                         help="Код Рида-Соломона: N проверочных байт на 255 (четное, исправляет N/2 ошибок)")
+        sub.add_argument('--ecc-depth', type=int, default=DEFAULT_ECC_DEPTH,
+                         help="Глубина чередования кодовых слов для защиты от пакетов ошибок")
+
+    def add_common(sub):
+        add_sources(sub)
+        sub.add_argument('--output-dir', help="Каталог для результатов")
+        sub.add_argument('--password-env', help="Имя переменной окружения с паролем")
+        sub.add_argument('--kdf-iterations', type=int, default=DEFAULT_KDF_ITERATIONS,
+                         help="Число итераций PBKDF2 при шифровании")
+        sub.add_argument('--binary', action='store_true',
+                         help="Нагрузка - произвольный файл (потоковая обработка)")
+        sub.add_argument('--strip-height', type=int,
+                         help="Обработка полосами заданной высоты (для больших несжатых BMP и TIFF)")
+        sub.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Число процессов")
+        sub.add_argument('--threads', type=int, default=1,
+                         help="Потоков на одно изображение (полосы каналов; для очень больших изображений)")
+        sub.add_argument('--quiet', action='store_true', help="Не выводить прогресс")
+        sub.add_argument('--timings', action='store_true',
+                         help="Время этапов: в файле результатов и сводной таблицей в конце")
+        sub.add_argument('--profile-dir', help="Каталог для статистики cProfile каждого задания (.prof)")
+
+    embed = subparsers.add_parser('embed', help="Встраивание сообщений")
+    add_common(embed)
+    payload = embed.add_mutually_exclusive_group()
+    payload.add_argument('--message', help="Текст сообщения для всех изображений")
+    payload.add_argument('--payload', help="Файл с текстом сообщения для всех изображений")
+    embed.add_argument('--scatter', action='store_true',
+                       help="Разбросать нагрузку по изображению по ключу из пароля")
+    embed.add_argument('--profile', choices=sorted(SAVE_PROFILES), default='default',
+                       help="Профиль сохранения: fast - быстрее, small - меньше файл")
+    embed.add_argument('--strip-metadata', action='store_true',
+                       help="Не переносить ICC-профиль, EXIF и текстовые поля исходного изображения")
+    embed.add_argument('--jpeg', action='store_true',
+                       help="Результат в JPEG: встраивание в DCT-коэффициенты")
+    add_ecc(embed)
+    embed.add_argument('--compression', choices=COMPRESSION_CHOICES, default=DEFAULT_COMPRESSION,
+                       help="Сжатие перед шифрованием: auto - если уменьшает размер, none - без сжатия")
+    embed.add_argument('--cipher', choices=CIPHER_CHOICES, default=DEFAULT_CIPHER,
+                       help="Режим шифрования: gcm - с проверкой целостности, cbc - для старых версий программы")
+
+    extract = subparsers.add_parser('extract', help="Извлечение сообщений")
+    add_common(extract)
+    extract.add_argument('--max-output', type=int, default=DEFAULT_MAX_DECOMPRESSED_SIZE >> 20,
+                         help="Наибольший размер сжатой нагрузки после распаковки, МБ")
+
+    # Вместимость читается по заголовкам файлов, поэтому выполняется в одном процессе
+    capacity = subparsers.add_parser('capacity', help="Вместимость изображений без декодирования пикселей")
+    add_sources(capacity)
+    capacity.add_argument('--jpeg', action='store_true',
+                          help="Вместимость JPEG-результата (требует разбора сжатых данных)")
+    add_ecc(capacity)
+
+    scan = subparsers.add_parser('scan', help="Стегоанализ: поиск изображений с LSB-нагрузкой")
+    add_sources(scan)
+    scan.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                      help="Оценка доли измененных младших битов, начиная с которой изображение подозрительно")
+    scan.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Число процессов")
+    scan.add_argument('--quiet', action='store_true', help="Не выводить прогресс")
+
+    probe = subparsers.add_parser('probe', help="Проверка заголовка нагрузки по первым пикселям, без пароля")
+    add_sources(probe)
+    probe.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Число процессов")
+    probe.add_argument('--quiet', action='store_true', help="Не выводить прогресс")
+
+    return parser
+
+
+def run_cli(argv: List[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    password_env = getattr(args, 'password_env', None)
+    args.password = os.environ.get(password_env) if password_env else None
+    if getattr(args, 'scatter', False) and not args.password:
+        parser.error("--scatter требует пароля (--password-env)")
+
+    if args.command == 'capacity':
+        args.output_dir = None
+        results = run_batch(collect_jobs(args), 1, args.results)
+        _print_capacity(results)
+        return 1 if any(r['status'] != 'ok' for r in results) else 0
+
+    if args.command in ('scan', 'probe'):
+        args.output_dir = None
+        results = run_batch(collect_jobs(args), max(1, args.workers), args.results,
+                            None if args.quiet else _print_progress)
+        (_print_scan if args.command == 'scan' else _print_probe)(results)
+        return 1 if any(r['status'] != 'ok' for r in results) else 0
+
+    for directory in (args.output_dir, args.profile_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    jobs = collect_jobs(args)
+    results = run_batch(jobs, max(1, args.workers), args.results,
+                        None if args.quiet else _print_progress)
+
+    if args.timings:
+        print(format_summary(merge_summaries(r.get('stages', []) for r in results)), file=sys.stderr)
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    print(f"Готово: {len(results) - failed} успешно, {failed} с ошибками", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
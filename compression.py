@@ -0,0 +1,184 @@
+from typing import Iterable, Iterator, Optional, Tuple
+import itertools
+import zlib
+
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+try:
+    import lzma
+except ImportError:  # Python без liblzma
+    lzma = None
+
+try:
+    import bz2
+except ImportError:  # Python без libbz2
+    bz2 = None
+
+# Идентификатор алгоритма - первый байт сжатой нагрузки
+CODEC_IDS = {'zlib': 1, 'lzma': 2, 'bz2': 3}
+COMPRESSION_CHOICES = ('auto', 'none') + tuple(CODEC_IDS)
+DEFAULT_COMPRESSION = 'auto'
+
+# В автоматическом режиме данные до этого размера пробуются всеми алгоритмами.
+# Большие сжимаются только zlib (lzma и bz2 заметно медленнее) и только если
+# начало данных этого размера сжимается хотя бы на AUTO_MIN_SAVING
+AUTO_TRY_ALL_LIMIT = 1 << 16
+AUTO_MIN_SAVING = 0.05
+
+# Предел размера восстановленных данных по умолчанию: несколько десятков байт
+# сжатой нагрузки могут распаковываться в гигабайты
+DEFAULT_MAX_DECOMPRESSED_SIZE = 1 << 25
+# Наибольшая часть, выдаваемая распаковщиком за один вызов
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+
+# Исключения, которыми модули сжатия сообщают о поврежденных данных
+_DATA_ERRORS = (zlib.error, OSError, EOFError) + ((lzma.LZMAError,) if lzma is not None else ())
+
+
+def available_codecs() -> Tuple[str, ...]:
+    """Алгоритмы, доступные в этой сборке Python"""
+    modules = {'zlib': zlib, 'lzma': lzma, 'bz2': bz2}
+    return tuple(name for name in CODEC_IDS if modules[name] is not None)
+
+
+def _compressor(name: str):
+    if name == 'zlib':
+        return zlib.compressobj()
+    if name == 'lzma' and lzma is not None:
+        return lzma.LZMACompressor()
+    if name == 'bz2' and bz2 is not None:
+        return bz2.BZ2Compressor(9)
+    raise ValueError(f"Алгоритм сжатия недоступен: {name}")
+
+
+def _decompressor(codec_id: int):
+    if codec_id == CODEC_IDS['zlib']:
+        return zlib.decompressobj()
+    if codec_id == CODEC_IDS['lzma'] and lzma is not None:
+        return lzma.LZMADecompressor()
+    if codec_id == CODEC_IDS['bz2'] and bz2 is not None:
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Неизвестный или недоступный алгоритм сжатия: {codec_id}")
+
+
+def _candidates(method: str, size: int) -> Tuple[str, ...]:
+    if method not in COMPRESSION_CHOICES:
+        raise ValueError(f"Неизвестный алгоритм сжатия: {method}")
+    if method == 'none':
+        return ()
+    if method != 'auto':
+        return (method,)
+    return available_codecs() if size <= AUTO_TRY_ALL_LIMIT else ('zlib',)
+
+
+def _compress(name: str, data: bytes) -> bytes:
+    compressor = _compressor(name)
+    return bytes((CODEC_IDS[name],)) + compressor.compress(data) + compressor.flush()
+
+
+def _best(data: bytes, method: str, instrumentation: Instrumentation) -> Tuple[Optional[str], Optional[bytes]]:
+    """Алгоритм с наименьшим результатом, если он меньше исходных данных"""
+    best_name, best = None, None
+    with instrumentation.stage('compress', bytes=len(data)):
+        if method == 'auto' and len(data) > AUTO_TRY_ALL_LIMIT:
+            sample = data[:AUTO_TRY_ALL_LIMIT]
+            if len(_compress('zlib', sample)) > len(sample) * (1 - AUTO_MIN_SAVING):
+                return None, None
+        for name in _candidates(method, len(data)):
+            compressed = _compress(name, data)
+            if len(compressed) < len(data) and (best is None or len(compressed) < len(best)):
+                best_name, best = name, compressed
+    return best_name, best
+
+
+def compress_payload(data: bytes, method: str = DEFAULT_COMPRESSION,
+                     instrumentation: Optional[Instrumentation] = None) -> Optional[bytes]:
+    """Сжатие нагрузки целиком.
+
+    Возвращает байт алгоритма и сжатые данные или None, если ни один из
+    алгоритмов не уменьшает размер.
+    """
+    return _best(data, method, instrumentation or NULL_INSTRUMENTATION)[1]
+
+
+def compress_stream(chunks: Iterable[bytes], method: str = DEFAULT_COMPRESSION,
+                    instrumentation: Optional[Instrumentation] = None) -> Tuple[Iterator[bytes], bool]:
+    """Потоковое сжатие; решение принимается по началу потока.
+
+    В автоматическом режиме поток сжимается zlib. Возвращает поток и признак
+    сжатия: если начало не сжимается, поток возвращается без изменений.
+    """
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    chunks = iter(chunks)
+    first = next(chunks, b'')
+    name, _ = _best(first[:AUTO_TRY_ALL_LIMIT], 'zlib' if method == 'auto' else method, instrumentation)
+    if name is None:
+        return itertools.chain([first], chunks), False
+
+    def generate():
+        compressor = _compressor(name)
+        yield bytes((CODEC_IDS[name],))
+        for chunk in itertools.chain([first], chunks):
+            with instrumentation.stage('compress', bytes=len(chunk)):
+                data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    return generate(), True
+
+
+def _decompress_parts(decompressor, data: bytes, limit: int) -> Iterator[bytes]:
+    """Распаковка data частями не больше limit байт"""
+    part = decompressor.decompress(data, limit)
+    yield part
+    if hasattr(decompressor, 'unconsumed_tail'):
+        # zlib: не поместившиеся в limit входные данные остаются в unconsumed_tail
+        while decompressor.unconsumed_tail and not decompressor.eof:
+            yield decompressor.decompress(decompressor.unconsumed_tail, limit)
+    else:
+        # lzma и bz2: входные данные копятся внутри, needs_input - все выдано
+        while not decompressor.needs_input and not decompressor.eof:
+            yield decompressor.decompress(b'', limit)
+
+
+def decompress_stream(chunks: Iterable[bytes], instrumentation: Optional[Instrumentation] = None,
+                      max_size: Optional[int] = DEFAULT_MAX_DECOMPRESSED_SIZE) -> Iterator[bytes]:
+    """Потоковое восстановление данных compress_payload и compress_stream.
+
+    Восстановленных данных не может быть больше max_size байт (None - без
+    предела): распаковщик выдает их частями, и превышение обнаруживается
+    до того, как лишние данные окажутся в памяти.
+    """
+    instrumentation = instrumentation or NULL_INSTRUMENTATION
+    decompressor = None
+    total = 0
+    for chunk in chunks:
+        if decompressor is None:
+            if not chunk:
+                continue
+            decompressor = _decompressor(chunk[0])
+            chunk = chunk[1:]
+        parts = _decompress_parts(decompressor, chunk, DECOMPRESS_CHUNK_SIZE)
+        while True:
+            try:
+                with instrumentation.stage('decompress', bytes=len(chunk)):
+                    data = next(parts, None)
+            except _DATA_ERRORS as e:
+                raise ValueError(f"Поврежденные сжатые данные: {str(e)}")
+            if data is None:
+                break
+            total += len(data)
+            if max_size is not None and total > max_size:
+                raise ValueError(f"Восстановленные данные больше допустимых {max_size} байт")
+            if data:
+                yield data
+            chunk = b''
+    if decompressor is None or not decompressor.eof:
+        raise ValueError("Сжатые данные обрываются")
+
+
+def decompress_payload(data: bytes, instrumentation: Optional[Instrumentation] = None,
+                       max_size: Optional[int] = DEFAULT_MAX_DECOMPRESSED_SIZE) -> bytes:
+    """Восстановление данных compress_payload"""
+    return b''.join(decompress_stream([data], instrumentation, max_size))
@@ -0,0 +1,326 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+
+# Код Рида-Соломона над GF(256): порождающий многочлен поля x^8+x^4+x^3+x^2+1, α = 2
+_PRIMITIVE = 0x11D
+CODEWORD_SIZE = 255
+
+DEFAULT_ECC_SYMBOLS = 32
+DEFAULT_ECC_DEPTH = 64
+
+# Параметры кода повторяются трижды и восстанавливаются побитовым большинством
+_DESCRIPTOR_SIZE = 3
+ECC_DESCRIPTOR_SIZE = 3 * _DESCRIPTOR_SIZE
+
+# Маркер конца данных перед нулевым дополнением последнего блока
+_PAD_MARKER = 0x80
+
+# Логарифм нуля указывает на нулевой хвост таблицы степеней: сумма двух
+# логарифмов, где хотя бы один - ноль, попадает в хвост
+_LOG_ZERO = 511
+
+
+def _build_tables():
+    exp = np.zeros(1024, dtype=np.uint8)
+    log = np.full(256, _LOG_ZERO, dtype=np.uint16)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= _PRIMITIVE
+    exp[255:510] = exp[:255]
+    return exp, log
+
+
+_EXP, _LOG = _build_tables()
+_EXP_LIST = _EXP[:510].tolist()
+_LOG_LIST = _LOG.tolist()
+
+
+def _mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP_LIST[_LOG_LIST[a] + _LOG_LIST[b]]
+
+
+def _div(a: int, b: int) -> int:
+    if a == 0:
+        return 0
+    return _EXP_LIST[(_LOG_LIST[a] - _LOG_LIST[b]) % 255]
+
+
+def _poly_eval(poly: List[int], x: int) -> int:
+    """Значение многочлена (коэффициенты от младшей степени) в точке x"""
+    result = 0
+    for coefficient in reversed(poly):
+        result = _mul(result, x) ^ coefficient
+    return result
+
+
+def _generator(nsym: int) -> List[int]:
+    """g(x) = (x - α^0)...(x - α^(nsym-1)), коэффициенты от старшей степени"""
+    g = [1]
+    for j in range(nsym):
+        root = _EXP_LIST[j]
+        g = [a ^ _mul(b, root) for a, b in zip(g + [0], [0] + g)]
+    return g
+
+
+def _product_tables(matrix: np.ndarray) -> np.ndarray:
+    """Таблицы произведений для умножения на матрицу (m, r) над GF(256).
+
+    Таблица i, строка v - вектор v * matrix[i], дополненный нулями до
+    кратной 8 длины и представленный как uint64: умножение байта на всю
+    строку матрицы сводится к одной выборке строки и XOR по 8 байт.
+    """
+    m, r = matrix.shape
+    tables = np.zeros((m, 256, -(-r // 8) * 8), dtype=np.uint8)
+    values = np.arange(256)[None, :, None]
+    tables[:, :, :r] = _EXP[_LOG[values] + _LOG[matrix][:, None, :]]
+    return tables.view(np.uint64)
+
+
+def _gf_dot(left: np.ndarray, tables: np.ndarray, r: int) -> np.ndarray:
+    """Произведение (N, m) x (m, r) над GF(256) по таблицам _product_tables"""
+    columns = np.ascontiguousarray(left.T)
+    result = np.zeros((left.shape[0], tables.shape[2]), dtype=np.uint64)
+    for i in range(tables.shape[0]):
+        result ^= tables[i][columns[i]]
+    return result.view(np.uint8)[:, :r]
+
+
+class ReedSolomonCodec:
+    """Систематический код RS(255, 255 - nsym), исправляет до nsym // 2 байт в слове.
+
+    Кодирование и вычисление синдромов выполняются векторно для всех
+    кодовых слов; алгоритм Берлекэмпа-Месси и формула Форни применяются
+    только к словам с ненулевыми синдромами.
+    """
+
+    def __init__(self, nsym: int = DEFAULT_ECC_SYMBOLS):
+        if not 2 <= nsym < CODEWORD_SIZE or nsym % 2:
+            raise ValueError("Число проверочных символов должно быть четным, от 2 до 254")
+        self.nsym = nsym
+        self.data_size = CODEWORD_SIZE - nsym
+
+        g = _generator(nsym)
+        # Строка i - остаток x^(n-1-i) mod g(x): проверочные символы для байта i сообщения
+        parity = np.zeros((self.data_size, nsym), dtype=np.uint8)
+        remainder = g[1:]
+        for i in range(self.data_size - 1, -1, -1):
+            parity[i] = remainder
+            feedback = remainder[0]
+            remainder = remainder[1:] + [0]
+            if feedback:
+                remainder = [r ^ _mul(feedback, c) for r, c in zip(remainder, g[1:])]
+        self._parity_tables = _product_tables(parity)
+
+        # Синдром j слова - сумма c_i * α^(j * (n-1-i))
+        degrees = np.arange(CODEWORD_SIZE - 1, -1, -1)[:, None] * np.arange(nsym)[None, :]
+        self._syndrome_tables = _product_tables(_EXP[degrees % 255])
+        # Строка i - логарифмы (α^-d)^i для всех степеней d
+        self._chien_logs = ((np.arange(nsym + 1)[:, None] * (255 - np.arange(CODEWORD_SIZE))[None, :]) % 255
+                            ).astype(np.uint16)
+
+    def encode_blocks(self, blocks: np.ndarray) -> np.ndarray:
+        """Кодовые слова (N, 255) для блоков данных (N, 255 - nsym)"""
+        parity = _gf_dot(blocks, self._parity_tables, self.nsym)
+        return np.concatenate((blocks, parity), axis=1)
+
+    def syndromes(self, codewords: np.ndarray) -> np.ndarray:
+        return _gf_dot(codewords, self._syndrome_tables, self.nsym)
+
+    def decode_blocks(self, codewords: np.ndarray) -> Tuple[np.ndarray, int]:
+        """Исправление слов на месте; возвращает блоки данных и число исправленных байт"""
+        syndromes = self.syndromes(codewords)
+        corrected = 0
+        for row in np.flatnonzero(syndromes.any(axis=1)):
+            corrected += self._correct(codewords[row], syndromes[row].tolist())
+        return codewords[:, :self.data_size], corrected
+
+    def _correct(self, codeword: np.ndarray, syndromes: List[int]) -> int:
+        nsym = self.nsym
+        # Берлекэмп-Месси: многочлен локаторов ошибок Λ (от младшей степени)
+        locator, previous = [1], [1]
+        length, shift, last = 0, 1, 1
+        for n in range(nsym):
+            delta = syndromes[n]
+            for i in range(1, min(len(locator), n + 1)):
+                delta ^= _mul(locator[i], syndromes[n - i])
+            if delta == 0:
+                shift += 1
+                continue
+            scale = _div(delta, last)
+            update = [0] * shift + [_mul(scale, c) for c in previous]
+            candidate = [a ^ b for a, b in zip(locator + [0] * (len(update) - len(locator)),
+                                               update + [0] * (len(locator) - len(update)))]
+            if 2 * length <= n:
+                previous, length, last, shift = locator, n + 1 - length, delta, 1
+            else:
+                shift += 1
+            locator = candidate
+        locator = locator[:length + 1]
+        if 2 * length > nsym:
+            raise ValueError("Слишком много ошибок для восстановления")
+
+        # Поиск Ченя сразу во всех степенях: ошибка в степени d, если Λ(α^-d) = 0
+        values = np.zeros(CODEWORD_SIZE, dtype=np.uint8)
+        for i, coefficient in enumerate(locator):
+            values ^= _EXP[_LOG[coefficient] + self._chien_logs[i]]
+        positions = np.flatnonzero(values == 0).tolist()
+        if len(positions) != length:
+            raise ValueError("Слишком много ошибок для восстановления")
+
+        # Форни: e = X * Ω(X^-1) / Λ'(X^-1), Ω = S * Λ mod x^nsym
+        omega = [0] * nsym
+        for i, s in enumerate(syndromes):
+            for j, c in enumerate(locator[:nsym - i]):
+                omega[i + j] ^= _mul(s, c)
+        derivative = [locator[i] if i % 2 else 0 for i in range(1, len(locator))]
+        for degree in positions:
+            x = _EXP_LIST[degree]
+            x_inv = _EXP_LIST[(255 - degree) % 255]
+            denominator = _poly_eval(derivative, x_inv)
+            if denominator == 0:
+                raise ValueError("Слишком много ошибок для восстановления")
+            codeword[CODEWORD_SIZE - 1 - degree] ^= _mul(x, _div(_poly_eval(omega, x_inv), denominator))
+        return length
+
+
+def _pack_descriptor(nsym: int, depth: int) -> bytes:
+    return bytes((nsym, depth >> 8, depth & 0xFF)) * 3
+
+
+def _unpack_descriptor(data: bytes) -> Tuple[int, int]:
+    a, b, c = (np.frombuffer(data[i:i + _DESCRIPTOR_SIZE], dtype=np.uint8) for i in range(0, 9, 3))
+    nsym, high, low = ((a & b) | (a & c) | (b & c)).tolist()
+    return nsym, (high << 8) | low
+
+
+class EccEncoder:
+    """Потоковое кодирование: данные делятся на группы по depth кодовых слов.
+
+    Внутри группы байты слов чередуются (сначала первые байты всех слов,
+    затем вторые и т.д.), поэтому повреждение подряд идущих до
+    depth * nsym / 2 байт исправляется. Данные завершаются маркером 0x80
+    и дополняются нулями до целого числа блоков.
+    """
+
+    def __init__(self, nsym: int = DEFAULT_ECC_SYMBOLS, depth: int = DEFAULT_ECC_DEPTH,
+                 instrumentation: Optional[Instrumentation] = None):
+        if not 1 <= depth <= 0xFFFF:
+            raise ValueError("Глубина чередования должна быть от 1 до 65535")
+        self.codec = ReedSolomonCodec(nsym)
+        self.depth = depth
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+
+    def encoded_length(self, size: int) -> int:
+        """Размер закодированных данных для size исходных байт"""
+        blocks = size // self.codec.data_size + 1
+        return ECC_DESCRIPTOR_SIZE + blocks * CODEWORD_SIZE
+
+    def max_data_size(self, length: int) -> int:
+        """Наибольший размер исходных данных, закодированных не более чем в length байт"""
+        blocks = (length - ECC_DESCRIPTOR_SIZE) // CODEWORD_SIZE
+        return max(0, blocks * self.codec.data_size - 1)
+
+    def _encode_groups(self, data: bytes) -> bytes:
+        with self.instrumentation.stage('ecc', bytes=len(data)):
+            blocks = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.codec.data_size)
+            return _interleave(self.codec.encode_blocks(blocks), self.depth)
+
+    def encode(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        yield _pack_descriptor(self.codec.nsym, self.depth)
+        group = self.codec.data_size * self.depth
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            whole = len(buffer) - len(buffer) % group
+            if whole:
+                yield self._encode_groups(bytes(buffer[:whole]))
+                del buffer[:whole]
+        buffer.append(_PAD_MARKER)
+        buffer += bytes(-len(buffer) % self.codec.data_size)
+        yield self._encode_groups(bytes(buffer))
+
+
+def _interleave(codewords: np.ndarray, depth: int) -> bytes:
+    parts = []
+    for start in range(0, codewords.shape[0], depth):
+        parts.append(codewords[start:start + depth].T.tobytes())
+    return b''.join(parts)
+
+
+def _deinterleave(data: bytes, depth: int) -> np.ndarray:
+    group = CODEWORD_SIZE * depth
+    rows = []
+    for start in range(0, len(data), group):
+        part = np.frombuffer(data[start:start + group], dtype=np.uint8)
+        rows.append(part.reshape(CODEWORD_SIZE, -1).T)
+    return np.concatenate(rows).copy()
+
+
+class EccDecoder:
+    """Потоковое декодирование данных EccEncoder известной длины"""
+
+    def __init__(self, length: int, instrumentation: Optional[Instrumentation] = None):
+        if length < ECC_DESCRIPTOR_SIZE + CODEWORD_SIZE or (length - ECC_DESCRIPTOR_SIZE) % CODEWORD_SIZE:
+            raise ValueError("Неверная длина данных с кодом коррекции ошибок")
+        self.length = length
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        # Число исправленных байт во всех кодовых словах
+        self.corrected = 0
+
+    def decode(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        buffer = bytearray()
+        codec = depth = None
+        remaining = self.length
+        held = b''
+        for chunk in chunks:
+            buffer += chunk
+            remaining -= len(chunk)
+            if codec is None:
+                if len(buffer) < ECC_DESCRIPTOR_SIZE:
+                    continue
+                nsym, depth = _unpack_descriptor(bytes(buffer[:ECC_DESCRIPTOR_SIZE]))
+                if depth == 0 or nsym % 2 or not 2 <= nsym < CODEWORD_SIZE:
+                    raise ValueError("Поврежденные параметры кода коррекции ошибок")
+                codec = ReedSolomonCodec(nsym)
+                del buffer[:ECC_DESCRIPTOR_SIZE]
+            group = CODEWORD_SIZE * depth
+            # Последняя группа может быть неполной, поэтому разбирается после получения всех данных
+            whole = len(buffer) - len(buffer) % group
+            if remaining <= 0:
+                whole = len(buffer)
+            if whole:
+                data = self._decode_groups(codec, depth, bytes(buffer[:whole]))
+                del buffer[:whole]
+                # Последний блок удерживается до конца для снятия дополнения
+                if held:
+                    yield held
+                held = data
+        if codec is None or buffer:
+            raise ValueError("Данные с кодом коррекции ошибок обрываются")
+        end = held.rstrip(b'\x00')
+        if not end or end[-1] != _PAD_MARKER:
+            raise ValueError("Поврежденное дополнение данных с кодом коррекции ошибок")
+        yield end[:-1]
+
+    def _decode_groups(self, codec: ReedSolomonCodec, depth: int, data: bytes) -> bytes:
+        with self.instrumentation.stage('ecc', bytes=len(data)):
+            blocks, corrected = codec.decode_blocks(_deinterleave(data, depth))
+            self.corrected += corrected
+            return blocks.tobytes()
+
+
+def ecc_encode(data: bytes, nsym: int = DEFAULT_ECC_SYMBOLS, depth: int = DEFAULT_ECC_DEPTH) -> bytes:
+    """Кодирование данных целиком: параметры кода, затем чередованные кодовые слова"""
+    return b''.join(EccEncoder(nsym, depth).encode([data]))
+
+
+def ecc_decode(data: bytes) -> bytes:
+    """Исправление ошибок и восстановление данных ecc_encode"""
+    return b''.join(EccDecoder(len(data)).decode([data]))
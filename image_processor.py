@@ -1,39 +1,205 @@
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 from typing import List, Tuple
+import os
+import numpy as np
+from channel_layout import native_mode, mode_dtype, NATIVE_MODES
+from mapped_image import MappedImage
+
+# Профили сохранения: параметры кодировщика для каждого формата
+SAVE_PROFILES = {
+    'default': {'PNG': {'compress_level': 6}, 'TIFF': {}, 'JPEG': {'quality': 95}},
+    'fast': {'PNG': {'compress_level': 1}, 'TIFF': {}, 'JPEG': {'quality': 95}},
+    'small': {'PNG': {'optimize': True}, 'TIFF': {'compression': 'tiff_adobe_deflate'},
+              'JPEG': {'quality': 85, 'optimize': True}},
+}
+
+# Форматы без потерь, которые выбираются по расширению результата
+LOSSLESS_FORMATS = {'.png': 'PNG', '.bmp': 'BMP', '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+# Режимы, которые BMP сохраняет и читает без потерь (32-битный BMP Pillow читает как RGB, альфа теряется)
+_BMP_MODES = ('L', 'RGB')
+
+# Режимы, которые формат результата сохраняет со всеми каналами
+_FORMAT_MODES = {'PNG': NATIVE_MODES, 'TIFF': NATIVE_MODES, 'BMP': _BMP_MODES}
+
+# Декодеры PIL, которые выдают строки сверху вниз и могут остановиться после первых строк
+_HEAD_CODECS = ('zip', 'raw')
+
+
+def output_format(image_path: str) -> str:
+    """Формат результата по расширению; для остальных расширений (в т.ч. JPEG) - PNG"""
+    return LOSSLESS_FORMATS.get(os.path.splitext(image_path)[1].lower(), 'PNG')
+
+
+def check_output_mode(image_path: str, mode: str) -> None:
+    """Ошибка, если формат результата по расширению не сохраняет все каналы режима mode"""
+    file_format = output_format(image_path)
+    if mode not in _FORMAT_MODES[file_format]:
+        raise ValueError(f"Формат {file_format} не поддерживает режим {mode}, сохраните результат в PNG или TIFF")
+
+
+def _head_tiles(image: Image.Image, rows: int):
+    """Описание тайла, ограниченное первыми rows строками, или None, если начало нельзя декодировать отдельно"""
+    if len(image.tile) != 1 or image.info.get('interlace'):
+        return None
+    codec, extents, offset, args = image.tile[0][:4]
+    width, height = image.size
+    if codec not in _HEAD_CODECS or tuple(extents) != (0, 0, width, height):
+        return None
+    # Несжатые строки, записанные снизу вверх (BMP)
+    if codec == 'raw' and isinstance(args, tuple) and len(args) > 2 and args[2] < 0:
+        return None
+    return [(codec, (0, 0, width, rows), offset, args)]
+
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, save_profile: str = 'default', keep_metadata: bool = True):
+        if save_profile not in SAVE_PROFILES:
+            raise ValueError(f"Неизвестный профиль сохранения: {save_profile}")
         self.image = None
         self.mode = None
         self.size = None
+        self.metadata = {}
+        self.save_profile = save_profile
+        self.keep_metadata = keep_metadata
     
     def load_image(self, image_path: str) -> bool:
         try:
             self.image = Image.open(image_path)
             self.mode = self.image.mode
             self.size = self.image.size
+            self.metadata = self.read_metadata(self.image)
             return True
         except Exception as e:
             raise Exception(f"Ошибка загрузки изображения: {str(e)}")
     
+    @staticmethod
+    def read_metadata(image: Image.Image) -> dict:
+        """ICC-профиль, EXIF, разрешение и текстовые поля PNG исходного изображения"""
+        info = image.info
+        metadata = {key: info[key] for key in ('icc_profile', 'exif', 'dpi') if info.get(key)}
+        text = {key: value for key, value in getattr(image, 'text', {}).items() if isinstance(value, str)}
+        if text:
+            metadata['text'] = text
+        return metadata
+    
+    def save_options(self, file_format: str) -> dict:
+        """Параметры сохранения по профилю и метаданным загруженного изображения"""
+        options = dict(SAVE_PROFILES[self.save_profile].get(file_format, {}))
+        if not self.keep_metadata:
+            return options
+        
+        metadata = self.metadata
+        if 'dpi' in metadata:
+            options['dpi'] = metadata['dpi']
+        if file_format in ('PNG', 'TIFF', 'JPEG'):
+            for key in ('icc_profile', 'exif'):
+                if key in metadata:
+                    options[key] = metadata[key]
+        if file_format == 'PNG' and 'text' in metadata:
+            pnginfo = PngInfo()
+            for key, value in metadata['text'].items():
+                pnginfo.add_itxt(key, value)
+            options['pnginfo'] = pnginfo
+        return options
+    
+    def _save(self, image: Image.Image, image_path: str) -> None:
+        check_output_mode(image_path, image.mode)
+        file_format = output_format(image_path)
+        image.save(image_path, format=file_format, **self.save_options(file_format))
+    
+    @staticmethod
+    def read_info(image_path: str) -> Tuple[Tuple[int, int], str]:
+        """Размер и режим обработки изображения по заголовку файла, без декодирования пикселей"""
+        try:
+            with Image.open(image_path) as image:
+                return image.size, native_mode(image.mode, 'transparency' in image.info)
+        except Exception as e:
+            raise Exception(f"Ошибка загрузки изображения: {str(e)}")
+    
+    @staticmethod
+    def read_head(image_path: str, pixel_count: int) -> Tuple[np.ndarray, str]:
+        """Первые строки изображения, содержащие pixel_count пикселей, и режим обработки.
+        
+        Несжатые BMP и TIFF читаются через mmap, PNG без чересстрочности
+        декодируется только до нужной строки; остальные изображения
+        декодируются целиком.
+        """
+        try:
+            if MappedImage.layout_of(image_path) is not None:
+                with MappedImage(image_path) as mapped:
+                    width, height = mapped.size
+                    return mapped.read_rows(0, min(height, -(-pixel_count // width))), 'RGB'
+            
+            with Image.open(image_path) as image:
+                width, height = image.size
+                rows = min(height, max(1, -(-pixel_count // width)))
+                mode = native_mode(image.mode, 'transparency' in image.info)
+                image.tile = _head_tiles(image, rows) or image.tile
+                head = image.crop((0, 0, width, rows))
+            if head.mode != mode:
+                head = head.convert(mode)
+            return np.frombuffer(head.tobytes(), dtype=mode_dtype(mode)).reshape(rows, width, -1), mode
+        except Exception as e:
+            raise Exception(f"Ошибка загрузки изображения: {str(e)}")
+    
     def convert_to_rgb(self) -> None:
         if self.image.mode != 'RGB':
             self.image = self.image.convert('RGB')
             self.mode = 'RGB'
     
+    def convert_to_native(self) -> None:
+        """Преобразование только режимов, в которые нельзя встраивать напрямую (P, CMYK и т.п.)"""
+        mode = native_mode(self.image.mode, 'transparency' in self.image.info)
+        if self.image.mode != mode:
+            self.image = self.image.convert(mode)
+            self.mode = mode
+    
     def get_pixels(self) -> List[List[Tuple[int, int, int]]]:
+        """Матрица пикселей в виде списков кортежей (для обратной совместимости)"""
+        channels = self.get_channels(writable=False)
+        return [list(map(tuple, row)) for row in channels.tolist()]
+    
+    def get_channels(self, writable: bool = True) -> np.ndarray:
+        """Пиксели в виде массива (высота, ширина, каналы) поверх буфера изображения.
+        
+        Без writable массив является представлением только для чтения над
+        Image.tobytes() и не копирует данные повторно.
+        """
         if self.image is None:
             raise Exception("Изображение не загружено")
         
-        pixels = list(self.image.getdata())
+        buffer = self.image.tobytes()
+        if writable:
+            buffer = bytearray(buffer)
+        
         width, height = self.image.size
-        return [pixels[i * width:(i + 1) * width] for i in range(height)]
+        return np.frombuffer(buffer, dtype=mode_dtype(self.image.mode)).reshape(height, width, -1)
     
     def save_image(self, image_path: str, pixels: List, size: Tuple[int, int]) -> None:
+        if isinstance(pixels, np.ndarray):
+            self.save_channels(image_path, pixels, size)
+            return
+        
         try:
             flat_pixels = [pixel for row in pixels for pixel in row]
             new_image = Image.new('RGB', size)
             new_image.putdata(flat_pixels)
-            new_image.save(image_path, format='PNG')
+            self._save(new_image, image_path)
+        except Exception as e:
+            raise Exception(f"Ошибка сохранения изображения: {str(e)}")
+    
+    def save_channels(self, image_path: str, channels: np.ndarray, size: Tuple[int, int],
+                      mode: str = 'RGB') -> None:
+        """Сохранение массива каналов в режиме mode без промежуточных кортежей.
+        
+        Формат выбирается по расширению (PNG, BMP, TIFF; иначе PNG), параметры -
+        по профилю сохранения.
+        """
+        try:
+            buffer = np.ascontiguousarray(channels, dtype=mode_dtype(mode))
+            new_image = Image.frombuffer(mode, size, buffer, 'raw', mode, 0, 1)
+            self._save(new_image, image_path)
         except Exception as e:
-            raise Exception(f"Ошибка сохранения изображения: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Ошибка сохранения изображения: {str(e)}")
@@ -0,0 +1,167 @@
+from typing import Callable, Dict, Iterable, List, Optional
+import cProfile
+import io
+import pstats
+import threading
+import time
+
+# Счетчики, которые суммируются в сводке этапов
+COUNTERS = ('bytes', 'pixels')
+
+
+class _NullStage:
+    """Этап без замера: вход и выход ничего не делают"""
+
+    def add(self, **counts) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Instrumentation:
+    """Приемник событий этапов обработки.
+
+    Базовый класс отключен: stage() возвращает общий пустой контекстный
+    менеджер, поэтому замеры ничего не стоят, пока не подключен сборщик.
+    Этапы могут быть вложенными (декодирование полосы внутри извлечения),
+    тогда время вложенного этапа входит и во внешний.
+
+        with instrumentation.stage('decode', pixels=w * h) as stage:
+            ...
+            stage.add(bytes=len(data))
+    """
+
+    enabled = False
+
+    def stage(self, name: str, **counts):
+        return _NULL_STAGE
+
+
+NULL_INSTRUMENTATION = Instrumentation()
+
+
+class _Stage:
+    def __init__(self, collector: 'StageCollector', name: str, counts: dict):
+        self.collector = collector
+        self.name = name
+        self.counts = counts
+        self._started = 0.0
+
+    def add(self, **counts) -> None:
+        """Счетчики, известные только после начала этапа"""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def __enter__(self):
+        self.collector._start(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.collector._stop(self, time.perf_counter() - self._started, exc)
+        return False
+
+
+class StageCollector(Instrumentation):
+    """Сборщик времени и счетчиков по этапам.
+
+    callback(событие, этап, данные) вызывается с событием 'start' и 'stop'
+    (данные - счетчики, при 'stop' также 'seconds' и 'error'). С profile=True
+    на время внешних этапов включается cProfile.
+    """
+
+    enabled = True
+
+    def __init__(self, callback: Optional[Callable[[str, str, dict], None]] = None, profile: bool = False):
+        self.callback = callback
+        self.profiler = cProfile.Profile() if profile else None
+        self._lock = threading.Lock()
+        self._depth = 0
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            # этап -> {'calls', 'seconds', 'errors', счетчики}
+            self.totals: Dict[str, dict] = {}
+
+    def stage(self, name: str, **counts) -> _Stage:
+        return _Stage(self, name, counts)
+
+    def _start(self, stage: _Stage) -> None:
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1 and self.profiler is not None:
+                self.profiler.enable()
+        if self.callback:
+            self.callback('start', stage.name, dict(stage.counts))
+
+    def _stop(self, stage: _Stage, seconds: float, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self._depth -= 1
+            if self._depth == 0 and self.profiler is not None:
+                self.profiler.disable()
+            total = self.totals.setdefault(stage.name, {'calls': 0, 'seconds': 0.0, 'errors': 0})
+            total['calls'] += 1
+            total['seconds'] += seconds
+            total['errors'] += error is not None
+            for key in COUNTERS:
+                if key in stage.counts:
+                    total[key] = total.get(key, 0) + stage.counts[key]
+        if self.callback:
+            info = dict(stage.counts, seconds=seconds, error=None if error is None else str(error))
+            self.callback('stop', stage.name, info)
+
+    def summary(self) -> List[dict]:
+        """Сводка по этапам в порядке первого появления"""
+        with self._lock:
+            return [dict(total, stage=name, seconds=round(total['seconds'], 6))
+                    for name, total in self.totals.items()]
+
+    def format_summary(self) -> str:
+        return format_summary(self.summary())
+
+    def dump_profile(self, path: str) -> None:
+        """Статистика cProfile в формате pstats (для snakeviz, pstats и т.п.)"""
+        if self.profiler is None:
+            raise ValueError("Профилирование не включено")
+        self.profiler.dump_stats(path)
+
+    def profile_text(self, limit: int = 25) -> str:
+        """Самые затратные функции по накопленному времени"""
+        if self.profiler is None:
+            raise ValueError("Профилирование не включено")
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+def merge_summaries(summaries: Iterable[List[dict]]) -> List[dict]:
+    """Суммирование сводок нескольких операций (например, заданий пакета)"""
+    merged: Dict[str, dict] = {}
+    for summary in summaries:
+        for row in summary:
+            total = merged.setdefault(row['stage'], {'stage': row['stage'], 'calls': 0, 'seconds': 0.0, 'errors': 0})
+            for key in ('calls', 'seconds', 'errors') + COUNTERS:
+                if key in row:
+                    total[key] = total.get(key, 0) + row[key]
+    return list(merged.values())
+
+
+def format_summary(summary: List[dict]) -> str:
+    """Таблица этапов: вызовы, время, доля, байты, пиксели и скорость"""
+    total_seconds = sum(row['seconds'] for row in summary) or 1.0
+    lines = [f"{'Этап':<14}{'Вызовы':>8}{'Время, с':>11}{'Доля':>7}{'Байт':>13}{'Пикселей':>13}{'МБ/с':>9}"]
+    for row in summary:
+        seconds = row['seconds']
+        size = row.get('bytes')
+        speed = f"{size / 1e6 / seconds:.1f}" if size and seconds > 0 else '-'
+        lines.append(f"{row['stage']:<14}{row['calls']:>8}{seconds:>11.4f}{seconds / total_seconds:>7.0%}"
+                     f"{size if size is not None else '-':>13}{row.get('pixels', '-'):>13}{speed:>9}")
+    return '\n'.join(lines)
@@ -1,9 +1,21 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from concurrent.futures import ThreadPoolExecutor
 from steganography import Steganography
+from instrumentation import StageCollector
 import os
+import queue
+import threading
+
+
+class OperationCancelled(Exception):
+    """Операция прервана пользователем"""
+
 
 class ModernSteganographyGUI:
+    # Период опроса очереди результатов фоновых операций, мс
+    POLL_INTERVAL = 50
+    
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("StegoLab • Стеганография с шифрованием")
@@ -13,9 +25,20 @@ class ModernSteganographyGUI:
         self.dark_theme = True
         self.setup_themes()
         
-        self.steganography = Steganography()
+        # Долгие операции выполняются в фоновом потоке, результаты приходят через очередь
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.busy = False
+        
+        self.steganography = Steganography(progress=self.report_progress)
+        # Сборщик времени этапов подключается только при включенном флажке
+        self.stage_collector = StageCollector()
         self.current_password = None
         self.setup_ui()
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(self.POLL_INTERVAL, self.poll_queue)
     
     def setup_themes(self):
         # Темная тема
@@ -113,10 +136,10 @@ class ModernSteganographyGUI:
                              insertbackground=self.get_color('text_primary'), width=40)
         path_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
         
-        browse_btn = tk.Button(path_frame, text="ОБЗОР", command=self.browse_image,
-                              bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 10, 'bold'),
-                              border=0, relief='flat', cursor='hand2', padx=15, pady=8)
-        browse_btn.pack(side='right')
+        self.browse_btn = tk.Button(path_frame, text="ОБЗОР", command=self.browse_image,
+                                   bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 10, 'bold'),
+                                   border=0, relief='flat', cursor='hand2', padx=15, pady=8)
+        self.browse_btn.pack(side='right')
         
         # Форматы файлов
         format_label = tk.Label(content_frame, text="Поддерживаемые форматы: PNG, BMP, JPG", 
@@ -192,21 +215,43 @@ class ModernSteganographyGUI:
         btn_frame = tk.Frame(content_frame, bg=self.get_color('card_bg'))
         btn_frame.pack(fill='x', pady=10)
         
-        embed_btn = tk.Button(btn_frame, text=" ВСТРОИТЬ СООБЩЕНИЕ", command=self.embed_message,
-                             bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 11, 'bold'),
-                             border=0, relief='flat', cursor='hand2', padx=20, pady=12)
-        embed_btn.pack(side='left', fill='x', expand=True, padx=(0, 10))
-        
-        extract_btn = tk.Button(btn_frame, text=" ИЗВЛЕЧЬ СООБЩЕНИЕ", command=self.extract_message,
-                               bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 11, 'bold'),
-                               border=0, relief='flat', cursor='hand2', padx=20, pady=12)
-        extract_btn.pack(side='left', fill='x', expand=True, padx=10)
-        
-        clear_btn = tk.Button(btn_frame, text="ОЧИСТИТЬ ВСЕ", command=self.clear_all,
-                             bg=self.get_color('card_bg'), fg=self.get_color('text_primary'),
-                             font=('SF Pro Display', 11), border=0, relief='flat',
-                             cursor='hand2', padx=20, pady=12)
-        clear_btn.pack(side='left', fill='x', expand=True, padx=(10, 0))
+        self.embed_btn = tk.Button(btn_frame, text=" ВСТРОИТЬ СООБЩЕНИЕ", command=self.embed_message,
+                                  bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 11, 'bold'),
+                                  border=0, relief='flat', cursor='hand2', padx=20, pady=12)
+        self.embed_btn.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        
+        self.extract_btn = tk.Button(btn_frame, text=" ИЗВЛЕЧЬ СООБЩЕНИЕ", command=self.extract_message,
+                                    bg=self.get_color('accent'), fg='white', font=('SF Pro Display', 11, 'bold'),
+                                    border=0, relief='flat', cursor='hand2', padx=20, pady=12)
+        self.extract_btn.pack(side='left', fill='x', expand=True, padx=10)
+        
+        self.clear_btn = tk.Button(btn_frame, text="ОЧИСТИТЬ ВСЕ", command=self.clear_all,
+                                  bg=self.get_color('card_bg'), fg=self.get_color('text_primary'),
+                                  font=('SF Pro Display', 11), border=0, relief='flat',
+                                  cursor='hand2', padx=20, pady=12)
+        self.clear_btn.pack(side='left', fill='x', expand=True, padx=(10, 0))
+        
+        # Прогресс фоновой операции
+        progress_frame = tk.Frame(content_frame, bg=self.get_color('card_bg'))
+        progress_frame.pack(fill='x', pady=(10, 0))
+        
+        style = ttk.Style(self.root)
+        style.configure('Stego.Horizontal.TProgressbar', troughcolor=self.get_color('card_bg'),
+                        background=self.get_color('accent'), bordercolor=self.get_color('border'))
+        self.progress_bar = ttk.Progressbar(progress_frame, style='Stego.Horizontal.TProgressbar',
+                                            mode='determinate')
+        self.progress_bar.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        
+        self.cancel_btn = tk.Button(progress_frame, text="ОТМЕНА", command=self.cancel_task,
+                                   bg=self.get_color('card_bg'), fg=self.get_color('text_primary'),
+                                   font=('SF Pro Display', 10), border=0, relief='flat',
+                                   cursor='hand2', padx=15, pady=6, state='disabled')
+        self.cancel_btn.pack(side='right')
+        
+        self.timings_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(content_frame, text="Показывать время этапов", variable=self.timings_var,
+                       bg=self.get_color('card_bg'), fg=self.get_color('text_primary'),
+                       font=('SF Pro Text', 9)).pack(anchor='w', pady=(10, 0))
     
     def setup_info_section(self, parent):
         info_card = tk.Frame(parent, bg=self.get_color('card_bg'), relief='flat',
@@ -287,7 +332,7 @@ class ModernSteganographyGUI:
         filename = filedialog.askopenfilename(
             title="Выберите изображение",
             filetypes=[
-                ("Все поддерживаемые форматы", "*.png *.bmp *.jpg *.jpeg *.tiff"),
+                ("Все поддерживаемые форматы", "*.png *.bmp *.jpg *.jpeg *.tif *.tiff"),
                 ("PNG файлы", "*.png"),
                 ("BMP файлы", "*.bmp"),
                 ("JPEG файлы", "*.jpg *.jpeg"),
@@ -299,30 +344,26 @@ class ModernSteganographyGUI:
             self.check_capacity()
     
     def check_capacity(self):
-        try:
-            image_path = self.image_path.get()
-            if not image_path:
-                self.capacity_label.config(text="Загрузите изображение для анализа")
-                return
-            
-            info = self.steganography.get_image_info(image_path)
-            width = info['width']
-            height = info['height']
-            max_chars = info['max_chars']
-            max_bytes = info['max_bytes']
-            bits = info['bits_per_channel']
-            file_format = info['format']
-            
-            info_text = (f"▫️ Размер: {width} × {height} px\n"
-                        f"▫️ Битов на канал: {bits}\n"
-                        f"▫️ Макс. вместимость: {max_chars} симв.\n"
-                        f"▫️ Макс. байт: {max_bytes}\n"
-                        f"▫️ Формат: {file_format}")
-            
-            self.capacity_label.config(text=info_text)
-            
-        except Exception as e:
-            self.capacity_label.config(text=f"Ошибка: {str(e)}")
+        image_path = self.image_path.get()
+        if not image_path:
+            self.capacity_label.config(text="Загрузите изображение для анализа")
+            return
+        
+        if self.run_task(" Анализ изображения...",
+                         lambda: self.steganography.get_image_info(image_path),
+                         self.show_capacity,
+                         lambda e: self.capacity_label.config(text=f"Ошибка: {str(e)}")):
+            self.capacity_label.config(text="Анализ изображения...")
+    
+    def show_capacity(self, info: dict):
+        info_text = (f"▫️ Размер: {info['width']} × {info['height']} px\n"
+                    f"▫️ Битов на канал: {info['bits_per_channel']}\n"
+                    f"▫️ Макс. вместимость: {info['max_chars']} симв.\n"
+                    f"▫️ Макс. байт: {info['max_bytes']}\n"
+                    f"▫️ Формат: {info['format']}")
+        
+        self.capacity_label.config(text=info_text)
+        self.show_result("")
     
     def update_char_count(self, event=None):
         text = self.text_input.get("1.0", tk.END).strip()
@@ -330,77 +371,69 @@ class ModernSteganographyGUI:
         self.char_count_label.config(text=f"{char_count} символов")
     
     def embed_message(self):
-        try:
-            image_path = self.image_path.get()
-            text = self.text_input.get("1.0", tk.END).strip()
-            password = self.password_var.get()
+        image_path = self.image_path.get()
+        text = self.text_input.get("1.0", tk.END).strip()
+        password = self.password_var.get()
+        
+        if not image_path:
+            messagebox.showerror("Ошибка", "Выберите изображение")
+            return
             
-            if not image_path:
-                messagebox.showerror("Ошибка", "Выберите изображение")
-                return
-                
-            if not text:
-                messagebox.showerror("Ошибка", "Введите сообщение для встраивания")
+        if not text:
+            messagebox.showerror("Ошибка", "Введите сообщение для встраивания")
+            return
+        
+        if self.steganography.lsb_algorithm.scatter and not password:
+            messagebox.showerror("Ошибка", "Разброс нагрузки требует пароля")
+            return
+        
+        # Запрашиваем подтверждение пароля
+        if password:
+            confirm_password = simpledialog.askstring("Подтверждение пароля", 
+                                                     "Повторите пароль:", show='*')
+            if confirm_password != password:
+                messagebox.showerror("Ошибка", "Пароли не совпадают")
                 return
-            
-            # Запрашиваем подтверждение пароля
-            if password:
-                confirm_password = simpledialog.askstring("Подтверждение пароля", 
-                                                         "Повторите пароль:", show='*')
-                if confirm_password != password:
-                    messagebox.showerror("Ошибка", "Пароли не совпадают")
-                    return
-            
-            output_path = filedialog.asksaveasfilename(
-                title="Сохранить стего-изображение",
-                defaultextension=".png",
-                filetypes=[
-                    ("PNG файлы", "*.png"),
-                    ("BMP файлы", "*.bmp"),
-                    ("Все файлы", "*.*")
-                ]
-            )
-            
-            if output_path:
-                self.show_result(" Встраивание сообщения с шифрованием...")
-                self.root.update()
-                
-                success = self.steganography.embed_message(image_path, text, output_path, password)
-                if success:
-                    info_text = (f" Сообщение успешно встроено!\n\n"
-                               f" Файл: {output_path}\n"
-                               f" Размер: {self.steganography.image_processor.size}\n"
-                               f" Шифрование: {'AES-256' if password else 'нет'}\n"
-                               f" Использовано: {len(text)} символов\n"
-                               f" Проверка целостности: включена")
-                    
-                    self.show_result(info_text)
-                    messagebox.showinfo("Успех", " Сообщение успешно встроено и защищено!")
+        
+        output_path = filedialog.asksaveasfilename(
+            title="Сохранить стего-изображение",
+            defaultextension=".png",
+            filetypes=[
+                ("PNG файлы", "*.png"),
+                ("BMP файлы", "*.bmp"),
+                ("JPEG файлы (DCT-коэффициенты)", "*.jpg *.jpeg"),
+                ("Все файлы", "*.*")
+            ]
+        )
+        
+        if not output_path:
+            return
+        
+        def on_embedded(success):
+            if success:
+                info_text = (f" Сообщение успешно встроено!\n\n"
+                           f" Файл: {output_path}\n"
+                           f" Размер: {self.steganography.image_processor.size}\n"
+                           f" Шифрование: {'AES-256' if password else 'нет'}\n"
+                           f" Использовано: {len(text)} символов\n"
+                           f" Проверка целостности: включена")
                 
-        except Exception as e:
-            error_msg = f" Ошибка при встраивании:\n{str(e)}"
-            self.show_result(error_msg)
-            messagebox.showerror("Ошибка", error_msg)
+                self.show_result(info_text)
+                messagebox.showinfo("Успех", " Сообщение успешно встроено и защищено!")
+        
+        self.run_task(" Встраивание сообщения с шифрованием...",
+                      lambda: self.steganography.embed_message(image_path, text, output_path, password),
+                      on_embedded,
+                      lambda e: self.show_error(" Ошибка при встраивании", e))
     
     def extract_message(self):
-        try:
-            image_path = self.image_path.get()
-            
-            if not image_path:
-                messagebox.showerror("Ошибка", "Выберите стего-изображение")
-                return
-            
-            # Запрашиваем пароль если нужно
-            password = None
-            if messagebox.askyesno("Пароль", "Сообщение было защищено паролем?"):
-                password = simpledialog.askstring("Ввод пароля", 
-                                                 "Введите пароль для расшифровки:", show='*')
-            
-            self.show_result(" Извлечение и проверка сообщения...")
-            self.root.update()
-            
-            text = self.steganography.extract_message(image_path, password)
-            
+        image_path = self.image_path.get()
+        
+        if not image_path:
+            messagebox.showerror("Ошибка", "Выберите стего-изображение")
+            return
+        
+        def on_extracted(text, password):
             if text:
                 info_text = (f" Сообщение успешно извлечено!\n\n"
                            f" Проверка целостности:  пройдена\n"
@@ -413,11 +446,119 @@ class ModernSteganographyGUI:
             else:
                 self.show_result(" Сообщение не найдено или пароль неверен")
                 messagebox.showwarning("Результат", "Сообщение не найдено. Возможно, неверный пароль или изображение повреждено.")
+        
+        def on_header(encrypted):
+            # Запрашиваем пароль если нужно (флаг шифрования читается из заголовка)
+            password = None
+            if encrypted is None:
+                encrypted = messagebox.askyesno("Пароль", "Сообщение было защищено паролем?")
+            if encrypted:
+                password = simpledialog.askstring("Ввод пароля", 
+                                                 "Введите пароль для расшифровки:", show='*')
             
-        except Exception as e:
-            error_msg = f" Ошибка при извлечении:\n{str(e)}"
-            self.show_result(error_msg)
-            messagebox.showerror("Ошибка", error_msg)
+            self.run_task(" Извлечение и проверка сообщения...",
+                          lambda: self.steganography.extract_message(image_path, password),
+                          lambda text: on_extracted(text, password),
+                          lambda e: self.show_error(" Ошибка при извлечении", e))
+        
+        self.run_task(" Чтение заголовка...",
+                      lambda: self.steganography.is_encrypted(image_path),
+                      on_header,
+                      lambda e: self.show_error(" Ошибка при извлечении", e))
+    
+    def run_task(self, status: str, func, on_success, on_error) -> bool:
+        """Запуск операции в фоновом потоке; обработчики вызываются в главном потоке"""
+        if self.busy:
+            return False
+        
+        self.set_busy(True)
+        self.show_result(status)
+        
+        if self.timings_var.get():
+            self.stage_collector.reset()
+            self.steganography.set_instrumentation(self.stage_collector)
+        else:
+            self.steganography.set_instrumentation(None)
+        
+        def work():
+            try:
+                self.task_queue.put(('done', on_success, func()))
+            except Exception as e:
+                self.task_queue.put(('error', on_error, e))
+        
+        self.executor.submit(work)
+        return True
+    
+    def report_progress(self, done: int, total: int):
+        """Вызывается движком из фонового потока"""
+        if self.cancel_event.is_set():
+            raise OperationCancelled("Операция отменена")
+        self.task_queue.put(('progress', done, total))
+    
+    def poll_queue(self):
+        """Разбор очереди фоновых операций в главном потоке"""
+        try:
+            while True:
+                item = self.task_queue.get_nowait()
+                try:
+                    self.handle_queue_item(item)
+                except Exception as e:
+                    # Ошибка обработчика не должна останавливать разбор очереди
+                    self.show_result(f" Ошибка обработки результата: {str(e)}")
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.POLL_INTERVAL, self.poll_queue)
+    
+    def handle_queue_item(self, item):
+        if item[0] == 'progress':
+            self.update_progress(item[1], item[2])
+            return
+        
+        kind, handler, value = item
+        cancelled = self.cancel_event.is_set()
+        self.set_busy(False)
+        if kind == 'error' and cancelled:
+            self.show_result(" Операция отменена")
+        else:
+            handler(value)
+            if self.steganography.instrumentation.enabled:
+                self.result_text.insert(tk.END, f"\n\n Время этапов:\n{self.stage_collector.format_summary()}")
+    
+    def update_progress(self, done: int, total: int):
+        if total <= 0:
+            return
+        if str(self.progress_bar.cget('mode')) != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate')
+        self.progress_bar.config(maximum=total, value=done)
+    
+    def set_busy(self, busy: bool):
+        """Блокировка кнопок и индикатор на время фоновой операции"""
+        self.busy = busy
+        state = 'disabled' if busy else 'normal'
+        for button in (self.embed_btn, self.extract_btn, self.clear_btn, self.browse_btn):
+            button.config(state=state)
+        self.cancel_btn.config(state='normal' if busy else 'disabled')
+        
+        if busy:
+            self.cancel_event.clear()
+            # Пока движок не сообщил объем работы, показываем неопределенный прогресс
+            self.progress_bar.config(mode='indeterminate', value=0)
+            self.progress_bar.start(15)
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate', value=0)
+    
+    def cancel_task(self):
+        if self.busy:
+            self.cancel_event.set()
+            self.show_result(" Отмена операции...")
+    
+    def show_error(self, title: str, error: Exception):
+        error_msg = f"{title}:\n{str(error)}"
+        self.show_result(error_msg)
+        messagebox.showerror("Ошибка", error_msg)
     
     def show_result(self, message: str):
         self.result_text.delete("1.0", tk.END)
@@ -436,6 +577,11 @@ class ModernSteganographyGUI:
         self.capacity_label.config(text="Загрузите изображение для анализа")
         self.char_count_label.config(text="0 символов")
     
+    def on_close(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+    
     def run(self):
         self.root.mainloop()
 
@@ -0,0 +1,339 @@
+from typing import List, Optional
+import io
+import struct
+import numpy as np
+from PIL import Image
+
+# Маркеры кадров, которые можно разобрать: baseline и extended с кодами Хаффмана
+_SOF_SUPPORTED = (0xC0, 0xC1)
+_SOF_UNSUPPORTED = (0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+# Размер участка буфера, для которого строятся окна чтения битов
+_WINDOW_CHUNK = 1 << 16
+
+# Качество при перекодировании не-JPEG изображений в JPEG
+DEFAULT_JPEG_QUALITY = 95
+
+# Сегменты с метаданными: EXIF/XMP (APP1), ICC (APP2), IPTC (APP13), комментарий
+_METADATA_MARKERS = (0xE1, 0xE2, 0xED, 0xFE)
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def is_jpeg(image_path: str) -> bool:
+    """Проверка сигнатуры JPEG по первым байтам файла"""
+    with open(image_path, 'rb') as f:
+        return f.read(3) == b'\xff\xd8\xff'
+
+
+def strip_metadata(data: bytes) -> bytes:
+    """JPEG без сегментов метаданных до первого скана; остальные байты не меняются"""
+    result = bytearray(data[:2])
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:
+            break
+        end = pos + 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker not in _METADATA_MARKERS:
+            result += data[pos:end]
+        pos = end
+    result += data[pos:]
+    return bytes(result)
+
+
+def _build_lut(counts: bytes, symbols: bytes) -> List[int]:
+    """Таблица декодирования по 16 битам: символ | (длина кода << 8), 0 - нет кода"""
+    lut = [0] * 65536
+    code = 0
+    index = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            if code >= 1 << length:
+                raise ValueError("Поврежденная таблица Хаффмана")
+            shift = 16 - length
+            lut[code << shift:(code + 1) << shift] = [symbols[index] | (length << 8)] * (1 << shift)
+            code += 1
+            index += 1
+        code <<= 1
+    return lut
+
+
+class _Scan:
+    """Скан JPEG: компоненты, сегменты между маркерами RST и распакованные данные"""
+
+    def __init__(self, start: int, end: int, blocks: list, mcu_count: int, restart_interval: int,
+                 segments: List[bytes], markers: List[bytes]):
+        self.start = start
+        self.end = end
+        # (таблица DC, таблица AC) для каждого блока MCU по порядку
+        self.blocks = blocks
+        self.mcu_count = mcu_count
+        self.restart_interval = restart_interval
+        self.markers = markers
+        # Данные без байтов-заполнителей 0x00 после 0xFF; сегменты начинаются с границы байта
+        self.segment_starts = []
+        offset = 0
+        for segment in segments:
+            self.segment_starts.append(offset)
+            offset += len(segment)
+        self.data = np.frombuffer(b''.join(segments), dtype=np.uint8).copy()
+
+
+class JPEGCoefficients:
+    """Квантованные DCT-коэффициенты JPEG как массив однобитовых каналов (JSteg).
+
+    Используются AC-коэффициенты с |v| >= 2: изменение младшего бита не меняет
+    категорию величины, поэтому коды Хаффмана остаются прежними и в сжатом
+    потоке меняется ровно один дополнительный бит. Таблицы квантования и
+    Хаффмана, маркеры и метаданные исходного файла сохраняются без изменений.
+    """
+
+    def __init__(self, data: bytes, limit: Optional[int] = None):
+        """limit - декодировать только первые limit пригодных коэффициентов
+        (для чтения заголовка); такой объект нельзя сохранять"""
+        self.source = data
+        self.scans = self._parse(data)
+
+        # Позиции битов отсчитываются от начала распакованных данных всех сканов подряд
+        positions, negative = [], []
+        offset = 0
+        for scan in self.scans:
+            remaining = None if limit is None else limit - sum(part.size for part in positions)
+            if remaining == 0:
+                break
+            scan_positions, scan_negative = self._decode(scan, remaining)
+            positions.append(np.asarray(scan_positions, dtype=np.int64) + offset)
+            negative.append(np.asarray(scan_negative, dtype=np.uint8))
+            offset += scan.data.size * 8
+        self.positions = np.concatenate(positions)
+        self.negative = np.concatenate(negative)
+
+    @classmethod
+    def from_file(cls, image_path: str, limit: Optional[int] = None) -> 'JPEGCoefficients':
+        with open(image_path, 'rb') as f:
+            return cls(f.read(), limit)
+
+    @classmethod
+    def from_image(cls, image: Image.Image, quality: int = DEFAULT_JPEG_QUALITY, **options) -> 'JPEGCoefficients':
+        """Кодирование изображения в baseline JPEG и разбор коэффициентов"""
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, **options)
+        return cls(buffer.getvalue())
+
+    @staticmethod
+    def _parse(data: bytes) -> List[_Scan]:
+        if data[:2] != b'\xff\xd8':
+            raise ValueError("Файл не является JPEG")
+
+        tables = {}
+        frame = None
+        restart_interval = 0
+        scans = []
+        pos = 2
+        while pos < len(data):
+            if data[pos] != 0xFF:
+                raise ValueError("Поврежденная структура JPEG")
+            while pos < len(data) and data[pos] == 0xFF:
+                pos += 1
+            marker = data[pos]
+            pos += 1
+            if marker == 0xD9:
+                break
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                continue
+
+            length = struct.unpack('>H', data[pos:pos + 2])[0]
+            segment = data[pos + 2:pos + length]
+            end = pos + length
+
+            if marker in _SOF_UNSUPPORTED:
+                raise ValueError("Поддерживаются только baseline JPEG с кодами Хаффмана (не прогрессивные)")
+            if marker in _SOF_SUPPORTED:
+                height, width, count = struct.unpack('>HHB', segment[1:6])
+                if height == 0:
+                    raise ValueError("JPEG с маркером DNL не поддерживается")
+                components = {}
+                for i in range(count):
+                    cid, sampling = segment[6 + 3 * i], segment[7 + 3 * i]
+                    components[cid] = (sampling >> 4, sampling & 15)
+                frame = (width, height, components)
+            elif marker == 0xC4:
+                i = 0
+                while i < len(segment):
+                    kind, counts = segment[i], segment[i + 1:i + 17]
+                    total = sum(counts)
+                    tables[(kind >> 4, kind & 15)] = _build_lut(counts, segment[i + 17:i + 17 + total])
+                    i += 17 + total
+            elif marker == 0xDD:
+                restart_interval = struct.unpack('>H', segment[:2])[0]
+            elif marker == 0xDA:
+                if frame is None:
+                    raise ValueError("Скан JPEG до заголовка кадра")
+                scan, end = JPEGCoefficients._parse_scan(data, segment, end, frame, tables, restart_interval)
+                scans.append(scan)
+            pos = end
+
+        if not scans:
+            raise ValueError("В JPEG не найдены данные изображения")
+        return scans
+
+    @staticmethod
+    def _parse_scan(data: bytes, segment: bytes, start: int, frame, tables, restart_interval: int):
+        width, height, components = frame
+        h_max = max(h for h, _ in components.values())
+        v_max = max(v for _, v in components.values())
+
+        count = segment[0]
+        scan_components = []
+        for i in range(count):
+            cid, selectors = segment[1 + 2 * i], segment[2 + 2 * i]
+            try:
+                scan_components.append((components[cid], tables[(0, selectors >> 4)], tables[(1, selectors & 15)]))
+            except KeyError:
+                raise ValueError("Скан JPEG ссылается на отсутствующую компоненту или таблицу")
+
+        if count == 1:
+            # Неперемежающийся скан: MCU - один блок компоненты
+            (h, v), dc, ac = scan_components[0]
+            blocks_x = -(-(-(-width * h // h_max)) // 8)
+            blocks_y = -(-(-(-height * v // v_max)) // 8)
+            blocks = [(dc, ac)]
+            mcu_count = blocks_x * blocks_y
+        else:
+            blocks = [(dc, ac) for (h, v), dc, ac in scan_components for _ in range(h * v)]
+            mcu_count = -(-width // (8 * h_max)) * -(-height // (8 * v_max))
+
+        # Конец сжатых данных - первый маркер, кроме заполнителя 0x00 и RST
+        segments, markers = [], []
+        seg_start = pos = start
+        while True:
+            pos = data.find(b'\xff', pos)
+            if pos < 0 or pos + 1 >= len(data):
+                raise ValueError("Данные JPEG обрываются внутри скана")
+            following = data[pos + 1]
+            if following == 0x00 or following == 0xFF:
+                pos += 1 if following == 0xFF else 2
+                continue
+            segments.append(data[seg_start:pos].replace(b'\xff\x00', b'\xff'))
+            if 0xD0 <= following <= 0xD7:
+                markers.append(data[pos:pos + 2])
+                seg_start = pos = pos + 2
+                continue
+            break
+
+        scan = _Scan(start, pos, blocks, mcu_count, restart_interval, segments, markers)
+        return scan, pos
+
+    @staticmethod
+    def _windows(data: np.ndarray, byte_index: int) -> List[int]:
+        """24-битные окна для байтов участка, начиная с byte_index"""
+        part = data[byte_index:byte_index + _WINDOW_CHUNK + 6].astype(np.uint32)
+        part = np.concatenate((part, np.zeros(8, dtype=np.uint32)))
+        return ((part[:-2] << 16) | (part[1:-1] << 8) | part[2:]).tolist()
+
+    def _decode(self, scan: _Scan, count: Optional[int] = None):
+        """Позиции младших дополнительных битов коэффициентов |v| >= 2 и их знаки.
+
+        С заданным count декодирование останавливается на MCU, в котором
+        набрано count коэффициентов.
+        """
+        wanted = count if count is not None else float('inf')
+        positions, negative = [], []
+        append_position, append_negative = positions.append, negative.append
+        data = scan.data
+        blocks = scan.blocks
+        interval = scan.restart_interval or scan.mcu_count
+
+        base, limit, win = 0, -1, None
+        segment = 0
+        pos = 0
+        for mcu in range(scan.mcu_count):
+            if len(positions) >= wanted:
+                return positions[:count], negative[:count]
+            if mcu and mcu % interval == 0:
+                # После маркера RST чтение продолжается с начала следующего сегмента
+                segment += 1
+                if segment >= len(scan.segment_starts):
+                    raise ValueError("Поврежденные данные JPEG: не хватает сегментов RST")
+                pos = scan.segment_starts[segment] * 8
+
+            for dc, ac in blocks:
+                i = pos >> 3
+                if i >= limit:
+                    base, limit, win = i, i + _WINDOW_CHUNK, self._windows(data, i)
+                entry = dc[(win[i - base] >> (8 - (pos & 7))) & 0xFFFF]
+                if not entry:
+                    raise ValueError("Поврежденные данные JPEG: неверный код Хаффмана")
+                pos += (entry >> 8) + (entry & 0xFF)
+
+                k = 1
+                while k < 64:
+                    i = pos >> 3
+                    if i >= limit:
+                        base, limit, win = i, i + _WINDOW_CHUNK, self._windows(data, i)
+                    entry = ac[(win[i - base] >> (8 - (pos & 7))) & 0xFFFF]
+                    if not entry:
+                        raise ValueError("Поврежденные данные JPEG: неверный код Хаффмана")
+                    pos += entry >> 8
+                    size = entry & 15
+                    if size == 0:
+                        if entry & 0xF0 != 0xF0:
+                            break  # EOB
+                        k += 16
+                        continue
+                    k += ((entry >> 4) & 15) + 1
+                    if size >= 2:
+                        i = pos >> 3
+                        # Старший дополнительный бит 0 - коэффициент отрицательный
+                        append_negative(1 - ((win[i - base] >> (23 - (pos & 7))) & 1))
+                        append_position(pos + size - 1)
+                    pos += size
+
+        if pos > len(data) * 8:
+            raise ValueError("Данные JPEG обрываются раньше конца скана")
+        if count is not None:
+            return positions[:count], negative[:count]
+        return positions, negative
+
+    def _stream_bits(self) -> np.ndarray:
+        data = np.concatenate([scan.data for scan in self.scans])
+        positions = self.positions
+        return (data[positions >> 3] >> (7 - (positions & 7)).astype(np.uint8)) & 1
+
+    def channels(self) -> np.ndarray:
+        """Младшие биты пригодных коэффициентов (значения 0/1, uint8)"""
+        return self._stream_bits() ^ self.negative
+
+    def capacity_bits(self) -> int:
+        return int(self.positions.size)
+
+    def to_bytes(self, channels: np.ndarray) -> bytes:
+        """JPEG с младшими битами коэффициентов из channels"""
+        data = np.concatenate([scan.data for scan in self.scans])
+        changed = np.flatnonzero(((channels & 1) ^ self.negative) != self._stream_bits())
+        positions = self.positions[changed]
+        np.bitwise_xor.at(data, positions >> 3, (1 << (7 - (positions & 7))).astype(np.uint8))
+
+        result = bytearray()
+        previous = 0
+        offset = 0
+        for scan in self.scans:
+            scan_data = data[offset:offset + scan.data.size].tobytes()
+            offset += scan.data.size
+            result += self.source[previous:scan.start]
+            bounds = scan.segment_starts + [len(scan_data)]
+            for index in range(len(scan.segment_starts)):
+                result += scan_data[bounds[index]:bounds[index + 1]].replace(b'\xff', b'\xff\x00')
+                if index < len(scan.markers):
+                    result += scan.markers[index]
+            previous = scan.end
+        result += self.source[previous:]
+        return bytes(result)
+
+    def save(self, output_path: str, channels: np.ndarray, keep_metadata: bool = True) -> None:
+        data = self.to_bytes(channels)
+        with open(output_path, 'wb') as f:
+            f.write(data if keep_metadata else strip_metadata(data))
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from typing import Tuple
+import hashlib
+import threading
+from Crypto.Protocol.KDF import PBKDF2
+from Crypto.Random import get_random_bytes
+
+# Идентификаторы функций формирования ключа (хранятся в заголовке)
+KDF_PBKDF2_SHA1 = 1
+
+DEFAULT_KDF_ITERATIONS = 1000000
+KEY_SIZE = 32
+SALT_SIZE = 16
+
+
+def derive_key(password: str, salt: bytes, iterations: int, kdf_id: int = KDF_PBKDF2_SHA1) -> bytes:
+    """Формирование ключа из пароля без кеширования"""
+    if kdf_id != KDF_PBKDF2_SHA1:
+        raise ValueError(f"Неподдерживаемая функция формирования ключа: {kdf_id}")
+    if iterations < 1:
+        raise ValueError("Число итераций KDF должно быть положительным")
+    return PBKDF2(password.encode('utf-8'), salt, dkLen=KEY_SIZE, count=iterations)
+
+
+class KeyCache:
+    """Ограниченный LRU-кеш производных ключей внутри процесса.
+
+    Ключи кеша строятся из SHA-256 пароля, соли и параметров KDF, сам пароль
+    не хранится. Вытесняемые ключи затираются нулями; вызывающий получает
+    копию, поэтому затирание не меняет ключ, который еще используется.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._salts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _password_id(password: str) -> bytes:
+        return hashlib.sha256(password.encode('utf-8')).digest()
+
+    def get(self, password: str, salt: bytes, iterations: int, kdf_id: int = KDF_PBKDF2_SHA1) -> bytes:
+        """Копия ключа для пароля и соли; при промахе выполняется KDF"""
+        cache_key = (self._password_id(password), bytes(salt), iterations, kdf_id)
+        with self._lock:
+            key = self._keys.get(cache_key)
+            if key is not None:
+                self._keys.move_to_end(cache_key)
+                return bytes(key)
+
+        derived = derive_key(password, salt, iterations, kdf_id)
+
+        with self._lock:
+            self._keys[cache_key] = bytearray(derived)
+            self._keys.move_to_end(cache_key)
+            while len(self._keys) > self.max_entries:
+                evicted_key, evicted = self._keys.popitem(last=False)
+                self._forget_salt(evicted_key)
+                self._zeroize(evicted)
+        return derived
+
+    def encryption_key(self, password: str, iterations: int, kdf_id: int = KDF_PBKDF2_SHA1) -> Tuple[bytes, bytes]:
+        """Соль и ключ для шифрования.
+
+        Для одного пароля в пределах процесса используется одна соль, поэтому
+        пакет сообщений требует одного вызова KDF при встраивании и при
+        извлечении.
+        """
+        salt_key = (self._password_id(password), iterations, kdf_id)
+        with self._lock:
+            salt = self._salts.get(salt_key)
+        if salt is None:
+            salt = get_random_bytes(SALT_SIZE)
+            with self._lock:
+                salt = self._salts.setdefault(salt_key, salt)
+        return salt, self.get(password, salt, iterations, kdf_id)
+
+    def clear(self) -> None:
+        """Очистка кеша с затиранием всех ключей"""
+        with self._lock:
+            for key in self._keys.values():
+                self._zeroize(key)
+            self._keys.clear()
+            self._salts.clear()
+
+    def _forget_salt(self, cache_key) -> None:
+        password_id, salt, iterations, kdf_id = cache_key
+        salt_key = (password_id, iterations, kdf_id)
+        if self._salts.get(salt_key) == salt:
+            del self._salts[salt_key]
+
+    @staticmethod
+    def _zeroize(key: bytearray) -> None:
+        key[:] = bytes(len(key))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Общий кеш процесса
+default_key_cache = KeyCache()
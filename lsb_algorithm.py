@@ -1,23 +1,91 @@
-from typing import List, Optional
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional, Tuple
 import hashlib
+import hmac
+import itertools
+import tempfile
+import numpy as np
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from Crypto.Random import get_random_bytes
-from Crypto.Protocol.KDF import PBKDF2
+from payload_header import (PayloadHeader, HEADER_SIZE, FLAG_ENCRYPTED, FLAG_KEY_CHECK, FLAG_FILE, FLAG_SCATTERED,
+                            FLAG_ECC, FLAG_COMPRESSED, FLAG_AEAD, KDF_BLOCK_SIZE, KEY_CHECK_SIZE, pack_kdf_block, unpack_kdf_block)
+from bit_stream import LSBReader, LSBWriter, patch_bits
+from scatter import KeyedPermutation, ScatteredReader, ScatteredWriter, SCATTER_SALT, SCATTER_KDF_ITERATIONS
+from key_cache import KeyCache, default_key_cache, derive_key, DEFAULT_KDF_ITERATIONS, KDF_PBKDF2_SHA1
+from channel_layout import ChannelLayout
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from ecc import EccEncoder, EccDecoder, DEFAULT_ECC_DEPTH
+from compression import (compress_payload, compress_stream, decompress_stream, DEFAULT_COMPRESSION,
+                         DEFAULT_MAX_DECOMPRESSED_SIZE)
+
+# Размер части при потоковой обработке файлов
+STREAM_CHUNK_SIZE = 1 << 20
+
+# Каналов, в которых помещается заголовок любой версии при любом числе битов на канал
+PROBE_CHANNELS = HEADER_SIZE * 8
+
+# Режимы шифрования новых нагрузок: gcm - AES-GCM с тегом аутентификации, cbc - прежний AES-CBC
+CIPHER_CHOICES = ('gcm', 'cbc')
+DEFAULT_CIPHER = 'gcm'
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+# Открытый текст AES-GCM до проверки тега копится в памяти до этого размера, далее - во временном файле
+AEAD_SPOOL_SIZE = 1 << 24
 
 class LSBAlgorithm:
-    def __init__(self, bits_per_channel: int = 1):
+    def __init__(self, bits_per_channel: int = 1, kdf_iterations: int = DEFAULT_KDF_ITERATIONS,
+                 key_cache: KeyCache = None, progress: Optional[Callable[[int, int], None]] = None,
+                 scatter: bool = False, channel_mask: Optional[str] = None,
+                 instrumentation: Optional[Instrumentation] = None, ecc_symbols: Optional[int] = None,
+                 ecc_depth: int = DEFAULT_ECC_DEPTH, compression: str = DEFAULT_COMPRESSION, workers: int = 1,
+                 cipher: str = DEFAULT_CIPHER,
+                 max_decompressed_size: Optional[int] = DEFAULT_MAX_DECOMPRESSED_SIZE):
+        if cipher not in CIPHER_CHOICES:
+            raise ValueError(f"Неизвестный режим шифрования: {cipher}")
         self.bits_per_channel = bits_per_channel
+        self.kdf_iterations = kdf_iterations
+        self.key_cache = key_cache if key_cache is not None else default_key_cache
+        # Разброс нагрузки по ключу из пароля (только при шифровании)
+        self.scatter = scatter
+        # Имена используемых каналов; None - все, кроме альфа-канала
+        self.channel_mask = channel_mask
+        # progress(обработано байт, всего байт или 0, если неизвестно); исключение из него прерывает операцию
+        self.progress = progress
+        # События этапов (KDF, шифрование, запись и чтение битов); по умолчанию отключены
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        # Проверочных байт Рида-Соломона на кодовое слово из 255 байт; None - без коррекции ошибок
+        self.ecc_symbols = ecc_symbols
+        # Глубина чередования кодовых слов (защита от повреждения подряд идущих байт)
+        self.ecc_depth = ecc_depth
+        if ecc_symbols is not None:
+            # Проверка параметров до начала встраивания
+            self._ecc_encoder()
+        # Сжатие перед шифрованием: 'auto' - лучший алгоритм, если он уменьшает размер; 'none' - без сжатия
+        self.compression = compression
+        # Потоков для записи и чтения битов полосами внутри одного изображения
+        self.workers = max(1, workers)
+        # Режим шифрования новых нагрузок; при извлечении режим берется из флагов заголовка
+        self.cipher = cipher
+        # Предел размера распакованной нагрузки при извлечении; None - без предела
+        self.max_decompressed_size = max_decompressed_size
+    
+    def layout_for(self, mode: str) -> ChannelLayout:
+        """Раскладка каналов для изображения в режиме mode"""
+        return ChannelLayout(mode, self.channel_mask)
+    
+    def _report(self, done: int, total: int) -> None:
+        if self.progress is not None:
+            self.progress(done, total)
     
     @staticmethod
     def encrypt_message(text: str, password: str) -> bytes:
-        """Шифрование сообщения с использованием AES-256 (CBC режим)"""
+        """Шифрование сообщения с использованием AES-256 (CBC режим, старый формат)"""
         try:
             # Генерируем соль для ключа
             salt = get_random_bytes(16)
             
             # Создаем ключ из пароля с использованием PBKDF2
-            key = PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=1000000)
+            key = derive_key(password, salt, DEFAULT_KDF_ITERATIONS)
             
             # Создаем шифр
             cipher = AES.new(key, AES.MODE_CBC)
@@ -44,7 +112,7 @@ class LSBAlgorithm:
             ct = encrypted_data[32:]
             
             # Восстанавливаем ключ
-            key = PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=1000000)
+            key = default_key_cache.get(password, salt, DEFAULT_KDF_ITERATIONS)
             
             # Создаем шифр для расшифровки
             cipher = AES.new(key, AES.MODE_CBC, iv=iv)
@@ -55,162 +123,268 @@ class LSBAlgorithm:
         except Exception as e:
             raise ValueError(f"Неверный пароль или поврежденные данные: {str(e)}")
     
-    @staticmethod
-    def bytes_to_binary(data: bytes) -> str:
-        """Преобразование байтов в бинарную строку"""
-        binary_string = ''
-        for byte in data:
-            binary_string += format(byte, '08b')
+    def encrypt_payload(self, data: bytes, password: str, header: Optional[PayloadHeader] = None) -> bytes:
+        """Шифрование байтов AES-256 (GCM или CBC, см. cipher).
+        
+        В начале нагрузки записываются параметры KDF и контрольное значение
+        ключа, по которому неверный пароль отсекается до расшифровки. Для GCM
+        поля заголовка header (без длины) защищаются тегом; по умолчанию -
+        заголовок с флагами шифрования и bits_per_channel.
+        """
+        if header is None:
+            header = PayloadHeader(0, self.bits_per_channel, self.encryption_flags())
+        return b''.join(self._encrypt_chunks([data], password, header))
+    
+    def decrypt_payload(self, payload: bytes, password: str, header: Optional[PayloadHeader] = None) -> bytes:
+        """Расшифрование нагрузки; число итераций KDF берется из нее самой, режим - из флагов заголовка"""
+        if header is None:
+            header = PayloadHeader(0, self.bits_per_channel, FLAG_ENCRYPTED | FLAG_KEY_CHECK)
+        prefix_size = self._crypto_prefix_size(header.flags)
+        # Служебный префикс + тег GCM или хотя бы один блок CBC
+        if len(payload) < prefix_size + 16:
+            raise ValueError("Недостаточный размер данных для расшифровки")
         
-        # Добавляем маркер конца сообщения (0x00 0x00)
-        binary_string += '00000000' * 2
-        return binary_string
+        return b''.join(self._decrypt_chunks(payload[:prefix_size], [payload[prefix_size:]], password, header))
+    
+    def encryption_flags(self) -> int:
+        """Флаги заголовка для нагрузки, зашифрованной в режиме cipher"""
+        return FLAG_ENCRYPTED | FLAG_KEY_CHECK | (FLAG_AEAD if self.cipher == 'gcm' else 0)
     
     @staticmethod
-    def binary_to_bytes(binary: str) -> Optional[bytes]:
-        """Преобразование бинарной строки обратно в байты"""
-        bytes_list = []
-        
-        # Проходим по 8 бит за раз
-        for i in range(0, len(binary), 8):
-            if i + 8 > len(binary):
-                break
-                
-            byte_str = binary[i:i+8]
-            
-            # Проверяем маркер конца (два нулевых байта подряд)
-            if byte_str == '00000000':
-                # Проверяем следующий байт, если он есть
-                if i + 16 <= len(binary):
-                    next_byte_str = binary[i+8:i+16]
-                    if next_byte_str == '00000000':
-                        break  # Нашли маркер конца
-            
-            bytes_list.append(int(byte_str, 2))
+    def _crypto_prefix_size(flags: int) -> int:
+        """Размер служебных данных перед шифртекстом: параметры KDF, контроль ключа, nonce или IV"""
+        nonce_size = GCM_NONCE_SIZE if flags & FLAG_AEAD else AES.block_size
+        return KDF_BLOCK_SIZE + (KEY_CHECK_SIZE if flags & FLAG_KEY_CHECK else 0) + nonce_size
+    
+    @classmethod
+    def encrypted_size(cls, size: int, flags: int) -> int:
+        """Размер зашифрованной нагрузки для size байт открытых данных"""
+        if flags & FLAG_AEAD:
+            return cls._crypto_prefix_size(flags) + size + GCM_TAG_SIZE
+        return cls._crypto_prefix_size(flags) + (size // AES.block_size + 1) * AES.block_size
+    
+    def _encrypt_chunks(self, chunks: Iterable[bytes], password: str, header: PayloadHeader) -> Iterator[bytes]:
+        """Потоковое шифрование: служебный префикс, затем шифртекст по частям"""
+        stage = self.instrumentation.stage
+        try:
+            with stage('kdf'):
+                salt, key = self.key_cache.encryption_key(password, self.kdf_iterations)
+            if self.cipher == 'gcm':
+                cipher = AES.new(key, AES.MODE_GCM, nonce=get_random_bytes(GCM_NONCE_SIZE), mac_len=GCM_TAG_SIZE)
+            else:
+                cipher = AES.new(key, AES.MODE_CBC)
+        except Exception as e:
+            raise ValueError(f"Ошибка шифрования: {str(e)}")
+        
+        prefix = pack_kdf_block(KDF_PBKDF2_SHA1, self.kdf_iterations, salt) + self.key_check(key)
+        if self.cipher == 'gcm':
+            # Параметры KDF, контрольное значение и поля заголовка защищены тегом как связанные данные
+            cipher.update(prefix + header.associated_data())
+            yield prefix + cipher.nonce
+            for chunk in chunks:
+                with stage('encrypt', bytes=len(chunk)):
+                    encrypted = cipher.encrypt(chunk)
+                yield encrypted
+            yield cipher.digest()
+            return
+        
+        yield prefix + cipher.iv
+        
+        tail = b''
+        for chunk in chunks:
+            data = tail + chunk
+            cut = len(data) - len(data) % AES.block_size
+            if cut:
+                with stage('encrypt', bytes=cut):
+                    encrypted = cipher.encrypt(data[:cut])
+                yield encrypted
+            tail = data[cut:]
+        with stage('encrypt', bytes=len(tail)):
+            encrypted = cipher.encrypt(pad(tail, AES.block_size))
+        yield encrypted
+    
+    def _decrypt_chunks(self, prefix: bytes, chunks: Iterable[bytes], password: str,
+                        header: PayloadHeader) -> Iterator[bytes]:
+        """Потоковое расшифрование; последний блок удерживается для снятия дополнения"""
+        stage = self.instrumentation.stage
+        flags = header.flags
+        kdf_id, iterations, salt = unpack_kdf_block(prefix)
+        with stage('kdf'):
+            key = self.key_cache.get(password, salt, iterations, kdf_id)
+        offset = KDF_BLOCK_SIZE
+        if flags & FLAG_KEY_CHECK:
+            if not hmac.compare_digest(prefix[offset:offset + KEY_CHECK_SIZE], self.key_check(key)):
+                raise ValueError("Неверный пароль")
+            offset += KEY_CHECK_SIZE
+        
+        if flags & FLAG_AEAD:
+            yield from self._decrypt_aead(key, prefix[:offset] + header.associated_data(),
+                                          prefix[offset:offset + GCM_NONCE_SIZE], chunks)
+            return
         
         try:
-            return bytes(bytes_list)
-        except Exception:
-            return None
+            cipher = AES.new(key, AES.MODE_CBC, iv=prefix[offset:offset + AES.block_size])
+            held = b''
+            for chunk in chunks:
+                data = held + chunk
+                cut = max(0, (len(data) - 1) // AES.block_size * AES.block_size)
+                if cut:
+                    with stage('decrypt', bytes=cut):
+                        decrypted = cipher.decrypt(data[:cut])
+                    yield decrypted
+                held = data[cut:]
+            
+            if len(held) != AES.block_size:
+                raise ValueError("Длина шифртекста не кратна размеру блока")
+            with stage('decrypt', bytes=len(held)):
+                decrypted = unpad(cipher.decrypt(held), AES.block_size)
+            yield decrypted
+        except ValueError as e:
+            raise ValueError(f"Неверный пароль или поврежденные данные: {str(e)}")
+    
+    def _decrypt_aead(self, key: bytes, associated: bytes, nonce: bytes, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Потоковое расшифрование AES-GCM; последние GCM_TAG_SIZE байт потока - тег"""
+        stage = self.instrumentation.stage
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+        cipher.update(associated)
+        held = b''
+        for chunk in chunks:
+            view = memoryview(chunk)
+            # Все, кроме последних GCM_TAG_SIZE байт потока, - шифртекст; части не склеиваются
+            cut = len(held) + len(view) - GCM_TAG_SIZE
+            if cut <= 0:
+                held += bytes(view)
+                continue
+            first = min(cut, len(held))
+            with stage('decrypt', bytes=cut):
+                decrypted = cipher.decrypt(held[:first]) if first else b''
+                decrypted_chunk = cipher.decrypt(view[:cut - first])
+            if decrypted:
+                yield decrypted
+            yield decrypted_chunk
+            held = held[first:] + bytes(view[cut - first:])
+        if len(held) != GCM_TAG_SIZE:
+            raise ValueError("Недостаточный размер данных для расшифровки")
+        try:
+            cipher.verify(held)
+        except ValueError:
+            raise ValueError("Неверный пароль или поврежденные данные: тег аутентификации не совпадает")
+    
+    def compress(self, data: bytes) -> Tuple[bytes, int]:
+        """Сжатие нагрузки, если оно уменьшает размер; возвращает данные и флаги заголовка"""
+        compressed = compress_payload(data, self.compression, self.instrumentation)
+        if compressed is None:
+            return data, 0
+        return compressed, FLAG_COMPRESSED
+    
+    def _ecc_encoder(self) -> EccEncoder:
+        return EccEncoder(self.ecc_symbols, self.ecc_depth, self.instrumentation)
+    
+    def _protect(self, chunks: Iterable[bytes], flags: int) -> Tuple[Iterable[bytes], int]:
+        """Код коррекции ошибок поверх (уже зашифрованной) нагрузки, если он включен"""
+        if self.ecc_symbols is None:
+            return chunks, flags
+        return self._ecc_encoder().encode(chunks), flags | FLAG_ECC
+    
+    def _embed_header(self, flags: int) -> PayloadHeader:
+        """Заголовок встраиваемой нагрузки до записи длины (FLAG_ECC ставит _protect после шифрования)"""
+        if self.ecc_symbols is not None:
+            flags |= FLAG_ECC
+        return PayloadHeader(0, self.bits_per_channel, flags)
+    
+    def _recover(self, chunks: Iterable[bytes], header: PayloadHeader) -> Iterable[bytes]:
+        """Исправление ошибок в нагрузке с флагом FLAG_ECC"""
+        if not header.flags & FLAG_ECC:
+            return chunks
+        return EccDecoder(header.length, self.instrumentation).decode(chunks)
+    
+    def payload_capacity(self, container_bytes: int) -> int:
+        """Размер нагрузки до кода коррекции ошибок, помещающейся в container_bytes байт с заголовком"""
+        # Заголовок записывается по 1 биту на канал и занимает HEADER_SIZE * 8 каналов
+        available = max(0, container_bytes - HEADER_SIZE * self.bits_per_channel)
+        if self.ecc_symbols is None:
+            return available
+        return self._ecc_encoder().max_data_size(available)
+    
+    @staticmethod
+    def key_check(key: bytes) -> bytes:
+        """Контрольное значение ключа (не раскрывает сам ключ)"""
+        return hmac.new(bytes(key), b'StegoLab key check', hashlib.sha256).digest()[:KEY_CHECK_SIZE]
+    
+    @staticmethod
+    def bytes_to_binary(data: bytes) -> str:
+        """Преобразование байтов в бинарную строку (для обратной совместимости)"""
+        bits = np.unpackbits(np.frombuffer(data + b'\x00' * 2, dtype=np.uint8))
+        # Добавлен маркер конца сообщения (0x00 0x00)
+        return (bits + ord('0')).tobytes().decode('ascii')
+    
+    @staticmethod
+    def binary_to_bytes(binary: str) -> Optional[bytes]:
+        """Преобразование бинарной строки обратно в байты (для обратной совместимости)"""
+        bits = np.frombuffer(binary.encode('ascii'), dtype=np.uint8) - ord('0')
+        data = np.packbits(bits[:len(bits) // 8 * 8]).tobytes()
+        return LSBAlgorithm._strip_marker(data)
     
     @staticmethod
     def text_to_binary(text: str) -> str:
         """Преобразование текста в бинарную строку (для обратной совместимости)"""
-        encoded_text = text.encode('utf-8')
-        binary = ''.join(format(byte, '08b') for byte in encoded_text)
-        return binary + '00000000'  # Маркер конца сообщения
+        bits = np.unpackbits(np.frombuffer(text.encode('utf-8') + b'\x00', dtype=np.uint8))
+        return (bits + ord('0')).tobytes().decode('ascii')
     
     @staticmethod
     def binary_to_text(binary: str) -> str:
         """Преобразование бинарной строки в текст (для обратной совместимости)"""
-        bytes_list = []
-        for i in range(0, len(binary), 8):
-            if i + 8 > len(binary):
-                break
-            byte_str = binary[i:i+8]
-            if byte_str == '00000000':
-                break
-            bytes_list.append(int(byte_str, 2))
-        
+        bits = np.frombuffer(binary.encode('ascii'), dtype=np.uint8) - ord('0')
+        data = np.packbits(bits[:len(bits) // 8 * 8]).tobytes()
+        end = data.find(b'\x00')
         try:
-            return bytes(bytes_list).decode('utf-8')
+            return (data if end < 0 else data[:end]).decode('utf-8')
         except UnicodeDecodeError:
             return ""
     
     def embed_text(self, pixels: List, text: str, password: str = None) -> List:
         """Встраивание текста в пиксели"""
-        # Преобразуем текст в байты
-        if password:
-            # Шифруем сообщение и получаем байты
-            encrypted_bytes = self.encrypt_message(text, password)
-            binary_data = self.bytes_to_binary(encrypted_bytes)
-        else:
-            # Просто текст (без шифрования)
-            binary_data = self.text_to_binary(text)
-        
-        binary_index = 0
-        height = len(pixels)
-        width = len(pixels[0])
-        
-        new_pixels = []
-        for i in range(height):
-            new_row = []
-            for j in range(width):
-                r, g, b = pixels[i][j]
-                
-                # Встраиваем в красный канал
-                if binary_index < len(binary_data):
-                    r = self._set_bits(r, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                # Встраиваем в зеленый канал
-                if binary_index < len(binary_data):
-                    g = self._set_bits(g, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                # Встраиваем в синий канал
-                if binary_index < len(binary_data):
-                    b = self._set_bits(b, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                new_row.append((r, g, b))
-            new_pixels.append(new_row)
-        
-        return new_pixels
+        return self.embed_data(pixels, text.encode('utf-8'), password)
     
     def extract_text(self, pixels: List, password: str = None) -> str:
         """Извлечение текста из пикселей"""
-        # Сначала извлекаем все биты
-        binary_text = ''
-        height = len(pixels)
-        width = len(pixels[0])
-        
-        for i in range(height):
-            for j in range(width):
-                r, g, b = pixels[i][j]
-                binary_text += self._get_bits(r)
-                binary_text += self._get_bits(g)
-                binary_text += self._get_bits(b)
-        
-        # Пытаемся сначала как зашифрованные данные
-        if password:
-            try:
-                encrypted_bytes = self.binary_to_bytes(binary_text)
-                if encrypted_bytes and len(encrypted_bytes) >= 48:
-                    decrypted_text = self.decrypt_message(encrypted_bytes, password)
-                    return decrypted_text
-            except ValueError:
-                # Не удалось расшифровать - возможно, не зашифровано
-                pass
+        channels, _ = self._as_channels(pixels)
+        header = self.read_header(channels)
+        if header is None:
+            # Заголовка нет - изображение в старом формате с маркером конца
+            return self._extract_legacy_text(channels, password)
         
-        # Пытаемся как обычный текст
-        text = self.binary_to_text(binary_text)
-        return text
+        payload = self._open_payload(channels, header, password)
+        try:
+            return payload.decode('utf-8')
+        except UnicodeDecodeError:
+            return ""
     
     def embed_data(self, pixels: List, data: bytes, password: str = None) -> List:
-        """Встраивание байтов в пиксели (альтернативный метод)"""
+        """Встраивание байтов в пиксели"""
+        self._check_scatter(password)
+        data, flags = self.compress(data)
         if password:
-            # Шифруем данные (предполагаем, что data это текст в байтах)
-            data = self.encrypt_message(data.decode('utf-8'), password)
+            flags |= self.encryption_flags()
+            if self.scatter:
+                flags |= FLAG_SCATTERED
+            data = self.encrypt_payload(data, password, self._embed_header(flags))
+        chunks, flags = self._protect([data], flags)
+        data = b''.join(chunks)
         
-        binary_data = self.bytes_to_binary(data)
-        return self._embed_binary(pixels, binary_data)
+        channels, restore = self._as_channels(pixels)
+        self.embed_payload(channels, data, flags, password)
+        return restore(channels)
     
     def extract_data(self, pixels: List, password: str = None) -> Optional[bytes]:
         """Извлечение байтов из пикселей"""
-        binary_text = ''
-        height = len(pixels)
-        width = len(pixels[0])
-        
-        for i in range(height):
-            for j in range(width):
-                r, g, b = pixels[i][j]
-                binary_text += self._get_bits(r)
-                binary_text += self._get_bits(g)
-                binary_text += self._get_bits(b)
-        
-        data_bytes = self.binary_to_bytes(binary_text)
+        channels, _ = self._as_channels(pixels)
+        header = self.read_header(channels)
+        if header is not None:
+            return self._open_payload(channels, header, password)
         
+        # Старый формат: читаем все каналы до маркера конца
+        data_bytes = self._strip_marker(self.extract_bytes(channels))
         if password and data_bytes:
             try:
                 if len(data_bytes) >= 48:
@@ -221,67 +395,381 @@ class LSBAlgorithm:
         
         return data_bytes
     
-    def _embed_binary(self, pixels: List, binary_data: str) -> List:
-        """Вспомогательный метод для встраивания бинарных данных"""
-        binary_index = 0
-        height = len(pixels)
-        width = len(pixels[0])
-        
-        new_pixels = []
-        for i in range(height):
-            new_row = []
-            for j in range(width):
-                r, g, b = pixels[i][j]
-                
-                if binary_index < len(binary_data):
-                    r = self._set_bits(r, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                if binary_index < len(binary_data):
-                    g = self._set_bits(g, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                if binary_index < len(binary_data):
-                    b = self._set_bits(b, binary_data, binary_index)
-                    binary_index += self.bits_per_channel
-                
-                new_row.append((r, g, b))
-            new_pixels.append(new_row)
-        
-        return new_pixels
-    
-    def _set_bits(self, value: int, binary_text: str, index: int) -> int:
-        """Установка битов в значение канала"""
-        if index >= len(binary_text):
-            return value
-        
-        # Очищаем младшие биты
-        mask = (1 << self.bits_per_channel) - 1
-        value = value & ~mask
-        
-        # Получаем биты для вставки
-        bits_str = binary_text[index:index+self.bits_per_channel]
-        if len(bits_str) < self.bits_per_channel:
-            bits_str = bits_str.ljust(self.bits_per_channel, '0')
-        
-        bits = int(bits_str, 2)
-        return value | bits
-    
-    def _get_bits(self, value: int) -> str:
-        """Извлечение битов из значения канала"""
-        mask = (1 << self.bits_per_channel) - 1
-        bits = value & mask
-        return format(bits, f'0{self.bits_per_channel}b')
-    
-    def calculate_max_bytes(self, width: int, height: int) -> int:
+    def _open_payload(self, channels: np.ndarray, header: PayloadHeader, password: str = None) -> bytes:
+        """Извлечение нагрузки по флагам заголовка, без попыток перебора.
+        
+        Для незашифрованной нагрузки пароль игнорируется; для зашифрованной
+        без пароля ошибка возникает до чтения данных.
+        """
+        if header.flags & FLAG_ENCRYPTED and not password:
+            raise ValueError("Сообщение зашифровано, требуется пароль")
+        
+        payload = self.extract_payload(channels, header, password)
+        if header.flags & FLAG_ECC:
+            payload = b''.join(self._recover([payload], header))
+        if header.flags & FLAG_ENCRYPTED:
+            payload = self.decrypt_payload(payload, password, header)
+        if header.flags & FLAG_COMPRESSED:
+            payload = b''.join(decompress_stream([payload], self.instrumentation,
+                                                       self.max_decompressed_size))
+        return payload
+    
+    def _check_scatter(self, password: Optional[str]) -> None:
+        """Перестановка строится из пароля, без него разброс невозможен"""
+        if self.scatter and not password:
+            raise ValueError("Разброс нагрузки требует пароля")
+    
+    def _scatter_layout(self, channels: np.ndarray, header: PayloadHeader,
+                        password: str) -> Tuple[KeyedPermutation, int]:
+        """Перестановка каналов после заголовка и номер первого из них"""
+        if not password:
+            raise ValueError("Данные разбросаны по ключу, требуется пароль")
+        offset = header.header_channels
+        if channels.size <= offset:
+            raise ValueError("Данные не помещаются в изображение")
+        with self.instrumentation.stage('kdf'):
+            key = self.key_cache.get(password, SCATTER_SALT, SCATTER_KDF_ITERATIONS)
+        return KeyedPermutation(key, channels.size - offset), offset
+    
+    def _payload_writer(self, channels: np.ndarray, header: PayloadHeader, password: str = None):
+        """Запись заголовка; возвращает писатель, продолжающий поток нагрузкой.
+        
+        Заголовок всегда лежит последовательно в первых каналах, по 1 биту на
+        канал; нагрузка продолжается с глубиной из заголовка. При флаге
+        FLAG_SCATTERED нагрузка идет по ключевой перестановке остальных каналов.
+        """
+        writer = LSBWriter(channels, header.header_bits_per_channel, workers=self.workers)
+        writer.write(header.pack())
+        writer.flush()
+        if header.flags & FLAG_SCATTERED:
+            return ScatteredWriter(channels, header.bits_per_channel,
+                                   *self._scatter_layout(channels, header, password))
+        writer.set_bits_per_channel(header.bits_per_channel)
+        return writer
+    
+    def _payload_reader(self, channels: np.ndarray, header: PayloadHeader, password: str = None):
+        """Читатель, установленный на начало нагрузки после заголовка"""
+        if header.flags & FLAG_SCATTERED:
+            return ScatteredReader(channels, header.bits_per_channel,
+                                   *self._scatter_layout(channels, header, password))
+        reader = LSBReader(channels, header.header_bits_per_channel, workers=self.workers)
+        reader.read(HEADER_SIZE)
+        reader.set_bits_per_channel(header.bits_per_channel)
+        return reader
+    
+    def embed_payload(self, channels: np.ndarray, payload: bytes, flags: int = 0,
+                      password: str = None) -> PayloadHeader:
+        """Встраивание полезной нагрузки с заголовком контейнера"""
+        header = PayloadHeader(len(payload), self.bits_per_channel, flags)
+        
+        capacity = header.capacity(channels.size)
+        if len(payload) > capacity:
+            raise ValueError(f"Данные не помещаются в изображение: {len(payload)} из {capacity} байт")
+        
+        writer = self._payload_writer(channels, header, password)
+        view = memoryview(payload)
+        for start in range(0, len(view), STREAM_CHUNK_SIZE):
+            piece = view[start:start + STREAM_CHUNK_SIZE]
+            with self.instrumentation.stage('embed', bytes=len(piece)):
+                writer.write(piece)
+            self._report(min(len(view), start + STREAM_CHUNK_SIZE), len(view))
+        writer.flush()
+        return header
+    
+    def read_header(self, channels: np.ndarray) -> Optional[PayloadHeader]:
+        """Чтение заголовка контейнера; затрагивает только первые каналы.
+        
+        Число битов на канал нагрузки берется из заголовка, а не из настроек.
+        """
+        return self.probe_header(channels)
+    
+    @staticmethod
+    def probe_header(channels: np.ndarray) -> Optional[PayloadHeader]:
+        """Поиск заголовка без знания числа битов на канал.
+        
+        Заголовок версии 2 читается по 1 биту на канал. Заголовок версии 1
+        пробуется для глубин 1-4; принимается тот, в котором записанная
+        глубина совпадает с глубиной чтения. Достаточно первых PROBE_CHANNELS
+        каналов.
+        """
+        for bits_per_channel in range(1, 5):
+            header = PayloadHeader.unpack(LSBReader(channels, bits_per_channel).read(HEADER_SIZE))
+            if header is not None and header.header_bits_per_channel == bits_per_channel:
+                return header
+        return None
+    
+    def extract_payload(self, channels: np.ndarray, header: PayloadHeader = None,
+                        password: str = None) -> Optional[bytes]:
+        """Извлечение полезной нагрузки по длине из заголовка.
+        
+        Читаются только каналы, занятые заголовком и данными. Возвращает None,
+        если заголовок контейнера не найден.
+        """
+        if header is None:
+            header = self.read_header(channels)
+            if header is None:
+                return None
+        
+        if header.length > header.capacity(channels.size):
+            raise ValueError("Поврежденный заголовок: длина данных превышает вместимость")
+        
+        reader = self._payload_reader(channels, header, password)
+        result = bytearray()
+        while len(result) < header.length:
+            count = min(STREAM_CHUNK_SIZE, header.length - len(result))
+            with self.instrumentation.stage('extract', bytes=count):
+                result += reader.read(count)
+            self._report(len(result), header.length)
+        return bytes(result)
+    
+    def embed_stream(self, channels: np.ndarray, source: BinaryIO, password: str = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> PayloadHeader:
+        """Потоковое встраивание файла из файлового объекта.
+        
+        Чтение, шифрование и запись в каналы идут частями по chunk_size байт;
+        заголовок с итоговой длиной дописывается после нагрузки.
+        """
+        self._check_scatter(password)
+        flags = FLAG_FILE
+        chunks, compressed = compress_stream(iter(lambda: source.read(chunk_size), b''), self.compression,
+                                             self.instrumentation)
+        if compressed:
+            flags |= FLAG_COMPRESSED
+        if password:
+            flags |= self.encryption_flags()
+            if self.scatter:
+                flags |= FLAG_SCATTERED
+            chunks = self._encrypt_chunks(chunks, password, self._embed_header(flags))
+        chunks, flags = self._protect(chunks, flags)
+        
+        # Заголовок с нулевой длиной занимает место до перезаписи в конце
+        writer = self._payload_writer(channels, PayloadHeader(0, self.bits_per_channel, flags), password)
+        length = 0
+        for chunk in chunks:
+            with self.instrumentation.stage('embed', bytes=len(chunk)):
+                writer.write(chunk)
+            length += len(chunk)
+            self._report(length, 0)
+        writer.flush()
+        
+        header = PayloadHeader(length, self.bits_per_channel, flags)
+        patch_bits(channels, header.header_bits_per_channel, 0, header.pack())
+        return header
+    
+    def extract_stream(self, channels: np.ndarray, target: BinaryIO, password: str = None,
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """Потоковое извлечение нагрузки в файловый объект; возвращает число байт"""
+        header = self.read_header(channels)
+        if header is None:
+            raise ValueError("Заголовок скрытых данных не найден")
+        if header.flags & FLAG_ENCRYPTED and not password:
+            raise ValueError("Данные зашифрованы, требуется пароль")
+        reader = self._payload_reader(channels, header, password)
+        return self._read_body(reader, header, channels.size, target, password, chunk_size)
+    
+    def container_stream(self, source: BinaryIO, size: int, password: str = None, flags: int = 0,
+                         chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[PayloadHeader, Iterator[bytes]]:
+        """Заголовок и поток байтов контейнера для источника известного размера.
+        
+        Длина зашифрованной нагрузки вычисляется заранее, поэтому заголовок
+        записывается до нагрузки и запись может вестись строго
+        последовательно. Поток содержит только нагрузку: заголовок пишется
+        по 1 биту на канал отдельно (см. header_bits_per_channel). Источник
+        здесь не сжимается (размер сжатых данных заранее неизвестен); уже
+        сжатые методом compress() данные передаются с флагом FLAG_COMPRESSED.
+        """
+        chunks = iter(lambda: source.read(chunk_size), b'')
+        length = size
+        if password:
+            flags |= self.encryption_flags()
+            chunks = self._encrypt_chunks(chunks, password, self._embed_header(flags))
+            length = self.encrypted_size(size, flags)
+        if self.ecc_symbols is not None:
+            chunks, flags = self._protect(chunks, flags)
+            length = self._ecc_encoder().encoded_length(length)
+        
+        header = PayloadHeader(length, self.bits_per_channel, flags)
+        
+        def generate():
+            done = 0
+            for chunk in chunks:
+                yield chunk
+                done += len(chunk)
+                self._report(done, length)
+        
+        return header, generate()
+    
+    def open_container(self, open_reader: Callable[[int], object]) -> Tuple[Optional[PayloadHeader], object]:
+        """Заголовок из последовательного источника и читатель, установленный на начало нагрузки.
+        
+        open_reader(bits_per_channel) открывает источник с начала; у читателя
+        есть read(), bits_per_channel и set_bits_per_channel(). Заголовок
+        версии 2 читается по 1 биту на канал; заголовок версии 1 ищется с
+        глубиной из настроек.
+        """
+        reader = open_reader(1)
+        header = PayloadHeader.unpack(reader.read(HEADER_SIZE))
+        if header is None and self.bits_per_channel != 1:
+            reader = open_reader(self.bits_per_channel)
+            header = PayloadHeader.unpack(reader.read(HEADER_SIZE))
+        if header is None:
+            return None, reader
+        if header.header_bits_per_channel != reader.bits_per_channel:
+            raise ValueError("Поврежденный заголовок контейнера")
+        reader.set_bits_per_channel(header.bits_per_channel)
+        return header, reader
+    
+    def read_container(self, open_reader: Callable[[int], object], channel_count: int, target: BinaryIO,
+                       password: str = None, chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[PayloadHeader, int]:
+        """Чтение заголовка и нагрузки из последовательного источника (см. open_container).
+        
+        Возвращает заголовок и число байт, записанных в target.
+        """
+        header, reader = self.open_container(open_reader)
+        if header is None:
+            raise ValueError("Заголовок скрытых данных не найден")
+        if header.flags & FLAG_SCATTERED:
+            raise ValueError("Разбросанные данные читаются только из изображения целиком")
+        return header, self._read_body(reader, header, channel_count, target, password, chunk_size)
+    
+    def _read_body(self, reader, header: PayloadHeader, channel_count: int, target: BinaryIO, password: str,
+                   chunk_size: int) -> int:
+        """Потоковое чтение нагрузки после заголовка; возвращает число записанных байт"""
+        if header.flags & FLAG_ENCRYPTED and not password:
+            raise ValueError("Данные зашифрованы, требуется пароль")
+        if header.length > header.capacity(channel_count):
+            raise ValueError("Поврежденный заголовок: длина данных превышает вместимость")
+        
+        remaining = header.length
+        
+        def read_chunks():
+            nonlocal remaining
+            while remaining > 0:
+                with self.instrumentation.stage('extract', bytes=min(chunk_size, remaining)):
+                    chunk = reader.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise ValueError("Данные обрываются раньше указанной длины")
+                remaining -= len(chunk)
+                yield chunk
+        
+        chunks = self._recover(read_chunks(), header)
+        if header.flags & FLAG_ENCRYPTED:
+            prefix_size = self._crypto_prefix_size(header.flags)
+            if header.length < prefix_size + AES.block_size:
+                raise ValueError("Недостаточный размер данных для расшифровки")
+            prefix, chunks = self._split_prefix(chunks, prefix_size)
+            chunks = self._decrypt_chunks(prefix, chunks, password, header)
+            if header.flags & FLAG_AEAD:
+                chunks = self._verified(chunks, chunk_size)
+        if header.flags & FLAG_COMPRESSED:
+            chunks = decompress_stream(chunks, self.instrumentation, self.max_decompressed_size)
+        
+        written = 0
+        for chunk in chunks:
+            target.write(chunk)
+            written += len(chunk)
+            self._report(header.length - remaining, header.length)
+        return written
+    
+    @staticmethod
+    def _verified(chunks: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+        """Выдача открытого текста AES-GCM только после проверки тега.
+        
+        Расшифрованные части копятся (в памяти до AEAD_SPOOL_SIZE, дальше во
+        временном файле), поэтому ни распаковка, ни target не получают
+        непроверенных данных.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=AEAD_SPOOL_SIZE) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.seek(0)
+            yield from iter(lambda: spool.read(chunk_size), b'')
+    
+    @staticmethod
+    def _split_prefix(chunks: Iterable[bytes], size: int) -> Tuple[bytes, Iterator[bytes]]:
+        """Первые size байт потока и поток оставшихся байт"""
+        chunks = iter(chunks)
+        prefix = b''
+        while len(prefix) < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("Недостаточный размер данных для расшифровки")
+            prefix += chunk
+        return prefix[:size], itertools.chain([prefix[size:]], chunks)
+    
+    def _extract_legacy_text(self, channels: np.ndarray, password: str = None) -> str:
+        """Извлечение текста в старом формате с маркером конца (полный проход)"""
+        data = self.extract_bytes(channels)
+        
+        if password:
+            try:
+                encrypted_bytes = self._strip_marker(data)
+                if encrypted_bytes and len(encrypted_bytes) >= 48:
+                    return self.decrypt_message(encrypted_bytes, password)
+            except ValueError:
+                pass
+        
+        end = data.find(b'\x00')
+        try:
+            return (data if end < 0 else data[:end]).decode('utf-8')
+        except UnicodeDecodeError:
+            return ""
+    
+    def embed_bytes(self, channels: np.ndarray, data: bytes) -> None:
+        """Векторное встраивание байтов в плоский массив каналов (на месте).
+        
+        Биты идут старшим вперёд, по bits_per_channel бит на канал в порядке
+        R, G, B, слева направо и сверху вниз; последняя неполная группа
+        дополняется нулями.
+        """
+        writer = LSBWriter(channels, self.bits_per_channel, workers=self.workers)
+        writer.write(data)
+        writer.flush()
+    
+    def extract_bytes(self, channels: np.ndarray, count: Optional[int] = None) -> bytes:
+        """Векторное извлечение байтов из плоского массива каналов.
+        
+        Если count не задан, читаются все каналы; неполный последний байт
+        отбрасывается.
+        """
+        if count is None:
+            count = channels.size * self.bits_per_channel // 8
+        return LSBReader(channels, self.bits_per_channel, workers=self.workers).read(count)
+    
+    @staticmethod
+    def _strip_marker(data: bytes) -> bytes:
+        """Обрезает данные по маркеру конца (два нулевых байта подряд)"""
+        end = data.find(b'\x00' * 2)
+        return data if end < 0 else data[:end]
+    
+    @staticmethod
+    def _as_channels(pixels):
+        """Приводит пиксели к плоскому массиву каналов.
+        
+        Возвращает массив каналов и функцию, преобразующую его обратно к
+        исходному представлению. Массив NumPy обрабатывается на месте, без
+        копирования; список строк кортежей копируется в новый массив.
+        """
+        if isinstance(pixels, np.ndarray):
+            shape = pixels.shape
+            return pixels.reshape(-1), lambda flat: flat.reshape(shape)
+        
+        array = np.array(pixels, dtype=np.uint8)
+        shape = array.shape
+        
+        def restore(flat):
+            return [list(map(tuple, row)) for row in flat.reshape(shape).tolist()]
+        
+        return array.reshape(-1), restore
+    
+    def calculate_max_bytes(self, width: int, height: int, channels_per_pixel: int = 3) -> int:
         """Рассчитывает максимальное количество байт для встраивания"""
-        total_bits = width * height * 3 * self.bits_per_channel
-        total_bytes = total_bits // 8
-        # Вычитаем 2 байта для маркера конца
-        return max(0, total_bytes - 2)
+        total_bits = width * height * channels_per_pixel * self.bits_per_channel
+        # Вычитаем место для заголовка контейнера и кода коррекции ошибок
+        return self.payload_capacity(total_bits // 8)
     
-    def calculate_max_chars(self, width: int, height: int) -> int:
+    def calculate_max_chars(self, width: int, height: int, channels_per_pixel: int = 3) -> int:
         """Рассчитывает максимальное количество символов для встраивания"""
-        max_bytes = self.calculate_max_bytes(width, height)
+        max_bytes = self.calculate_max_bytes(width, height, channels_per_pixel)
         # Ориентировочно 2 байта на символ UTF-8
         return max_bytes // 2
\ No newline at end of file
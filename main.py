@@ -1,12 +1,17 @@
-import tkinter as tk
-from interface import SteganographyGUI
+import sys
 
 def main():
+    # С аргументами командной строки работаем без графического интерфейса
+    if len(sys.argv) > 1:
+        from cli import run_cli
+        sys.exit(run_cli(sys.argv[1:]))
+
     try:
+        from interface import SteganographyGUI
         app = SteganographyGUI()
         app.run()
     except Exception as e:
         print(f"Ошибка запуска приложения: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,166 @@
+from typing import Iterator, List, Optional, Tuple
+import mmap
+import os
+import shutil
+import numpy as np
+from PIL import Image
+
+# Порядок каналов в файле, который можно читать без декодирования
+_RAW_MODES = {
+    ('RGB', 'RGB'): False,
+    ('RGB', 'BGR'): True,
+}
+
+# Расширения, для которых результат записывается в исходном формате
+MAPPED_FORMATS = {'.bmp': 'BMP', '.tif': 'TIFF', '.tiff': 'TIFF'}
+
+
+class RawLayout:
+    """Расположение несжатых строк пикселей в файле.
+
+    Строится по описанию тайлов PIL для BMP, несжатых TIFF и PPM; позволяет
+    обращаться к произвольному диапазону строк без декодирования изображения.
+    """
+
+    def __init__(self, width: int, height: int, channels: int, tiles: List[Tuple[int, int, int, int, int]],
+                 reverse: bool):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        # (y0, y1, смещение, длина строки, шаг по y)
+        self.tiles = tiles
+        self.reverse = reverse
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> Optional['RawLayout']:
+        """Описание раскладки или None, если изображение хранится сжатым"""
+        width, height = image.size
+        tiles = []
+        reverse = None
+        for tile in image.tile:
+            codec, extents, offset, args = tile[0], tile[1], tile[2], tile[3]
+            if codec != 'raw':
+                return None
+            if isinstance(args, str):
+                args = (args, 0, 1)
+            rawmode, stride, ystep = (tuple(args) + (0, 1))[:3]
+
+            key = (image.mode, rawmode)
+            if key not in _RAW_MODES:
+                return None
+            if reverse is not None and reverse != _RAW_MODES[key]:
+                return None
+            reverse = _RAW_MODES[key]
+
+            x0, y0, x1, y1 = extents
+            if x0 != 0 or x1 != width:
+                return None
+            row_size = width * len(image.mode)
+            tiles.append((y0, y1, offset, stride or row_size, ystep))
+
+        if not tiles:
+            return None
+        tiles.sort()
+        return cls(width, height, len(image.mode), tiles, reverse)
+
+    def row_ranges(self, y0: int, y1: int) -> Iterator[Tuple[int, int, int, int, int]]:
+        """Участки строк [y0, y1) по тайлам: (a, b, смещение первой строки в файле, длина строки, шаг)"""
+        for tile_y0, tile_y1, offset, stride, ystep in self.tiles:
+            a, b = max(y0, tile_y0), min(y1, tile_y1)
+            if a >= b:
+                continue
+            if ystep < 0:
+                # Строки тайла записаны снизу вверх
+                first = offset + (tile_y1 - b) * stride
+            else:
+                first = offset + (a - tile_y0) * stride
+            yield a, b, first, stride, ystep
+
+    def views(self, buffer, y0: int, y1: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """Представления строк [y0, y1) поверх буфера файла в порядке RGB сверху вниз.
+
+        Данные не копируются: запись в представление изменяет буфер.
+        """
+        row_bytes = self.width * self.channels
+        for a, b, first, stride, ystep in self.row_ranges(y0, y1):
+            if first + (b - a) * stride > len(buffer):
+                raise ValueError("Файл изображения обрезан")
+            rows = np.ndarray((b - a, stride), dtype=np.uint8, buffer=buffer, offset=first)[:, :row_bytes]
+            if ystep < 0:
+                rows = rows[::-1]
+            rows = rows.reshape(b - a, self.width, self.channels)
+            if self.reverse:
+                rows = rows[..., ::-1]
+            yield a, b, rows
+
+
+class MappedImage:
+    """Несжатое изображение, отображённое в память (mmap).
+
+    Строки читаются и изменяются прямо в файле, без декодирования через PIL.
+    """
+
+    def __init__(self, path: str, writable: bool = False):
+        with Image.open(path) as image:
+            self.size = image.size
+            self.layout = RawLayout.from_image(image)
+        if self.layout is None:
+            raise ValueError("Изображение хранится в сжатом виде")
+
+        self.writable = writable
+        self._file = open(path, 'r+b' if writable else 'rb')
+        try:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            self._map = mmap.mmap(self._file.fileno(), 0, access=access)
+        except Exception:
+            self._file.close()
+            raise
+
+    @staticmethod
+    def layout_of(path: str) -> Optional[RawLayout]:
+        """Раскладка строк файла или None, если его нельзя отобразить"""
+        try:
+            with Image.open(path) as image:
+                return RawLayout.from_image(image)
+        except Exception:
+            return None
+
+    @classmethod
+    def copy(cls, source_path: str, output_path: str) -> 'MappedImage':
+        """Копия файла для изменения (исходный файл не меняется)"""
+        if os.path.abspath(source_path) != os.path.abspath(output_path):
+            shutil.copyfile(source_path, output_path)
+        return cls(output_path, writable=True)
+
+    def read_rows(self, y0: int, y1: int) -> np.ndarray:
+        """Копия строк [y0, y1) в массив (строки, ширина, каналы)"""
+        layout = self.layout
+        result = np.empty((y1 - y0, layout.width, layout.channels), dtype=np.uint8)
+        for a, b, rows in layout.views(self._map, y0, y1):
+            result[a - y0:b - y0] = rows
+        return result
+
+    def write_rows(self, y0: int, rows: np.ndarray) -> None:
+        """Запись строк, начиная с y0, обратно в файл"""
+        for a, b, view in self.layout.views(self._map, y0, y0 + rows.shape[0]):
+            view[...] = rows[a - y0:b - y0]
+
+    def strips(self, strip_height: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """Полосы изображения (копии) сверху вниз"""
+        height = self.size[1]
+        for y0 in range(0, height, strip_height):
+            yield y0, self.read_rows(y0, min(height, y0 + strip_height))
+
+    def close(self) -> None:
+        if not self._map.closed:
+            if self.writable:
+                self._map.flush()
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,127 @@
+from typing import Optional, Tuple
+import struct
+
+# Сигнатура контейнера StegoLab
+MAGIC = b'SLAB'
+VERSION = 2
+# В версии 1 заголовок записан с тем же числом битов на канал, что и нагрузка;
+# с версии 2 - по 1 биту на канал, поэтому глубина нагрузки читается из него
+LEGACY_VERSION = 1
+SUPPORTED_VERSIONS = (LEGACY_VERSION, VERSION)
+
+# Сигнатура, версия, флаги, битов на канал, длина полезной нагрузки
+HEADER_FORMAT = '>4sBBBI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Флаги заголовка
+FLAG_ENCRYPTED = 0x01
+FLAG_KEY_CHECK = 0x02
+FLAG_FILE = 0x04
+# Нагрузка разбросана по изображению ключевой перестановкой
+FLAG_SCATTERED = 0x08
+# Нагрузка (после шифрования) защищена кодом Рида-Соломона
+FLAG_ECC = 0x10
+# Нагрузка сжата до шифрования; алгоритм - первый байт открытых данных
+FLAG_COMPRESSED = 0x20
+# Аутентифицированное шифрование AES-GCM вместо AES-CBC: nonce вместо IV, тег в конце
+FLAG_AEAD = 0x40
+
+# Имена флагов в отчетах о заголовке
+FLAG_NAMES = {
+    FLAG_ENCRYPTED: 'encrypted',
+    FLAG_KEY_CHECK: 'key_check',
+    FLAG_FILE: 'file',
+    FLAG_SCATTERED: 'scattered',
+    FLAG_ECC: 'ecc',
+    FLAG_COMPRESSED: 'compressed',
+    FLAG_AEAD: 'aead',
+}
+
+# Параметры KDF в начале зашифрованной нагрузки: алгоритм, итерации, соль
+KDF_BLOCK_FORMAT = '>BI16s'
+KDF_BLOCK_SIZE = struct.calcsize(KDF_BLOCK_FORMAT)
+MAX_KDF_ITERATIONS = 100000000
+
+# Контрольное значение ключа после параметров KDF
+KEY_CHECK_SIZE = 4
+
+
+class PayloadHeader:
+    """Заголовок контейнера со встроенными данными"""
+
+    def __init__(self, length: int, bits_per_channel: int, flags: int = 0, version: int = VERSION):
+        self.length = length
+        self.bits_per_channel = bits_per_channel
+        self.flags = flags
+        self.version = version
+
+    def pack(self) -> bytes:
+        """Сериализация заголовка в байты"""
+        return struct.pack(HEADER_FORMAT, MAGIC, self.version, self.flags,
+                           self.bits_per_channel, self.length)
+
+    def associated_data(self) -> bytes:
+        """Поля заголовка без длины: известны до встраивания и защищаются тегом AES-GCM"""
+        return self.pack()[:HEADER_SIZE - struct.calcsize('>I')]
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Optional['PayloadHeader']:
+        """Разбор заголовка; возвращает None, если сигнатура не найдена"""
+        if len(data) < HEADER_SIZE:
+            return None
+
+        magic, version, flags, bits_per_channel, length = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+        if magic != MAGIC:
+            return None
+
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Неподдерживаемая версия контейнера: {version}")
+
+        if not 1 <= bits_per_channel <= 4:
+            raise ValueError("Поврежденный заголовок контейнера")
+
+        return cls(length, bits_per_channel, flags, version)
+
+    @property
+    def header_bits_per_channel(self) -> int:
+        """Битов на канал в области заголовка"""
+        return self.bits_per_channel if self.version == LEGACY_VERSION else 1
+
+    @property
+    def header_channels(self) -> int:
+        """Каналов, занятых заголовком (в версии 1 последний может быть занят частично)"""
+        return -(-HEADER_SIZE * 8 // self.header_bits_per_channel)
+
+    def capacity(self, channel_count: int) -> int:
+        """Наибольшая длина нагрузки в контейнере из channel_count каналов"""
+        if self.version == LEGACY_VERSION:
+            # Нагрузка продолжает поток битов заголовка
+            return max(0, channel_count * self.bits_per_channel // 8 - HEADER_SIZE)
+        return max(0, channel_count - self.header_channels) * self.bits_per_channel // 8
+
+    def describe(self) -> dict:
+        """Поля заголовка и признаки флагов в виде словаря"""
+        result = {'version': self.version, 'flags': self.flags, 'bits_per_channel': self.bits_per_channel,
+                  'length': self.length}
+        result.update((name, bool(self.flags & flag)) for flag, name in FLAG_NAMES.items())
+        return result
+
+    def __repr__(self) -> str:
+        return (f"PayloadHeader(length={self.length}, bits_per_channel={self.bits_per_channel}, "
+                f"flags={self.flags:#04x}, version={self.version})")
+
+
+def pack_kdf_block(kdf_id: int, iterations: int, salt: bytes) -> bytes:
+    """Сериализация параметров KDF"""
+    return struct.pack(KDF_BLOCK_FORMAT, kdf_id, iterations, salt)
+
+
+def unpack_kdf_block(data: bytes) -> Tuple[int, int, bytes]:
+    """Разбор параметров KDF: (алгоритм, итерации, соль)"""
+    if len(data) < KDF_BLOCK_SIZE:
+        raise ValueError("Недостаточный размер данных для параметров KDF")
+
+    kdf_id, iterations, salt = struct.unpack(KDF_BLOCK_FORMAT, data[:KDF_BLOCK_SIZE])
+    if not 1 <= iterations <= MAX_KDF_ITERATIONS:
+        raise ValueError(f"Недопустимое число итераций KDF: {iterations}")
+    return kdf_id, iterations, salt
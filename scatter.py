@@ -0,0 +1,129 @@
+import hashlib
+import numpy as np
+from bit_stream import CHUNK_CHANNELS, LSBReader, LSBWriter
+
+# Число раундов сети Фейстеля
+FEISTEL_ROUNDS = 6
+
+# Ключ перестановки нужен до чтения нагрузки, поэтому соль и число итераций
+# фиксированы; результат кешируется в KeyCache
+SCATTER_SALT = b'StegoLab scatter'
+SCATTER_KDF_ITERATIONS = 100000
+
+_MUL1 = np.uint64(0x9E3779B97F4A7C15)
+_MUL2 = np.uint64(0xBF58476D1CE4E5B9)
+
+
+class KeyedPermutation:
+    """Ключевая перестановка индексов [0, size) на сети Фейстеля.
+
+    Образ любого набора индексов вычисляется векторно и независимо от
+    остальных, поэтому для N бит нагрузки строятся только N позиций, без
+    перемешивания всех индексов изображения. Значения вне диапазона
+    возвращаются в него повторным шифрованием (cycle walking).
+    """
+
+    def __init__(self, key: bytes, size: int):
+        if size < 1:
+            raise ValueError("Размер перестановки должен быть положительным")
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self._half = np.uint64((bits + 1) // 2)
+        self._mask = np.uint64((1 << int(self._half)) - 1)
+        digest = hashlib.sha512(key).digest()
+        self._round_keys = np.frombuffer(digest, dtype='>u8')[:FEISTEL_ROUNDS].astype(np.uint64)
+
+    def _round(self, right: np.ndarray, key: np.uint64) -> np.ndarray:
+        x = (right ^ key) * _MUL1
+        x ^= x >> np.uint64(29)
+        x *= _MUL2
+        return (x >> np.uint64(32)) & self._mask
+
+    def _encrypt(self, values: np.ndarray) -> np.ndarray:
+        left = values >> self._half
+        right = values & self._mask
+        for key in self._round_keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half) | right
+
+    def __call__(self, indices: np.ndarray) -> np.ndarray:
+        """Образы индексов (массив int64 той же длины)"""
+        result = self._encrypt(np.asarray(indices, dtype=np.uint64))
+        outside = np.flatnonzero(result >= self.size)
+        while outside.size:
+            result[outside] = self._encrypt(result[outside])
+            outside = outside[result[outside] >= self.size]
+        return result.astype(np.int64)
+
+
+class ScatteredWriter:
+    """Запись в младшие биты каналов в порядке ключевой перестановки.
+
+    Каналы для очередной порции собираются в буфер, заполняются обычным
+    LSBWriter и возвращаются на места.
+    """
+
+    def __init__(self, channels: np.ndarray, bits_per_channel: int, permutation: KeyedPermutation,
+                 offset: int = 0):
+        self.channels = channels
+        self.bits_per_channel = bits_per_channel
+        self.permutation = permutation
+        self.offset = offset
+        self._next = 0
+        self._writer = LSBWriter(np.empty(0, dtype=channels.dtype), bits_per_channel, strict=False)
+
+    def write(self, data: bytes) -> None:
+        k = self.bits_per_channel
+        view = memoryview(data).cast('B')
+        step = CHUNK_CHANNELS * k // 8
+        for start in range(0, len(view), step):
+            piece = view[start:start + step]
+            self._write(piece, (self._writer.pending_bits + len(piece) * 8) // k)
+
+    def flush(self) -> None:
+        self._write(None, -(-self._writer.pending_bits // self.bits_per_channel))
+
+    def _write(self, data, groups: int) -> None:
+        if self._next + groups > self.permutation.size:
+            raise ValueError("Данные не помещаются в изображение")
+        positions = self.offset + self.permutation(np.arange(self._next, self._next + groups, dtype=np.uint64))
+        buffer = self.channels[positions]
+        self._writer.rebind(buffer)
+        if data is None:
+            self._writer.flush()
+        else:
+            self._writer.write(data)
+        self.channels[positions] = buffer
+        self._next += groups
+
+
+class ScatteredReader:
+    """Чтение младших битов каналов в порядке ключевой перестановки"""
+
+    def __init__(self, channels: np.ndarray, bits_per_channel: int, permutation: KeyedPermutation,
+                 offset: int = 0):
+        self.channels = channels
+        self.bits_per_channel = bits_per_channel
+        self.permutation = permutation
+        self.offset = offset
+        self._next = 0
+        self._reader = LSBReader(np.empty(0, dtype=channels.dtype), bits_per_channel)
+
+    def read(self, count: int) -> bytes:
+        """Чтение count байтов; вычисляются только позиции для этих байтов"""
+        k = self.bits_per_channel
+        step = CHUNK_CHANNELS * k // 8
+        result = bytearray()
+        while len(result) < count:
+            piece = min(step, count - len(result))
+            need_bits = piece * 8 - self._reader.pending_bits
+            groups = min(max(0, -(-need_bits // k)), self.permutation.size - self._next)
+
+            positions = self.offset + self.permutation(np.arange(self._next, self._next + groups, dtype=np.uint64))
+            self._next += groups
+            self._reader.rebind(self.channels[positions])
+            data = self._reader.read(piece)
+            if not data:
+                break
+            result += data
+        return bytes(result)
@@ -0,0 +1,214 @@
+from typing import List, Optional
+import math
+import numpy as np
+
+from image_processor import ImageProcessor
+from channel_layout import ChannelLayout
+
+# Оценка доли измененных младших битов, выше которой изображение считается подозрительным
+DEFAULT_THRESHOLD = 0.1
+
+# Атака хи-квадрат считается по нарастающим началам потока каналов
+CHI_SQUARE_SEGMENTS = 32
+# Уровень значимости: начало потока с меньшим p-значением данных не содержит
+CHI_SQUARE_P = 0.05
+# Пары гистограммы с меньшим ожидаемым числом значений не учитываются
+CHI_SQUARE_MIN_EXPECTED = 5
+
+# Строк плоскости за один векторный шаг RS-анализа и анализа пар
+ANALYSIS_ROWS = 512
+
+
+def _gamma_q(a: float, x: float) -> float:
+    """Регуляризованная верхняя неполная гамма-функция Q(a, x)"""
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Ряд для P(a, x)
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-12:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Цепная дробь для Q(a, x) (метод Лентца)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return h * math.exp(log_prefix)
+
+
+def chi_square_profile(values: np.ndarray, segments: int = CHI_SQUARE_SEGMENTS) -> np.ndarray:
+    """p-значения атаки хи-квадрат для первых 1/segments, 2/segments, ... потока каналов.
+
+    При последовательном встраивании частоты значений 2i и 2i+1 выравниваются:
+    для заполненного начала потока p-значение не мало (распределено
+    равномерно), для чистого изображения быстро стремится к нулю.
+    """
+    values = values.reshape(-1)
+    if values.size == 0:
+        return np.zeros(0)
+    segments = max(1, min(segments, values.size))
+    bins = (int(values.max()) + 2) & ~1
+    segment = np.arange(values.size, dtype=np.int64) * segments // values.size
+    histograms = np.bincount(segment * bins + values, minlength=segments * bins).reshape(segments, bins)
+    histograms = np.cumsum(histograms, axis=0)
+
+    even, odd = histograms[:, 0::2], histograms[:, 1::2]
+    expected = (even + odd) / 2
+    valid = expected >= CHI_SQUARE_MIN_EXPECTED
+    terms = np.where(valid, (even - expected) ** 2 / np.where(valid, expected, 1), 0)
+    statistic = terms.sum(axis=1)
+    freedom = valid.sum(axis=1) - 1
+    return np.array([_gamma_q(dof / 2, chi / 2) if dof > 0 else 0.0
+                     for chi, dof in zip(statistic.tolist(), freedom.tolist())])
+
+
+def chi_square_attack(values: np.ndarray, segments: int = CHI_SQUARE_SEGMENTS) -> dict:
+    """p-значение для всего потока и доля его начала, где встраивание не отвергается.
+
+    Доля - оценка сверху длины последовательной нагрузки: нарастающие
+    начала потока содержат и заполненную часть.
+    """
+    profile = chi_square_profile(values, segments)
+    if profile.size == 0:
+        return {'p_value': 0.0, 'length': 0.0}
+    filled = profile >= CHI_SQUARE_P
+    leading = profile.size if filled.all() else int(np.argmin(filled))
+    return {'p_value': float(profile[-1]), 'length': leading / profile.size}
+
+
+def _row_chunks(planes: List[np.ndarray]):
+    """Части плоскостей по ANALYSIS_ROWS строк в знаковом типе (для разностей и сдвига -1)"""
+    for plane in planes:
+        dtype = np.int16 if plane.dtype.itemsize == 1 else np.int32
+        for start in range(0, plane.shape[0], ANALYSIS_ROWS):
+            yield plane[start:start + ANALYSIS_ROWS].astype(dtype)
+
+
+def _smoothness(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """Дискриминирующая функция группы: сумма модулей разностей соседних значений"""
+    return np.abs(b - a) + np.abs(c - b) + np.abs(d - c)
+
+
+def _rs_counts(g0: np.ndarray, g1: np.ndarray, g2: np.ndarray, g3: np.ndarray) -> np.ndarray:
+    """Число регулярных и сингулярных групп для масок M = [0, 1, 1, 0] и -M"""
+    base = _smoothness(g0, g1, g2, g3)
+    f_pos = _smoothness(g0, g1 ^ 1, g2 ^ 1, g3)
+    f_neg = _smoothness(g0, ((g1 + 1) ^ 1) - 1, ((g2 + 1) ^ 1) - 1, g3)
+    return np.array([np.count_nonzero(f_pos > base), np.count_nonzero(f_pos < base),
+                     np.count_nonzero(f_neg > base), np.count_nonzero(f_neg < base)], dtype=np.int64)
+
+
+def rs_analysis(planes: List[np.ndarray]) -> float:
+    """Оценка доли измененных младших битов методом RS (Fridrich, Goljan, Du)"""
+    counts = np.zeros(4, dtype=np.int64)
+    flipped = np.zeros(4, dtype=np.int64)
+    total = 0
+    for rows in _row_chunks(planes):
+        width = rows.shape[1] // 4 * 4
+        # Столбцы групп из четырех соседних значений строки - непрерывные массивы
+        columns = rows[:, :width].reshape(-1, 4).T.copy()
+        total += columns.shape[1]
+        counts += _rs_counts(*columns)
+        flipped += _rs_counts(*(columns ^ 1))
+    if total == 0:
+        return 0.0
+
+    r_m, s_m, r_n, s_n = counts / total
+    r_m1, s_m1, r_n1, s_n1 = flipped / total
+    d0, d1 = r_m - s_m, r_m1 - s_m1
+    n0, n1 = r_n - s_n, r_n1 - s_n1
+    a = 2 * (d1 + d0)
+    b = n0 - n1 - d1 - 3 * d0
+    c = d0 - n0
+    x = _smaller_root(a, b, c)
+    if x is None or x == 0.5:
+        return 0.0
+    return float(np.clip(x / (x - 0.5), 0.0, 1.0))
+
+
+def _smaller_root(a: float, b: float, c: float) -> Optional[float]:
+    """Корень квадратного уравнения с наименьшим модулем"""
+    if abs(a) < 1e-12:
+        return -c / b if abs(b) > 1e-12 else None
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return None
+    root = math.sqrt(discriminant)
+    return min((-b + root) / (2 * a), (-b - root) / (2 * a), key=abs)
+
+
+def sample_pair_analysis(planes: List[np.ndarray]) -> float:
+    """Оценка доли измененных младших битов анализом пар соседних значений (Dumitrescu, Wu, Wang)"""
+    x = y = z = w = pairs = 0
+    for rows in _row_chunks(planes):
+        u, v = rows[:, :-1], rows[:, 1:]
+        even = (v & 1) == 0
+        x += np.count_nonzero((even & (u < v)) | (~even & (u > v)))
+        y += np.count_nonzero((even & (u > v)) | (~even & (u < v)))
+        z += np.count_nonzero(u == v)
+        w += np.count_nonzero(((u >> 1) == (v >> 1)) & (u != v))
+        pairs += u.size
+    if pairs == 0:
+        return 0.0
+
+    a = (w + z) / 2
+    b = 2 * x - pairs
+    c = y - x
+    estimate = _smaller_root(a, b, c)
+    if estimate is None:
+        estimate = -c / b if b else 0.0
+    return float(np.clip(estimate, 0.0, 1.0))
+
+
+def analyze_pixels(pixels: np.ndarray, layout: ChannelLayout, threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Оценки по массиву (высота, ширина, каналы) для каналов раскладки LSBAlgorithm.
+
+    Все методы работают с младшим битом; при bits_per_channel > 1 он также
+    изменяется, поэтому встраивание обнаруживается, но оценки доли менее точны.
+    """
+    planes = [pixels[..., index] for index in layout.indices]
+    chi = chi_square_attack(layout.select(pixels))
+    rs = rs_analysis(planes)
+    spa = sample_pair_analysis(planes)
+    # Атака хи-квадрат дает только оценку сверху и чувствительна к коротким началам потока,
+    # поэтому итоговый балл - оценки RS и SPA
+    score = max(rs, spa)
+    return {
+        'chi_square_p': round(chi['p_value'], 6),
+        'chi_square_length': round(chi['length'], 4),
+        'rs': round(rs, 4),
+        'spa': round(spa, 4),
+        'score': round(score, 4),
+        'suspicious': score >= threshold,
+    }
+
+
+def analyze_image(image_path: str, channel_mask: Optional[str] = None,
+                  threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Стегоанализ файла изображения: оценки методов и итоговый балл"""
+    processor = ImageProcessor()
+    processor.load_image(image_path)
+    processor.convert_to_native()
+    width, height = processor.size
+    layout = ChannelLayout(processor.mode, channel_mask)
+    result = {'width': width, 'height': height, 'mode': processor.mode, 'channels': layout.mask}
+    result.update(analyze_pixels(processor.get_channels(writable=False), layout, threshold))
+    return result
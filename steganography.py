@@ -1,19 +1,55 @@
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 import os
-from image_processor import ImageProcessor
-from lsb_algorithm import LSBAlgorithm
+from image_processor import ImageProcessor, check_output_mode
+from lsb_algorithm import LSBAlgorithm, STREAM_CHUNK_SIZE, PROBE_CHANNELS, DEFAULT_CIPHER
+from payload_header import FLAG_ENCRYPTED, FLAG_FILE, FLAG_SCATTERED, FLAG_AEAD
+from key_cache import DEFAULT_KDF_ITERATIONS
+from strip_processor import StripProcessor, DEFAULT_STRIP_HEIGHT
+from mapped_image import MappedImage, MAPPED_FORMATS
+from jpeg_engine import JPEGCoefficients, JPEG_EXTENSIONS, is_jpeg
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from ecc import DEFAULT_ECC_DEPTH
+from compression import DEFAULT_COMPRESSION, DEFAULT_MAX_DECOMPRESSED_SIZE
 import hashlib
+import io
+import tempfile
 
 class Steganography:
-    def __init__(self, bits_per_channel: int = 1):
+    def __init__(self, bits_per_channel: int = 1, kdf_iterations: int = DEFAULT_KDF_ITERATIONS,
+                 strip_height: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None,
+                 scatter: bool = False, channel_mask: Optional[str] = None,
+                 save_profile: str = 'default', keep_metadata: bool = True,
+                 instrumentation: Optional[Instrumentation] = None, ecc_symbols: Optional[int] = None,
+                 ecc_depth: int = DEFAULT_ECC_DEPTH, compression: str = DEFAULT_COMPRESSION, workers: int = 1,
+                 cipher: str = DEFAULT_CIPHER,
+                 max_decompressed_size: Optional[int] = DEFAULT_MAX_DECOMPRESSED_SIZE):
         if not 1 <= bits_per_channel <= 4:
             raise ValueError("bits_per_channel должен быть между 1 и 4")
-        self.image_processor = ImageProcessor()
-        self.lsb_algorithm = LSBAlgorithm(bits_per_channel)
+        if scatter and strip_height:
+            raise ValueError("Разброс нагрузки несовместим с обработкой полосами")
+        self.image_processor = ImageProcessor(save_profile, keep_metadata)
+        self.lsb_algorithm = LSBAlgorithm(bits_per_channel, kdf_iterations, progress=progress, scatter=scatter,
+                                          channel_mask=channel_mask, ecc_symbols=ecc_symbols, ecc_depth=ecc_depth,
+                                          compression=compression, workers=workers, cipher=cipher,
+                                          max_decompressed_size=max_decompressed_size)
+        # Для JPEG-результата данные встраиваются в DCT-коэффициенты, по одному биту на коэффициент
+        self.jpeg_algorithm = LSBAlgorithm(1, kdf_iterations, key_cache=self.lsb_algorithm.key_cache,
+                                           progress=progress, scatter=scatter, ecc_symbols=ecc_symbols,
+                                           ecc_depth=ecc_depth, compression=compression, workers=workers,
+                                           cipher=cipher, max_decompressed_size=max_decompressed_size)
+        self.set_instrumentation(instrumentation)
+        # С заданной высотой полосы изображение обрабатывается полосами
+        self.strip_processor = self._new_strip_processor(strip_height) if strip_height else None
+    
+    def set_instrumentation(self, instrumentation: Optional[Instrumentation]) -> None:
+        """Подключение приемника событий этапов; None - замеры отключены"""
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.lsb_algorithm.instrumentation = self.instrumentation
+        self.jpeg_algorithm.instrumentation = self.instrumentation
     
     def validate_image_format(self, image_path: str) -> bool:
         """Проверяет поддерживаемый формат изображения"""
-        supported_formats = {'.png', '.bmp', '.jpg', '.jpeg', '.tiff'}
+        supported_formats = {'.png', '.bmp', '.jpg', '.jpeg', '.tif', '.tiff'}
         return any(image_path.lower().endswith(fmt) for fmt in supported_formats)
     
     def calculate_hash(self, text: str) -> str:
@@ -32,34 +68,66 @@ class Steganography:
             if not text.strip():
                 raise ValueError("Сообщение не может быть пустым")
             
-            # Добавляем хеш для проверки целостности
-            text_with_hash = f"{self.calculate_hash(text)}:{text}"
+            self._check_output(image_path, output_path)
             
-            # Загружаем изображение
-            self.image_processor.load_image(image_path)
-            self.image_processor.convert_to_rgb()
+            # Добавляем хеш для проверки целостности; шифртекст AES-GCM проверяется тегом
+            if password and self.lsb_algorithm.cipher == 'gcm':
+                text_with_hash = text
+            else:
+                text_with_hash = f"{self.calculate_hash(text)}:{text}"
             
-            # Получаем пиксели
-            pixels = self.image_processor.get_pixels()
+            if self._jpeg_output(output_path):
+                coefficients = self._load_coefficients(image_path)
+                channels = coefficients.channels()
+                self._check_message_size(self.jpeg_algorithm, text_with_hash,
+                                         self.jpeg_algorithm.payload_capacity(channels.size // 8))
+                self.jpeg_algorithm.embed_text(channels, text_with_hash, password)
+                self._save_coefficients(output_path, coefficients, channels)
+                return True
             
-            # Проверяем вместимость (в БАЙТАХ)
-            max_bytes = self.calculate_capacity_bytes(pixels)
-            text_bytes = text_with_hash.encode('utf-8')
+            if self._by_strips(image_path, output_path):
+                data, flags = self.lsb_algorithm.compress(text_with_hash.encode('utf-8'))
+                self._embed_by_strips(image_path, output_path, io.BytesIO(data), len(data), password, flags)
+                return True
+            
+            # Загружаем изображение в исходном режиме
+            pixels, channels, layout = self._load_channels(image_path)
             
-            if len(text_bytes) > max_bytes:
-                raise ValueError(f"Сообщение слишком длинное. Максимум: {max_bytes} байт ({max_bytes // 2} символов примерно)")
+            # Проверяем вместимость (в БАЙТАХ)
+            self._check_message_size(self.lsb_algorithm, text_with_hash, self.lsb_algorithm.payload_capacity(
+                channels.size * self.lsb_algorithm.bits_per_channel // 8))
             
             # Встраиваем текст (как байты)
-            new_pixels = self.lsb_algorithm.embed_text(pixels, text_with_hash, password)
+            self.lsb_algorithm.embed_text(channels, text_with_hash, password)
             
             # Сохраняем результат
-            self.image_processor.save_image(output_path, new_pixels, self.image_processor.size)
+            self._save_channels(output_path, pixels, channels, layout)
             return True
             
         except Exception as e:
-            raise Exception(f"Ошибка встраивания сообщения: {str(e)}")
+            raise Exception(f"Ошибка встраивания сообщения: {str(e)}") from e
     
-    def extract_message(self, image_path: str, password: str = None) -> str:
+    def _check_output(self, image_path: str, output_path: str) -> None:
+        """Проверка до встраивания: маска подходит к режиму, а формат результата сохраняет все его каналы"""
+        if self._jpeg_output(output_path):
+            return
+        _, mode = self.image_processor.read_info(image_path)
+        check_output_mode(output_path, self.lsb_algorithm.layout_for(mode).mode)
+    
+    @staticmethod
+    def _check_message_size(algorithm: LSBAlgorithm, text_with_hash: str, max_bytes: int) -> None:
+        max_bytes = max(0, max_bytes)
+        data = text_with_hash.encode('utf-8')
+        # Сжатие пробуется только для не помещающегося без него сообщения
+        if len(data) > max_bytes and len(algorithm.compress(data)[0]) > max_bytes:
+            raise ValueError(f"Сообщение слишком длинное. Максимум: {max_bytes} байт ({max_bytes // 2} символов примерно)")
+    
+    def embed_file(self, image_path: str, source, output_path: str, password: str = None,
+                   chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """Встраивание произвольного файла (путь или двоичный файловый объект).
+        
+        Возвращает размер встроенной нагрузки в байтах.
+        """
         try:
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Файл не найден: {image_path}")
@@ -67,19 +135,219 @@ class Steganography:
             if not self.validate_image_format(image_path):
                 raise ValueError("Неподдерживаемый формат изображения. Используйте PNG или BMP")
             
-            # Загружаем изображение
+            self._check_output(image_path, output_path)
+            
+            if self._jpeg_output(output_path):
+                coefficients = self._load_coefficients(image_path)
+                channels = coefficients.channels()
+                header = self._embed_stream(self.jpeg_algorithm, channels, source, password, chunk_size)
+                self._save_coefficients(output_path, coefficients, channels)
+                return header.length
+            
+            if self._by_strips(image_path, output_path):
+                return self._embed_file_by_strips(image_path, source, output_path, password, chunk_size)
+            
+            pixels, channels, layout = self._load_channels(image_path)
+            header = self._embed_stream(self.lsb_algorithm, channels, source, password, chunk_size)
+            self._save_channels(output_path, pixels, channels, layout)
+            return header.length
+            
+        except Exception as e:
+            raise Exception(f"Ошибка встраивания файла: {str(e)}") from e
+    
+    @staticmethod
+    def _embed_stream(algorithm: LSBAlgorithm, channels, source, password: str, chunk_size: int):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return algorithm.embed_stream(channels, f, password, chunk_size)
+        return algorithm.embed_stream(channels, source, password, chunk_size)
+    
+    def extract_file(self, image_path: str, target, password: str = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """Извлечение файла в путь или двоичный файловый объект.
+        
+        Возвращает число записанных байт.
+        """
+        try:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Файл не найден: {image_path}")
+            
+            if isinstance(target, (str, os.PathLike)):
+                return self._extract_file_to_path(image_path, target, password, chunk_size)
+            return self._extract_file_to(image_path, target, password, chunk_size)
+            
+        except Exception as e:
+            raise Exception(f"Ошибка извлечения файла: {str(e)}") from e
+    
+    def _extract_file_to_path(self, image_path: str, target, password: str, chunk_size: int) -> int:
+        """Извлечение во временный файл рядом с target; target заменяется только при успехе"""
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = self._extract_file_to(image_path, f, password, chunk_size)
+            os.replace(temporary, target)
+            return written
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+    
+    def _extract_file_to(self, image_path: str, target, password: str, chunk_size: int) -> int:
+        if self._read_by_strips(image_path):
+            _, written = self._strips().extract(image_path, target, password, chunk_size)
+            return written
+        
+        algorithm, channels = self._read_channels(image_path)
+        return algorithm.extract_stream(channels, target, password, chunk_size)
+    
+    def _load_channels(self, image_path: str, writable: bool = True):
+        """Загрузка изображения без лишних преобразований режима.
+        
+        Возвращает массив пикселей, плоский массив каналов из маски и раскладку.
+        """
+        stage = self.instrumentation.stage
+        with stage('open'):
             self.image_processor.load_image(image_path)
-            self.image_processor.convert_to_rgb()
+        width, height = self.image_processor.size
+        with stage('convert', pixels=width * height):
+            self.image_processor.convert_to_native()
+        with stage('decode', pixels=width * height):
+            pixels = self.image_processor.get_channels(writable)
+        layout = self.lsb_algorithm.layout_for(self.image_processor.mode)
+        return pixels, layout.select(pixels), layout
+    
+    def _read_channels(self, image_path: str):
+        """Алгоритм и каналы для чтения: DCT-коэффициенты для JPEG, иначе пиксели"""
+        if is_jpeg(image_path):
+            with self.instrumentation.stage('jpeg_decode', bytes=os.path.getsize(image_path)):
+                channels = JPEGCoefficients.from_file(image_path).channels()
+            return self.jpeg_algorithm, channels
+        _, channels, _ = self._load_channels(image_path, writable=False)
+        return self.lsb_algorithm, channels
+    
+    @staticmethod
+    def _jpeg_output(output_path: str) -> bool:
+        return os.path.splitext(output_path)[1].lower() in JPEG_EXTENSIONS
+    
+    def _load_coefficients(self, image_path: str) -> JPEGCoefficients:
+        """Коэффициенты JPEG-контейнера; остальные изображения сначала кодируются в JPEG"""
+        stage = self.instrumentation.stage
+        if is_jpeg(image_path):
+            with stage('jpeg_decode', bytes=os.path.getsize(image_path)):
+                return JPEGCoefficients.from_file(image_path)
+        with stage('open'):
+            self.image_processor.load_image(image_path)
+        width, height = self.image_processor.size
+        with stage('jpeg_decode', pixels=width * height):
+            options = self.image_processor.save_options('JPEG')
+            return JPEGCoefficients.from_image(self.image_processor.image, **options)
+    
+    def _save_coefficients(self, output_path: str, coefficients: JPEGCoefficients, channels) -> None:
+        with self.instrumentation.stage('jpeg_encode', bytes=len(coefficients.source)):
+            coefficients.save(output_path, channels, self.image_processor.keep_metadata)
+    
+    def _save_channels(self, output_path: str, pixels, channels, layout) -> None:
+        width, height = self.image_processor.size
+        with self.instrumentation.stage('encode', pixels=width * height):
+            layout.restore(pixels, channels)
+            self.image_processor.save_channels(output_path, pixels, self.image_processor.size,
+                                               self.image_processor.mode)
+    
+    def _embed_file_by_strips(self, image_path: str, source, output_path: str, password: str,
+                              chunk_size: int) -> int:
+        """Встраивание файла по полосам; размер источника определяется заранее"""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return self._embed_file_by_strips(image_path, f, output_path, password, chunk_size)
+        
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+        header = self._embed_by_strips(image_path, output_path, source, size, password, FLAG_FILE, chunk_size)
+        return header.length
+    
+    def _new_strip_processor(self, strip_height: int = DEFAULT_STRIP_HEIGHT) -> StripProcessor:
+        return StripProcessor(self.lsb_algorithm, strip_height, self.image_processor.save_profile,
+                              self.image_processor.keep_metadata)
+    
+    def _strips(self) -> StripProcessor:
+        return self.strip_processor or self._new_strip_processor()
+    
+    @staticmethod
+    def _mapped_output(image_path: str, output_path: str) -> bool:
+        """Можно ли встроить данные прямо в копию несжатого BMP/TIFF"""
+        source_format = MAPPED_FORMATS.get(os.path.splitext(image_path)[1].lower())
+        output_format = MAPPED_FORMATS.get(os.path.splitext(output_path)[1].lower())
+        return (source_format is not None and source_format == output_format
+                and MappedImage.layout_of(image_path) is not None)
+    
+    def _rgb_layout(self, image_path: str) -> bool:
+        """Полосы и mmap работают только с тремя каналами RGB"""
+        _, mode = self.image_processor.read_info(image_path)
+        return mode == 'RGB' and self.lsb_algorithm.layout_for(mode).full
+    
+    def _strip_source(self, image_path: str) -> bool:
+        """Полосами читаются только несжатые BMP/TIFF; сжатые изображения декодируются целиком обычным путем"""
+        return MappedImage.layout_of(image_path) is not None and self._rgb_layout(image_path)
+    
+    def _by_strips(self, image_path: str, output_path: str) -> bool:
+        """Встраивать ли полосами вместо загрузки изображения целиком"""
+        if not self._strip_source(image_path):
+            return False
+        if self.strip_processor is not None:
+            return True
+        # Разброс требует произвольного доступа ко всем каналам
+        return not self.lsb_algorithm.scatter and self._mapped_output(image_path, output_path)
+    
+    def _can_read_strips(self, image_path: str) -> bool:
+        return not is_jpeg(image_path) and self._strip_source(image_path)
+    
+    def _read_by_strips(self, image_path: str) -> bool:
+        """Извлекать ли полосами; старый формат и разброс читаются из изображения целиком"""
+        if not self._can_read_strips(image_path):
+            return False
+        header = self._strips().read_header(image_path)
+        return header is not None and not header.flags & FLAG_SCATTERED
+    
+    def _embed_by_strips(self, image_path: str, output_path: str, source, size: int, password: str = None,
+                         flags: int = 0, chunk_size: int = STREAM_CHUNK_SIZE):
+        strips = self._strips()
+        if self._mapped_output(image_path, output_path):
+            return strips.embed_mapped(image_path, output_path, source, size, password, flags, chunk_size)
+        return strips.embed(image_path, output_path, source, size, password, flags, chunk_size)
+    
+    def extract_message(self, image_path: str, password: str = None) -> str:
+        try:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Файл не найден: {image_path}")
             
-            # Получаем пиксели
-            pixels = self.image_processor.get_pixels()
+            if not self.validate_image_format(image_path):
+                raise ValueError("Неподдерживаемый формат изображения. Используйте PNG или BMP")
             
-            # Извлекаем текст
-            extracted_text = self.lsb_algorithm.extract_text(pixels, password)
+            if self._read_by_strips(image_path):
+                header = self._strips().read_header(image_path)
+                extracted_text = self._extract_text_by_strips(image_path, header, password)
+            else:
+                # Загружаем изображение
+                algorithm, pixels = self._read_channels(image_path)
+                
+                # По флагам заголовка сразу выбираем путь, без пробной расшифровки
+                header = algorithm.read_header(pixels)
+                if header is not None:
+                    self._check_text_header(header, password)
+                    if not header.flags & FLAG_ENCRYPTED:
+                        password = None
+                
+                # Извлекаем текст
+                extracted_text = algorithm.extract_text(pixels, password)
             
             if not extracted_text:
                 raise ValueError("Сообщение не найдено. Возможно, неверный пароль или изображение не содержит скрытых данных")
             
+            # Целостность нагрузки AES-GCM уже проверена тегом, хеша в ней нет
+            if header is not None and header.flags & FLAG_AEAD:
+                return extracted_text
+            
             # Проверяем целостность
             if ':' in extracted_text:
                 hash_part, message = extracted_text.split(':', 1)
@@ -94,7 +362,75 @@ class Steganography:
                 return extracted_text
             
         except Exception as e:
-            raise Exception(f"Ошибка извлечения сообщения: {str(e)}")
+            raise Exception(f"Ошибка извлечения сообщения: {str(e)}") from e
+    
+    @staticmethod
+    def _check_text_header(header, password: str = None) -> None:
+        """Проверки заголовка перед извлечением текста"""
+        if header.flags & FLAG_FILE:
+            raise ValueError("Изображение содержит файл, а не текст. Используйте извлечение файла")
+        if header.flags & FLAG_ENCRYPTED and not password:
+            raise ValueError("Сообщение зашифровано. Укажите пароль для извлечения")
+    
+    def _extract_text_by_strips(self, image_path: str, header, password: str = None) -> str:
+        strips = self._strips()
+        self._check_text_header(header, password)
+        if not header.flags & FLAG_ENCRYPTED:
+            password = None
+        
+        buffer = io.BytesIO()
+        strips.extract(image_path, buffer, password)
+        try:
+            return buffer.getvalue().decode('utf-8')
+        except UnicodeDecodeError:
+            return ""
+    
+    def is_encrypted(self, image_path: str) -> Optional[bool]:
+        """Проверяет по заголовку, зашифровано ли сообщение.
+        
+        Возвращает None, если заголовок не найден (старый формат или нет данных).
+        """
+        try:
+            if self._can_read_strips(image_path):
+                header = self._strips().read_header(image_path)
+            else:
+                algorithm, channels = self._read_channels(image_path)
+                header = algorithm.read_header(channels)
+            return None if header is None else bool(header.flags & FLAG_ENCRYPTED)
+        except Exception as e:
+            raise Exception(f"Ошибка чтения заголовка: {str(e)}") from e
+    
+    def probe(self, image_path: str) -> dict:
+        """Быстрая проверка наличия нагрузки по заголовку контейнера.
+        
+        Декодируются только первые строки изображения (в JPEG - только первые
+        коэффициенты, без обратного DCT), ключ не вычисляется. Число битов на
+        канал определяется по заголовку; маска каналов должна совпадать со
+        встраиванием. Возвращает {'found': False} или поля заголовка.
+        """
+        try:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Файл не найден: {image_path}")
+            
+            if is_jpeg(image_path):
+                with self.instrumentation.stage('jpeg_decode', bytes=os.path.getsize(image_path)):
+                    channels = JPEGCoefficients.from_file(image_path, PROBE_CHANNELS).channels()
+            else:
+                _, mode = self.image_processor.read_info(image_path)
+                layout = self.lsb_algorithm.layout_for(mode)
+                pixel_count = -(-PROBE_CHANNELS // layout.channels_per_pixel)
+                with self.instrumentation.stage('decode', pixels=pixel_count):
+                    pixels, mode = self.image_processor.read_head(image_path, pixel_count)
+                channels = self.lsb_algorithm.layout_for(mode).select(pixels)[:PROBE_CHANNELS]
+            
+            header = LSBAlgorithm.probe_header(channels)
+            if header is None:
+                return {'found': False}
+            result = {'found': True}
+            result.update(header.describe())
+            return result
+        except Exception as e:
+            raise Exception(f"Ошибка чтения заголовка: {str(e)}") from e
     
     def calculate_capacity(self, pixels: List) -> int:
         """Рассчитывает вместимость в СИМВОЛАХ (для обратной совместимости)"""
@@ -102,8 +438,8 @@ class Steganography:
         width = len(pixels[0])
         total_bits = height * width * 3 * self.lsb_algorithm.bits_per_channel
         total_bytes = total_bits // 8
-        # Вычитаем место для маркера конца и небольшого запаса
-        return (total_bytes - 4) // 2  # Примерно 2 байта на символ UTF-8
+        # Вычитаем место для заголовка контейнера и кода коррекции ошибок
+        return self.lsb_algorithm.payload_capacity(total_bytes) // 2  # Примерно 2 байта на символ UTF-8
     
     def calculate_capacity_bytes(self, pixels: List) -> int:
         """Рассчитывает вместимость в БАЙТАХ (более точно)"""
@@ -111,28 +447,38 @@ class Steganography:
         width = len(pixels[0])
         total_bits = height * width * 3 * self.lsb_algorithm.bits_per_channel
         total_bytes = total_bits // 8
-        # Вычитаем место для маркера конца сообщения (2 байта)
-        return total_bytes - 2
+        # Вычитаем место для заголовка контейнера и кода коррекции ошибок
+        return self.lsb_algorithm.payload_capacity(total_bytes)
+    
+    def calculate_jpeg_capacity(self, image_path: str) -> int:
+        """Вместимость JPEG-результата в байтах: число AC-коэффициентов с |v| >= 2.
+        
+        Требует разбора сжатых данных (без обратного DCT), поэтому медленнее get_image_info.
+        """
+        try:
+            coefficients = self._load_coefficients(image_path)
+            return self.jpeg_algorithm.payload_capacity(coefficients.capacity_bits() // 8)
+        except Exception as e:
+            raise Exception(f"Ошибка расчета вместимости JPEG: {str(e)}") from e
     
     def get_image_info(self, image_path: str) -> dict:
         """Получает информацию об изображении"""
         try:
-            self.image_processor.load_image(image_path)
-            self.image_processor.convert_to_rgb()
-            pixels = self.image_processor.get_pixels()
-            
-            width, height = self.image_processor.size
-            max_chars = self.calculate_capacity(pixels)
-            max_bytes = self.calculate_capacity_bytes(pixels)
+            # Размер читается из заголовка файла, пиксели не декодируются
+            (width, height), mode = self.image_processor.read_info(image_path)
+            layout = self.lsb_algorithm.layout_for(mode)
+            max_bytes = self.lsb_algorithm.calculate_max_bytes(width, height, layout.channels_per_pixel)
             
             return {
                 'width': width,
                 'height': height,
                 'pixels': width * height,
-                'max_chars': max_chars,
+                'mode': mode,
+                'max_chars': max_bytes // 2,
+                'channels': layout.mask,
                 'max_bytes': max_bytes,
                 'bits_per_channel': self.lsb_algorithm.bits_per_channel,
                 'format': os.path.splitext(image_path)[1].upper()
             }
         except Exception as e:
-            raise Exception(f"Ошибка получения информации: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Ошибка получения информации: {str(e)}") from e
\ No newline at end of file
@@ -0,0 +1,284 @@
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+import os
+import struct
+import zlib
+import numpy as np
+from PIL import Image
+from bit_stream import LSBReader, LSBWriter
+from lsb_algorithm import LSBAlgorithm, STREAM_CHUNK_SIZE
+from mapped_image import MappedImage
+from image_processor import SAVE_PROFILES, output_format
+from payload_header import PayloadHeader
+
+# Высота полосы по умолчанию (строк пикселей)
+DEFAULT_STRIP_HEIGHT = 256
+
+class StripReader:
+    """Чтение несжатого BMP/TIFF горизонтальными полосами RGB через mmap.
+
+    Пиковая память определяется высотой полосы. Сжатые форматы (PNG,
+    сжатый TIFF) PIL декодирует только целиком, поэтому полосами не
+    читаются: для них используется обычная обработка.
+    """
+
+    def __init__(self, image_path: str, strip_height: int = DEFAULT_STRIP_HEIGHT):
+        if strip_height < 1:
+            raise ValueError("Высота полосы должна быть положительной")
+        self.layout = MappedImage.layout_of(image_path)
+        if self.layout is None:
+            raise ValueError("Полосами читаются только несжатые BMP и TIFF")
+        self.image_path = image_path
+        self.strip_height = strip_height
+        with Image.open(image_path) as image:
+            self.size = image.size
+            self.icc_profile = image.info.get('icc_profile')
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        with MappedImage(self.image_path) as mapped:
+            yield from mapped.strips(self.strip_height)
+
+
+class PNGStripWriter:
+    """Потоковая запись PNG по полосам без сборки изображения в памяти"""
+
+    _COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+    def __init__(self, path: str, width: int, height: int, channels: int = 3, compress_level: int = 6,
+                 icc_profile: bytes = None):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, 'wb')
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, self._COLOR_TYPES[channels], 0, 0, 0))
+        if icc_profile:
+            # Имя профиля, метод сжатия 0, профиль в zlib
+            self._chunk(b'iCCP', b'ICC Profile\x00\x00' + zlib.compress(icc_profile))
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, rows: np.ndarray) -> None:
+        """Запись очередной полосы (строки, ширина, каналы)"""
+        rows = rows.reshape(rows.shape[0], -1)
+        # Фильтр Sub: разность с соседним пикселем слева, байт типа фильтра 1
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:self.channels + 1] = rows[:, :self.channels]
+        np.subtract(rows[:, self.channels:], rows[:, :-self.channels], out=filtered[:, self.channels + 1:])
+
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Записано {self.rows_written} строк из {self.height}")
+            self._chunk(b'IDAT', self._compressor.flush())
+            self._chunk(b'IEND', b'')
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+            return False
+        self.close()
+        return False
+
+
+class StripProcessor:
+    """Встраивание и извлечение по полосам изображения с ограниченной памятью"""
+
+    def __init__(self, lsb_algorithm: LSBAlgorithm, strip_height: int = DEFAULT_STRIP_HEIGHT,
+                 save_profile: str = 'default', keep_metadata: bool = True):
+        self.lsb_algorithm = lsb_algorithm
+        self.strip_height = strip_height
+        self.save_profile = save_profile
+        self.keep_metadata = keep_metadata
+
+    @staticmethod
+    def channel_count(size: Tuple[int, int]) -> int:
+        width, height = size
+        return width * height * 3
+
+    @classmethod
+    def _check_capacity(cls, header: PayloadHeader, size: Tuple[int, int]) -> None:
+        capacity = header.capacity(cls.channel_count(size))
+        if header.length > capacity:
+            raise ValueError(f"Данные не помещаются в изображение: {header.length} из {capacity} байт")
+
+    def embed(self, image_path: str, output_path: str, source: BinaryIO, size: int,
+              password: str = None, flags: int = 0, chunk_size: int = STREAM_CHUNK_SIZE) -> PayloadHeader:
+        """Встраивание нагрузки известного размера с записью результата по полосам"""
+        if output_format(output_path) != 'PNG':
+            raise ValueError("При обработке полосами результат сохраняется только в PNG")
+        reader = StripReader(image_path, self.strip_height)
+        header, chunks = self.lsb_algorithm.container_stream(source, size, password, flags, chunk_size)
+        self._check_capacity(header, reader.size)
+
+        stage = self.lsb_algorithm.instrumentation.stage
+        filler = _StripFiller(header, chunks, self.lsb_algorithm)
+        width, height = reader.size
+        try:
+            # Профиль с оптимизацией размера соответствует максимальному сжатию
+            compress_level = SAVE_PROFILES[self.save_profile]['PNG'].get('compress_level', 9)
+            icc_profile = reader.icc_profile if self.keep_metadata else None
+            with PNGStripWriter(output_path, width, height, compress_level=compress_level,
+                                icc_profile=icc_profile) as sink:
+                for _, strip in self._decoded(reader):
+                    filler.fill(strip)
+                    with stage('encode', pixels=strip.shape[0] * strip.shape[1]):
+                        sink.write(strip)
+            filler.finish()
+        except Exception:
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            raise
+        return header
+
+    def embed_mapped(self, image_path: str, output_path: str, source: BinaryIO, size: int,
+                     password: str = None, flags: int = 0,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> PayloadHeader:
+        """Встраивание в несжатый BMP/TIFF без декодирования.
+
+        Файл копируется в output_path (или меняется на месте, если пути
+        совпадают), младшие биты правятся через mmap только в полосах,
+        занятых данными.
+        """
+        header, chunks = self.lsb_algorithm.container_stream(source, size, password, flags, chunk_size)
+        with Image.open(image_path) as image:
+            self._check_capacity(header, image.size)
+
+        in_place = os.path.abspath(image_path) == os.path.abspath(output_path)
+        stage = self.lsb_algorithm.instrumentation.stage
+        filler = _StripFiller(header, chunks, self.lsb_algorithm)
+        try:
+            with MappedImage.copy(image_path, output_path) as mapped:
+                for y0, strip in self._decoded(mapped.strips(self.strip_height)):
+                    filler.fill(strip)
+                    with stage('encode', pixels=strip.shape[0] * strip.shape[1]):
+                        mapped.write_rows(y0, strip)
+                    if filler.done:
+                        break
+            filler.finish()
+        except Exception:
+            if not in_place and os.path.exists(output_path):
+                os.unlink(output_path)
+            raise
+        return header
+
+    def _decoded(self, strips: Iterable[Tuple[int, np.ndarray]]) -> Iterator[Tuple[int, np.ndarray]]:
+        """Полосы с замером декодирования каждой"""
+        stage = self.lsb_algorithm.instrumentation.stage
+        iterator = iter(strips)
+        while True:
+            with stage('decode') as timed:
+                item = next(iterator, None)
+                if item is not None:
+                    timed.add(pixels=item[1].shape[0] * item[1].shape[1])
+            if item is None:
+                return
+            yield item
+
+    def read_header(self, image_path: str) -> Optional[PayloadHeader]:
+        """Заголовок контейнера по первым полосам изображения"""
+        def open_reader(bits_per_channel):
+            return _StripChannelReader(iter(StripReader(image_path, self.strip_height)), bits_per_channel)
+        return self.lsb_algorithm.open_container(open_reader)[0]
+
+    def extract(self, image_path: str, target: BinaryIO, password: str = None,
+                chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[PayloadHeader, int]:
+        """Извлечение нагрузки; читаются только полосы, занятые данными"""
+        strips = StripReader(image_path, self.strip_height)
+
+        def open_reader(bits_per_channel):
+            return _StripChannelReader(self._decoded(iter(strips)), bits_per_channel, self.lsb_algorithm.workers)
+        return self.lsb_algorithm.read_container(open_reader, self.channel_count(strips.size), target,
+                                                 password, chunk_size)
+
+
+class _StripFiller:
+    """Запись заголовка и потока нагрузки в последовательные полосы каналов.
+
+    Заголовок занимает первые header_channels каналов (возможно, нескольких
+    полос) со своей глубиной, нагрузка пишется в каналы после него.
+    """
+
+    def __init__(self, header: PayloadHeader, chunks: Iterator[bytes], lsb_algorithm: LSBAlgorithm):
+        self._chunks = chunks
+        self._header_writer = LSBWriter(np.empty(0, dtype=np.uint8), header.header_bits_per_channel, strict=False)
+        self._header_writer.write(header.pack())
+        self._header_channels = header.header_channels
+        self._writer = LSBWriter(np.empty(0, dtype=np.uint8), header.bits_per_channel, strict=False,
+                                 workers=lsb_algorithm.workers)
+        self._stage = lsb_algorithm.instrumentation.stage
+        self._exhausted = False
+        self.done = False
+
+    def fill(self, strip: np.ndarray) -> None:
+        """Запись очередной порции данных в полосу (изменяется на месте)"""
+        if self.done:
+            return
+        channels = strip.reshape(-1)
+        if self._header_channels:
+            used = min(self._header_channels, channels.size)
+            self._header_writer.rebind(channels[:used])
+            self._header_channels -= used
+            channels = channels[used:]
+        writer = self._writer
+        writer.rebind(channels)
+        while not self._exhausted and writer.position < writer.channels.size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._exhausted = True
+            else:
+                with self._stage('embed', bytes=len(chunk)):
+                    writer.write(chunk)
+        if self._exhausted:
+            writer.flush()
+            self.done = not writer.pending_bits and not self._header_writer.pending_bits
+
+    def finish(self) -> None:
+        """Проверка, что все данные записаны"""
+        leftover = not self._exhausted and any(len(chunk) for chunk in self._chunks)
+        if leftover or self._writer.pending_bits or self._header_writer.pending_bits:
+            raise ValueError("Данные не помещаются в изображение")
+
+
+class _StripChannelReader:
+    """Последовательное чтение младших битов, переходящее с полосы на полосу"""
+
+    def __init__(self, strips: Iterator[Tuple[int, np.ndarray]], bits_per_channel: int, workers: int = 1):
+        self._strips = strips
+        self._reader = LSBReader(np.empty(0, dtype=np.uint8), bits_per_channel, workers=workers)
+
+    @property
+    def bits_per_channel(self) -> int:
+        return self._reader.bits_per_channel
+
+    def set_bits_per_channel(self, bits_per_channel: int) -> None:
+        self._reader.set_bits_per_channel(bits_per_channel)
+
+    def read(self, count: int) -> bytes:
+        result = bytearray()
+        while len(result) < count:
+            result += self._reader.read(count - len(result))
+            if len(result) < count:
+                strip = next(self._strips, None)
+                if strip is None:
+                    break
+                self._reader.rebind(strip[1].reshape(-1))
+        return bytes(result)
@@ -1,13 +1,34 @@
 import pytest
 import tempfile
+import json
+import io
+import re
+import numpy as np
 import os
-from PIL import Image
+from PIL import Image, ImageFilter
 
 # Добавляем путь к проекту для импорта модулей
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from steganography import Steganography
+from lsb_algorithm import LSBAlgorithm, PROBE_CHANNELS
+from image_processor import ImageProcessor
+from cli import run_cli
+from key_cache import KeyCache
+import key_cache
+from bit_stream import LSBReader, LSBWriter
+import bit_stream
+import strip_processor
+from scatter import KeyedPermutation
+from jpeg_engine import JPEGCoefficients
+import benchmark
+from instrumentation import StageCollector, NULL_INSTRUMENTATION, merge_summaries
+from ecc import ReedSolomonCodec, EccEncoder, ecc_encode, ecc_decode
+from compression import compress_payload, compress_stream, decompress_payload, available_codecs
+from payload_header import PayloadHeader, FLAG_COMPRESSED, FLAG_FILE
+from channel_layout import ChannelLayout
+import steganalysis
 
 
 class TestSteganographyBasic:
@@ -166,6 +187,1285 @@ class TestSteganographyBasic:
                 os.unlink(output_path)
 
 
+
+    
+    def test_embed_and_extract_binary_file(self):
+        """Произвольный двоичный файл встраивается и извлекается потоково"""
+        payload = bytes(range(256)) * 8 + b'\x00' * 100
+        output_path = tempfile.NamedTemporaryFile(suffix='.png', delete=False).name
+        stego = Steganography(bits_per_channel=2, kdf_iterations=1000)
+        
+        try:
+            written = stego.embed_file(self.test_image_path, io.BytesIO(payload), output_path,
+                                       password="пароль", chunk_size=100)
+            assert written > len(payload)
+            
+            target = io.BytesIO()
+            stego.extract_file(output_path, target, password="пароль", chunk_size=64)
+            assert target.getvalue() == payload
+            
+            with pytest.raises(Exception, match="содержит файл"):
+                stego.extract_message(output_path, "пароль")
+        finally:
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+
+class TestImageProcessor:
+    """Тесты буферного доступа к пикселям"""
+    
+    def test_channels_roundtrip(self):
+        """get_channels/save_channels сохраняют пиксели без изменений"""
+        processor = ImageProcessor()
+        path = tempfile.NamedTemporaryFile(suffix='.png', delete=False).name
+        output_path = tempfile.NamedTemporaryFile(suffix='.png', delete=False).name
+        try:
+            data = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+            Image.fromarray(data, 'RGB').save(path)
+            
+            processor.load_image(path)
+            channels = processor.get_channels()
+            assert channels.shape == (4, 5, 3)
+            assert np.array_equal(channels, data)
+            assert not processor.get_channels(writable=False).flags.writeable
+            
+            channels[0, 0, 0] = 255
+            processor.save_channels(output_path, channels, processor.size)
+            assert Image.open(output_path).getpixel((0, 0)) == (255, 1, 2)
+        finally:
+            for p in (path, output_path):
+                if os.path.exists(p):
+                    os.unlink(p)
+
+class TestLSBAlgorithm:
+    """Тесты векторного ядра LSB"""
+    
+    @pytest.mark.parametrize("bits_per_channel", [1, 2, 3, 4])
+    def test_embed_extract_bytes_roundtrip(self, bits_per_channel):
+        """Байты (включая нулевые) читаются обратно из плоского массива каналов"""
+        lsb = LSBAlgorithm(bits_per_channel)
+        rng = np.random.default_rng(bits_per_channel)
+        channels = rng.integers(0, 256, size=3000, dtype=np.uint8)
+        original = channels.copy()
+        data = bytes(rng.integers(0, 256, size=200, dtype=np.uint8)) + b'\x00\x00\x01'
+        
+        lsb.embed_bytes(channels, data)
+        
+        assert lsb.extract_bytes(channels, len(data)) == data
+        # Старшие биты каналов не должны меняться
+        keep = 0xFF ^ ((1 << bits_per_channel) - 1)
+        assert np.array_equal(channels & keep, original & keep)
+    
+    def test_channel_layout(self):
+        """Биты пишутся старшим вперёд в каналы по порядку"""
+        lsb = LSBAlgorithm(2)
+        channels = np.zeros(6, dtype=np.uint8)
+        
+        lsb.embed_bytes(channels, b'\xb4')
+        
+        assert channels.tolist() == [2, 3, 1, 0, 0, 0]
+    
+    def test_payload_with_zero_bytes(self):
+        """Данные с нулевыми байтами извлекаются по длине из заголовка"""
+        lsb = LSBAlgorithm(1)
+        pixels = np.full((20, 20, 3), 200, dtype=np.uint8)
+        data = b'\x00\x00abc\x00\x00'
+        
+        new_pixels = lsb.embed_data(pixels, data)
+        
+        assert lsb.read_header(new_pixels.reshape(-1)).length == len(data)
+        assert lsb.extract_data(new_pixels) == data
+
+    
+    @pytest.mark.parametrize("bits_per_channel", [1, 3])
+    def test_stream_chunks_match_single_write(self, bits_per_channel):
+        """Запись и чтение кусками совпадают с однократной операцией"""
+        rng = np.random.default_rng(7)
+        channels = rng.integers(0, 256, size=4000, dtype=np.uint8)
+        expected = channels.copy()
+        data = rng.integers(0, 256, size=400, dtype=np.uint8).tobytes()
+        
+        writer = LSBWriter(channels, bits_per_channel)
+        for start in range(0, len(data), 7):
+            writer.write(data[start:start + 7])
+        writer.flush()
+        LSBAlgorithm(bits_per_channel).embed_bytes(expected, data)
+        
+        assert np.array_equal(channels, expected)
+        reader = LSBReader(channels, bits_per_channel)
+        assert b''.join(reader.read(5) for _ in range(80)) == data
+
+
+
+class TestScatter:
+    """Тесты разброса нагрузки по ключевой перестановке"""
+    
+    @pytest.mark.parametrize('size', [1, 2, 5, 1000, 4099])
+    def test_permutation_is_bijection(self, size):
+        """Перестановка взаимно однозначна, а частичный образ совпадает с полным"""
+        permutation = KeyedPermutation(b'key', size)
+        image = permutation(np.arange(size))
+        assert sorted(image.tolist()) == list(range(size))
+        assert np.array_equal(permutation(np.arange(size // 2, size)), image[size // 2:])
+    
+    @pytest.mark.parametrize('bits_per_channel', [1, 3])
+    def test_scattered_roundtrip(self, tmp_path, bits_per_channel):
+        """Разбросанные сообщение и файл извлекаются, данные не лежат подряд"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (80, 80), color='gray').save(cover)
+        stego = Steganography(bits_per_channel=bits_per_channel, scatter=True)
+        message_path, file_path = str(tmp_path / 'message.png'), str(tmp_path / 'file.png')
+        data = bytes(range(256)) * 4
+        
+        stego.embed_message(str(cover), 'Разброс', message_path, 'pass')
+        stego.embed_file(str(cover), io.BytesIO(data), file_path, 'pass')
+        
+        assert Steganography(bits_per_channel=bits_per_channel).extract_message(message_path, 'pass') == 'Разброс'
+        target = io.BytesIO()
+        Steganography(bits_per_channel=bits_per_channel).extract_file(file_path, target, 'pass')
+        assert target.getvalue() == data
+        
+        changed = np.flatnonzero(np.asarray(Image.open(message_path)).reshape(-1) != 128)
+        assert changed.max() > 80 * 80 * 3 // 2
+    
+    def test_scattered_wrong_password(self, tmp_path):
+        """С неверным паролем разбросанное сообщение не извлекается"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (60, 60), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        Steganography(scatter=True).embed_message(str(cover), 'Секрет', output, 'pass')
+        
+        with pytest.raises(Exception):
+            Steganography().extract_message(output, 'wrong')
+
+    def test_scatter_requires_password(self, tmp_path, monkeypatch):
+        """Разброс без пароля отклоняется, а не встраивается последовательно"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (60, 60), color='gray').save(cover)
+        output = tmp_path / 'out.png'
+        stego = Steganography(scatter=True)
+
+        with pytest.raises(Exception, match="требует пароля"):
+            stego.embed_message(str(cover), 'Секрет', str(output))
+        with pytest.raises(Exception, match="требует пароля"):
+            stego.embed_file(str(cover), io.BytesIO(b'data'), str(output))
+        assert not output.exists()
+
+        monkeypatch.delenv('STEGO_TEST_PASSWORD', raising=False)
+        with pytest.raises(SystemExit):
+            run_cli(['embed', '--input', str(cover), '--output-dir', str(tmp_path / 'out'), '--message', 'x',
+                     '--scatter', '--password-env', 'STEGO_TEST_PASSWORD', '--quiet'])
+
+class TestProgress:
+    """Тесты обратного вызова прогресса"""
+    
+    def test_progress_reaches_total(self, tmp_path):
+        """Прогресс извлечения файла доходит до размера нагрузки"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (64, 64), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        Steganography(compression='none').embed_file(str(cover), io.BytesIO(b'x' * 1000), output)
+        
+        calls = []
+        stego = Steganography(progress=lambda done, total: calls.append((done, total)))
+        stego.extract_file(output, io.BytesIO(), chunk_size=256)
+        
+        assert len(calls) == 4
+        assert calls[-1] == (1000, 1000)
+    
+    def test_exception_in_progress_cancels(self, tmp_path):
+        """Исключение из обратного вызова прерывает встраивание, файл не создается"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (64, 64), color='gray').save(cover)
+        output = tmp_path / 'out.png'
+        
+        def cancel(done, total):
+            raise RuntimeError("Операция отменена")
+        
+        with pytest.raises(Exception, match="отменена"):
+            Steganography(progress=cancel).embed_message(str(cover), 'текст', str(output))
+        assert not output.exists()
+
+class TestKeyCache:
+    """Тесты кеша производных ключей"""
+    
+    def test_batch_extraction_derives_key_once(self, monkeypatch):
+        """Повторное шифрование и расшифрование одним паролем не повторяет KDF"""
+        calls = []
+        real_derive = key_cache.derive_key
+        monkeypatch.setattr(key_cache, 'derive_key',
+                            lambda *args: calls.append(args) or real_derive(*args))
+        lsb = LSBAlgorithm(1, kdf_iterations=1000, key_cache=KeyCache())
+        
+        images = [lsb.embed_text(np.zeros((30, 30, 3), dtype=np.uint8), f"сообщение {i}", "пароль")
+                  for i in range(3)]
+        
+        assert [lsb.extract_text(image, "пароль") for image in images] == \
+            ["сообщение 0", "сообщение 1", "сообщение 2"]
+        assert len(calls) == 1
+        assert calls[0][2] == 1000
+    
+    def test_eviction_zeroizes_key(self):
+        """Вытесненный ключ затирается в кеше, а выданная копия остается целой"""
+        cache = KeyCache(max_entries=1)
+        first = cache.get("пароль", b'\x01' * 16, 10)
+        stored = next(iter(cache._keys.values()))
+        assert any(first) and stored == first
+        
+        cache.get("пароль", b'\x02' * 16, 10)
+        
+        assert len(cache) == 1
+        assert not any(stored)
+        assert first == cache.get("пароль", b'\x01' * 16, 10)
+        
+        in_use = cache.get("пароль", b'\x02' * 16, 10)
+        cache.clear()
+        assert any(in_use)
+    
+    def test_wrong_password_rejected_by_key_check(self):
+        """Неверный пароль отсекается по контрольному значению до расшифровки"""
+        lsb = LSBAlgorithm(1, kdf_iterations=1000, key_cache=KeyCache())
+        image = lsb.embed_text(np.zeros((30, 30, 3), dtype=np.uint8), "секрет", "верный")
+        
+        with pytest.raises(ValueError, match="^Неверный пароль$"):
+            lsb.extract_text(image, "неверный")
+        with pytest.raises(ValueError, match="требуется пароль"):
+            lsb.extract_text(image)
+    
+    def test_plain_payload_ignores_password(self, monkeypatch):
+        """Для незашифрованного сообщения KDF не вызывается"""
+        monkeypatch.setattr(key_cache, 'derive_key', lambda *args: pytest.fail("KDF не нужен"))
+        lsb = LSBAlgorithm(1)
+        image = lsb.embed_text(np.zeros((30, 30, 3), dtype=np.uint8), "открыто")
+        
+        assert lsb.extract_text(image, "пароль") == "открыто"
+
+class TestStripProcessing:
+    """Тесты обработки изображения полосами"""
+    
+    @pytest.mark.parametrize('suffix, save_options', [
+        ('.bmp', {}),
+        ('.tiff', {'tiffinfo': {278: 7}}),
+        ('.png', {}),
+    ])
+    def test_strips_match_full_image(self, tmp_path, suffix, save_options):
+        """Результат по полосам совпадает с обработкой изображения целиком"""
+        rng = np.random.default_rng(3)
+        cover = tmp_path / f'cover{suffix}'
+        Image.fromarray(rng.integers(0, 256, (45, 37, 3), dtype=np.uint8)).save(cover, **save_options)
+        data = bytes(rng.integers(0, 256, 1500, dtype=np.uint8))
+        
+        full, strips = tmp_path / 'full.png', tmp_path / 'strips.png'
+        Steganography(bits_per_channel=3).embed_file(str(cover), io.BytesIO(data), str(full))
+        Steganography(bits_per_channel=3, strip_height=4).embed_file(str(cover), io.BytesIO(data), str(strips))
+        
+        assert np.array_equal(np.asarray(Image.open(full)), np.asarray(Image.open(strips)))
+        target = io.BytesIO()
+        Steganography(bits_per_channel=3, strip_height=5).extract_file(str(strips), target)
+        assert target.getvalue() == data
+    
+    @pytest.mark.parametrize('suffix, save_options', [
+        ('.png', {}),
+        ('.tiff', {'compression': 'tiff_adobe_deflate'}),
+    ])
+    def test_compressed_cover_uses_full_decode(self, tmp_path, monkeypatch, suffix, save_options):
+        """Сжатые изображения полосами не читаются: память не ограничена полосой, используется обычный путь"""
+        cover = tmp_path / f'cover{suffix}'
+        Image.fromarray(np.random.default_rng(8).integers(0, 256, (30, 20, 3), dtype=np.uint8)).save(
+            cover, **save_options)
+        with pytest.raises(ValueError, match="несжатые"):
+            strip_processor.StripReader(str(cover), 4)
+
+        def forbidden(self, *args, **kwargs):
+            raise AssertionError("Сжатое изображение не должно читаться полосами")
+        monkeypatch.setattr(strip_processor.StripReader, '__init__', forbidden)
+        output = str(tmp_path / 'out.png')
+        stego = Steganography(strip_height=4)
+        stego.embed_file(str(cover), io.BytesIO(b'data' * 50), output)
+        target = io.BytesIO()
+        stego.extract_file(output, target)
+        assert target.getvalue() == b'data' * 50
+
+    def test_strip_message_with_password(self, tmp_path):
+        """Зашифрованное сообщение встраивается и извлекается по полосам"""
+        cover = tmp_path / 'cover.bmp'
+        Image.new('RGB', (80, 60), color='navy').save(cover)
+        stego = Steganography(bits_per_channel=2, strip_height=7)
+        output = str(tmp_path / 'out.png')
+        
+        stego.embed_message(str(cover), 'Сообщение по полосам', output, 'pass')
+        
+        assert stego.extract_message(output, 'pass') == 'Сообщение по полосам'
+        assert Steganography(bits_per_channel=2).extract_message(output, 'pass') == 'Сообщение по полосам'
+        with pytest.raises(Exception):
+            stego.extract_message(output)
+
+class TestDepthDetection:
+    """Тесты определения числа битов на канал по заголовку"""
+    
+    @pytest.mark.parametrize("bits_per_channel", [2, 3, 4])
+    def test_extract_without_depth(self, tmp_path, bits_per_channel):
+        """Извлечение не требует bits_per_channel встраивания"""
+        cover = str(tmp_path / 'cover.png')
+        Image.fromarray(np.random.default_rng(8).integers(0, 256, (40, 50, 3), dtype=np.uint8)).save(cover)
+        embedder = Steganography(bits_per_channel=bits_per_channel, kdf_iterations=1000, scatter=True)
+        embedder.embed_message(cover, 'Глубина из заголовка', str(tmp_path / 'text.png'), 'пароль')
+        data = os.urandom(1000)
+        Steganography(bits_per_channel=bits_per_channel).embed_file(cover, io.BytesIO(data),
+                                                                    str(tmp_path / 'file.png'))
+        
+        extractor = Steganography(kdf_iterations=1000)
+        assert extractor.extract_message(str(tmp_path / 'text.png'), 'пароль') == 'Глубина из заголовка'
+        target = io.BytesIO()
+        extractor.extract_file(str(tmp_path / 'file.png'), target)
+        assert target.getvalue() == data
+    
+    def test_header_spans_strips(self, tmp_path):
+        """Заголовок по 1 биту на канал переходит через несколько узких полос"""
+        cover = str(tmp_path / 'cover.bmp')
+        Image.fromarray(np.random.default_rng(9).integers(0, 256, (200, 10, 3), dtype=np.uint8)).save(cover)
+        data = os.urandom(800)
+        full, strips = str(tmp_path / 'full.bmp'), str(tmp_path / 'strips.bmp')
+        Steganography(bits_per_channel=3).embed_file(cover, io.BytesIO(data), full)
+        Steganography(bits_per_channel=3, strip_height=1).embed_file(cover, io.BytesIO(data), strips)
+        
+        assert np.array_equal(np.asarray(Image.open(full)), np.asarray(Image.open(strips)))
+        target = io.BytesIO()
+        Steganography(strip_height=2).extract_file(strips, target)
+        assert target.getvalue() == data
+    
+    def test_legacy_version_1(self, tmp_path):
+        """Контейнер версии 1 (заголовок с глубиной нагрузки) по-прежнему читается"""
+        data = os.urandom(300)
+        pixels = np.random.default_rng(10).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+        writer = LSBWriter(pixels.reshape(-1), 3)
+        writer.write(PayloadHeader(len(data), 3, FLAG_FILE, version=1).pack() + data)
+        writer.flush()
+        path = str(tmp_path / 'legacy.png')
+        Image.fromarray(pixels).save(path)
+        
+        assert LSBAlgorithm(1).extract_data(pixels) == data
+        for stego in (Steganography(), Steganography(bits_per_channel=3, strip_height=4)):
+            target = io.BytesIO()
+            stego.extract_file(path, target)
+            assert target.getvalue() == data
+
+
+class TestAEAD:
+    """Тесты аутентифицированного шифрования AES-GCM"""
+    
+    def test_gcm_payload_without_hash(self, tmp_path):
+        """По умолчанию текст шифруется AES-GCM без префикса с хешем"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'out.png')
+        Image.new('RGB', (60, 40), color='teal').save(cover)
+        stego = Steganography(kdf_iterations=1000, compression='none')
+        message = 'Время: 12:00, место: вокзал'
+        
+        stego.embed_message(cover, message, output, 'пароль')
+        
+        assert stego.probe(output)['aead']
+        assert stego.extract_message(output, 'пароль') == message
+        channels = stego._read_channels(output)[1]
+        assert stego.lsb_algorithm.extract_text(channels, 'пароль') == message
+    
+    def test_tampered_ciphertext_and_wrong_password(self):
+        """Измененный бит шифртекста отвергается тегом, неверный пароль - до расшифровки"""
+        lsb = LSBAlgorithm(1, kdf_iterations=1000, compression='none')
+        pixels = np.random.default_rng(11).integers(0, 256, (40, 40, 3), dtype=np.uint8)
+        data = os.urandom(500)
+        lsb.embed_data(pixels, data, 'пароль')
+        
+        assert lsb.extract_data(pixels, 'пароль') == data
+        with pytest.raises(ValueError, match="Неверный пароль"):
+            lsb.extract_data(pixels, 'другой')
+        prefix_bits = lsb._crypto_prefix_size(lsb.encryption_flags()) * 8
+        pixels.reshape(-1)[88 + prefix_bits + 100] ^= 1
+        with pytest.raises(ValueError, match="тег"):
+            lsb.extract_data(pixels, 'пароль')
+    
+    @pytest.mark.parametrize("cipher", ['gcm', 'cbc'])
+    def test_stream_and_strips(self, tmp_path, cipher):
+        """Файлы шифруются в обоих режимах, режим при извлечении берется из заголовка"""
+        cover = str(tmp_path / 'cover.bmp')
+        Image.fromarray(np.random.default_rng(12).integers(0, 256, (60, 50, 3), dtype=np.uint8)).save(cover)
+        data = os.urandom(600)
+        for name, strip_height in (('full.png', None), ('strips.png', 7)):
+            output = str(tmp_path / name)
+            Steganography(kdf_iterations=1000, strip_height=strip_height, cipher=cipher).embed_file(
+                cover, io.BytesIO(data), output, 'пароль')
+            target = io.BytesIO()
+            Steganography(kdf_iterations=1000).extract_file(output, target, 'пароль')
+            assert target.getvalue() == data
+            assert Steganography().probe(output)['aead'] == (cipher == 'gcm')
+    
+    @pytest.mark.parametrize("compression", ['none', 'zlib'])
+    def test_tampered_file_not_written(self, tmp_path, compression):
+        """При несовпадении тега ни файл результата, ни распаковка не получают данных"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'stego.png')
+        Image.fromarray(np.random.default_rng(13).integers(0, 256, (200, 200, 3), dtype=np.uint8)).save(cover)
+        data = os.urandom(5000) + bytes(5000)
+        Steganography(kdf_iterations=1000, compression=compression).embed_file(
+            cover, io.BytesIO(data), output, 'пароль')
+        pixels = np.array(Image.open(output))
+        prefix_bits = LSBAlgorithm._crypto_prefix_size(LSBAlgorithm().encryption_flags()) * 8
+        pixels.reshape(-1)[88 + prefix_bits + 2000] ^= 1
+        Image.fromarray(pixels).save(output)
+        
+        stego = Steganography(kdf_iterations=1000)
+        target = tmp_path / 'out.bin'
+        target.write_bytes(b'old')
+        with pytest.raises(Exception, match="тег"):
+            stego.extract_file(output, str(target), 'пароль')
+        assert target.read_bytes() == b'old'
+        assert sorted(os.listdir(tmp_path)) == ['cover.png', 'out.bin', 'stego.png']
+        buffer = io.BytesIO()
+        with pytest.raises(Exception, match="тег"):
+            stego.extract_file(output, buffer, 'пароль')
+        assert buffer.getvalue() == b''
+
+    # Каналы флагов заголовка версии 2 (по 1 биту, старший бит первым): FLAG_COMPRESSED и FLAG_FILE
+    @pytest.mark.parametrize("channel", [42, 45])
+    def test_tampered_header_flags(self, tmp_path, channel):
+        """Измененный флаг заголовка отвергается тегом, а не меняет путь извлечения"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'stego.png')
+        message = str(tmp_path / 'message.png')
+        Image.fromarray(np.random.default_rng(14).integers(0, 256, (100, 100, 3), dtype=np.uint8)).save(cover)
+        stego = Steganography(kdf_iterations=1000)
+        stego.embed_file(cover, io.BytesIO(b'0123456789' * 300), output, 'пароль')
+        stego.embed_message(cover, 'Повтор. ' * 50, message, 'пароль')
+        assert stego.probe(output)['compressed'] and stego.probe(message)['compressed']
+        for path in (output, message):
+            pixels = np.array(Image.open(path))
+            pixels.reshape(-1)[channel] ^= 1
+            Image.fromarray(pixels).save(path)
+
+        target = tmp_path / 'out.bin'
+        with pytest.raises(Exception, match="тег"):
+            stego.extract_file(output, str(target), 'пароль')
+        assert not target.exists()
+        # С флагом FLAG_FILE текст отвергается еще до расшифровки
+        with pytest.raises(Exception, match="тег" if channel == 42 else "содержит файл"):
+            stego.extract_message(message, 'пароль')
+
+    def test_legacy_cbc_message(self, tmp_path):
+        """Сообщение в режиме CBC (с хешем) извлекается экземпляром по умолчанию"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'out.png')
+        Image.new('RGB', (60, 40), color='olive').save(cover)
+        Steganography(kdf_iterations=1000, cipher='cbc').embed_message(cover, 'Старый режим', output, 'пароль')
+        
+        assert not Steganography().probe(output)['aead']
+        assert Steganography(kdf_iterations=1000).extract_message(output, 'пароль') == 'Старый режим'
+
+
+class TestSaveProfiles:
+    """Тесты профилей сохранения и переноса метаданных"""
+    
+    def _cover_with_metadata(self, path):
+        from PIL import ImageCms
+        from PIL.PngImagePlugin import PngInfo
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        info = PngInfo()
+        info.add_text('Author', 'StegoLab')
+        rng = np.random.default_rng(11)
+        Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(
+            path, icc_profile=icc, pnginfo=info, dpi=(300, 300))
+        return icc
+    
+    @pytest.mark.parametrize('strip_height', [None, 16])
+    def test_metadata_copied(self, tmp_path, strip_height):
+        """ICC-профиль (и для PNG целиком - текстовые поля) переносятся в результат"""
+        cover = tmp_path / 'cover.png'
+        icc = self._cover_with_metadata(cover)
+        output = tmp_path / 'out.png'
+        
+        Steganography(strip_height=strip_height).embed_message(str(cover), 'Метаданные', str(output))
+        
+        with Image.open(output) as image:
+            assert image.info.get('icc_profile') == icc
+            if strip_height is None:
+                assert image.text['Author'] == 'StegoLab'
+                assert image.info['dpi'] == pytest.approx((300, 300), abs=0.1)
+    
+    def test_strip_metadata(self, tmp_path):
+        """Без keep_metadata метаданные не переносятся"""
+        cover = tmp_path / 'cover.png'
+        self._cover_with_metadata(cover)
+        output = tmp_path / 'out.png'
+        
+        Steganography(keep_metadata=False).embed_message(str(cover), 'Без метаданных', str(output))
+        
+        with Image.open(output) as image:
+            assert 'icc_profile' not in image.info
+            assert 'Author' not in image.text
+    
+    def test_profiles_trade_size(self, tmp_path):
+        """Профиль small дает файл не больше, чем fast; данные одинаковы"""
+        cover = tmp_path / 'cover.png'
+        Image.fromarray(np.tile(np.arange(128, dtype=np.uint8), (128, 3)).reshape(128, 128, 3)).save(cover)
+        fast, small = tmp_path / 'fast.png', tmp_path / 'small.png'
+        
+        Steganography(save_profile='fast').embed_message(str(cover), 'Профиль', str(fast))
+        Steganography(save_profile='small').embed_message(str(cover), 'Профиль', str(small))
+        
+        assert small.stat().st_size <= fast.stat().st_size
+        assert np.array_equal(np.asarray(Image.open(fast)), np.asarray(Image.open(small)))
+        with pytest.raises(ValueError):
+            Steganography(save_profile='unknown')
+    
+    @pytest.mark.parametrize('suffix, file_format', [('.bmp', 'BMP'), ('.tiff', 'TIFF'), ('.jpg', 'JPEG')])
+    def test_format_follows_extension(self, tmp_path, suffix, file_format):
+        """Формат результата выбирается по расширению; JPEG - встраиванием в DCT-коэффициенты"""
+        cover = tmp_path / 'cover.png'
+        rng = np.random.default_rng(5)
+        Image.fromarray(rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)).save(cover)
+        output = tmp_path / f'out{suffix}'
+        
+        Steganography().embed_message(str(cover), 'Формат', str(output))
+        
+        with Image.open(output) as image:
+            assert image.format == file_format
+        assert Steganography().extract_message(str(output)) == 'Формат'
+
+class TestNativeModes:
+    """Тесты встраивания в исходном режиме изображения"""
+    
+    @pytest.mark.parametrize('mode, mask', [
+        ('L', None),
+        ('LA', None),
+        ('LA', 'LA'),
+        ('RGBA', None),
+        ('RGBA', 'RGBA'),
+        ('I;16', None),
+    ])
+    def test_native_roundtrip(self, tmp_path, mode, mask):
+        """Режим и альфа-канал сохраняются, сообщение извлекается"""
+        rng = np.random.default_rng(7)
+        bands = len(Image.new(mode, (1, 1)).getbands())
+        dtype = np.dtype('<u2') if mode == 'I;16' else np.uint8
+        data = rng.integers(0, np.iinfo(dtype).max, 40 * 30 * bands).astype(dtype)
+        cover = tmp_path / 'cover.png'
+        Image.frombuffer(mode, (40, 30), data.tobytes(), 'raw', mode, 0, 1).save(cover)
+        output = tmp_path / 'out.png'
+        stego = Steganography(bits_per_channel=2, channel_mask=mask)
+        
+        stego.embed_message(str(cover), 'Исходный режим', str(output))
+        
+        with Image.open(output) as image:
+            assert image.mode == mode
+            result = np.frombuffer(image.tobytes(), dtype=dtype).reshape(30, 40, bands)
+        original = data.reshape(30, 40, bands)
+        assert np.array_equal(result >> 2, original >> 2)
+        if mode in ('LA', 'RGBA') and mask is None:
+            assert np.array_equal(result[..., -1], original[..., -1])
+        assert stego.extract_message(str(output)) == 'Исходный режим'
+    
+    def test_capacity_follows_mask(self, tmp_path):
+        """Вместимость считается по каналам маски"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGBA', (20, 10)).save(cover)
+        
+        assert Steganography().get_image_info(str(cover))['max_bytes'] == 20 * 10 * 3 // 8 - 11
+        assert Steganography(channel_mask='RGBA').get_image_info(str(cover))['max_bytes'] == 20 * 10 * 4 // 8 - 11
+    
+    def test_rgba_default_mask_matches_rgb(self, tmp_path):
+        """Без альфа-канала в маске поток битов совпадает с RGB-изображением"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGBA', (30, 30), color=(10, 20, 30, 128)).save(cover)
+        output = tmp_path / 'out.png'
+        Steganography().embed_message(str(cover), 'Прозрачность', str(output))
+        
+        rgb = tmp_path / 'rgb.png'
+        Image.open(output).convert('RGB').save(rgb)
+        assert Steganography().extract_message(str(rgb)) == 'Прозрачность'
+
+    @pytest.mark.parametrize('mask', [None, 'RGBA'])
+    def test_rgba_to_bmp_rejected(self, tmp_path, mask):
+        """RGBA не сохраняется в BMP: альфа-канал и нагрузка в нем были бы потеряны"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGBA', (30, 30), color=(10, 20, 30, 128)).save(cover)
+        output = tmp_path / 'out.bmp'
+
+        with pytest.raises(Exception, match="BMP не поддерживает режим RGBA"):
+            Steganography(channel_mask=mask).embed_message(str(cover), 'Прозрачность', str(output))
+        assert not output.exists()
+
+    @pytest.mark.parametrize('mode, mask', [('LA', 'LA'), ('RGBA', 'RGBA'), ('I;16', None)])
+    def test_output_format_checked_before_embedding(self, tmp_path, monkeypatch, mode, mask):
+        """Формат результата без каналов режима отклоняется до загрузки и встраивания"""
+        cover = tmp_path / 'cover.png'
+        Image.new(mode, (30, 30)).save(cover)
+        output = tmp_path / 'out.bmp'
+
+        def forbidden(self, *args, **kwargs):
+            raise AssertionError("Изображение не должно загружаться")
+        monkeypatch.setattr(ImageProcessor, 'load_image', forbidden)
+
+        stego = Steganography(channel_mask=mask)
+        with pytest.raises(Exception, match=f"BMP не поддерживает режим {re.escape(mode)}"):
+            stego.embed_message(str(cover), 'Маска', str(output))
+        with pytest.raises(Exception, match="BMP не поддерживает"):
+            stego.embed_file(str(cover), io.BytesIO(b'data'), str(output))
+        assert not output.exists()
+
+class TestJPEGEngine:
+    """Тесты встраивания в DCT-коэффициенты JPEG"""
+    
+    @pytest.fixture
+    def jpeg_cover(self, tmp_path):
+        rng = np.random.default_rng(21)
+        y, x = np.mgrid[0:240, 0:320]
+        pixels = np.stack([x % 256, (x + y) % 256, (y * 2) % 256], axis=-1)
+        pixels = np.clip(pixels + rng.integers(-30, 30, pixels.shape), 0, 255).astype(np.uint8)
+        path = tmp_path / 'cover.jpg'
+        Image.fromarray(pixels).save(path, quality=90, restart_marker_blocks=4)
+        return path
+    
+    def test_coefficients_round_trip(self, jpeg_cover):
+        """Без изменения коэффициентов файл воспроизводится побайтно, измененные биты читаются обратно"""
+        data = jpeg_cover.read_bytes()
+        coefficients = JPEGCoefficients(data)
+        channels = coefficients.channels()
+        assert coefficients.to_bytes(channels) == data
+        
+        changed = np.random.default_rng(3).integers(0, 2, channels.size).astype(np.uint8)
+        assert np.array_equal(JPEGCoefficients(coefficients.to_bytes(changed)).channels(), changed)
+    
+    @pytest.mark.parametrize('password', [None, 'jpeg_pass'])
+    def test_message_round_trip(self, jpeg_cover, tmp_path, password):
+        """Сообщение в JPEG-результате извлекается; размер файла почти не меняется"""
+        output = tmp_path / 'out.jpg'
+        stego = Steganography(kdf_iterations=1000)
+        stego.embed_message(str(jpeg_cover), 'Сообщение в DCT', str(output), password)
+        
+        assert stego.extract_message(str(output), password) == 'Сообщение в DCT'
+        with Image.open(output) as image:
+            assert image.format == 'JPEG'
+            image.load()
+        assert abs(output.stat().st_size - jpeg_cover.stat().st_size) < 64
+    
+    def test_file_from_png_cover(self, tmp_path):
+        """PNG-обложка кодируется в JPEG, файл извлекается из коэффициентов"""
+        cover = tmp_path / 'cover.png'
+        rng = np.random.default_rng(8)
+        Image.fromarray(rng.integers(0, 256, (128, 128, 3), dtype=np.uint8)).save(cover)
+        payload = os.urandom(500)
+        output = tmp_path / 'out.jpeg'
+        
+        stego = Steganography()
+        assert stego.embed_file(str(cover), io.BytesIO(payload), str(output)) == 500
+        target = io.BytesIO()
+        stego.extract_file(str(output), target)
+        assert target.getvalue() == payload
+    
+    def test_capacity_and_overflow(self, jpeg_cover, tmp_path):
+        """Вместимость считается по коэффициентам, превышение дает ошибку"""
+        stego = Steganography()
+        capacity = stego.calculate_jpeg_capacity(str(jpeg_cover))
+        assert 0 < capacity < 240 * 320 * 3 // 8
+        # Случайный текст не сжимается до вместимости
+        with pytest.raises(Exception, match="слишком длинное"):
+            stego.embed_message(str(jpeg_cover), os.urandom(capacity * 2).hex(), str(tmp_path / 'out.jpg'))
+    
+    def test_progressive_rejected(self, tmp_path):
+        """Прогрессивный JPEG не поддерживается"""
+        cover = tmp_path / 'progressive.jpg'
+        Image.new('RGB', (64, 64), (10, 120, 200)).save(cover, progressive=True)
+        with pytest.raises(Exception, match="baseline"):
+            Steganography().embed_message(str(cover), 'Тест', str(tmp_path / 'out.jpg'))
+
+
+class TestMappedImage:
+    """Тесты встраивания в несжатые BMP/TIFF через mmap"""
+    
+    @pytest.mark.parametrize('suffix, save_options', [
+        ('.bmp', {}),
+        ('.tiff', {'tiffinfo': {278: 5}}),
+        ('.tif', {}),
+    ])
+    def test_mapped_embed_keeps_format(self, tmp_path, monkeypatch, suffix, save_options):
+        """Результат остаётся в исходном формате и совпадает по пикселям с обычным путём"""
+        rng = np.random.default_rng(5)
+        cover = tmp_path / f'cover{suffix}'
+        Image.fromarray(rng.integers(0, 256, (31, 22, 3), dtype=np.uint8)).save(cover, **save_options)
+        original = cover.read_bytes()
+        data = bytes(rng.integers(0, 256, 400, dtype=np.uint8))
+        stego = Steganography(bits_per_channel=2)
+        
+        mapped, decoded = tmp_path / f'out{suffix}', tmp_path / 'out.png'
+        with monkeypatch.context() as patch:
+            def forbidden(self, *args, **kwargs):
+                raise AssertionError("Несжатое изображение не должно декодироваться")
+            patch.setattr(ImageProcessor, 'load_image', forbidden)
+            stego.embed_file(str(cover), io.BytesIO(data), str(mapped))
+        stego.embed_file(str(cover), io.BytesIO(data), str(decoded))
+        
+        assert cover.read_bytes() == original
+        assert len(mapped.read_bytes()) == len(original)
+        with Image.open(mapped) as image:
+            assert image.format == Image.open(cover).format
+            assert np.array_equal(np.asarray(image), np.asarray(Image.open(decoded)))
+        target = io.BytesIO()
+        stego.extract_file(str(mapped), target)
+        assert target.getvalue() == data
+    
+    def test_mapped_message_in_place(self, tmp_path):
+        """Сообщение встраивается в BMP на месте и извлекается"""
+        cover = tmp_path / 'cover.bmp'
+        Image.new('RGB', (50, 40), color='olive').save(cover)
+        stego = Steganography()
+        
+        stego.embed_message(str(cover), 'На месте', str(cover), 'pass')
+        
+        assert stego.is_encrypted(str(cover)) is True
+        assert stego.extract_message(str(cover), 'pass') == 'На месте'
+
+class TestInstrumentation:
+    """Тесты замеров времени этапов"""
+    
+    def _cover(self, path):
+        rng = np.random.default_rng(4)
+        Image.fromarray(rng.integers(0, 256, (80, 80, 3), dtype=np.uint8)).save(path)
+    
+    def test_stages_and_events(self, tmp_path):
+        """Сборщик получает события начала и конца этапов со счетчиками"""
+        cover = tmp_path / 'cover.png'
+        self._cover(cover)
+        events = []
+        collector = StageCollector(callback=lambda event, stage, info: events.append((event, stage, info)))
+        stego = Steganography(kdf_iterations=1000, instrumentation=collector)
+        
+        stego.embed_message(str(cover), 'Замер этапов', str(tmp_path / 'out.png'), 'pass')
+        
+        stages = {row['stage']: row for row in collector.summary()}
+        assert {'open', 'decode', 'kdf', 'encrypt', 'embed', 'encode'} <= set(stages)
+        assert stages['decode']['pixels'] == 80 * 80
+        assert stages['embed']['bytes'] > 0
+        starts = [e for e in events if e[0] == 'start']
+        stops = [e for e in events if e[0] == 'stop']
+        assert len(starts) == len(stops)
+        assert all(info['seconds'] >= 0 for _, _, info in stops)
+        assert 'embed' in collector.format_summary()
+    
+    def test_profile_and_merge(self, tmp_path):
+        """cProfile сохраняется в файл, сводки заданий суммируются"""
+        cover = tmp_path / 'cover.png'
+        self._cover(cover)
+        collector = StageCollector(profile=True)
+        stego = Steganography(instrumentation=collector)
+        stego.embed_message(str(cover), 'Профиль', str(tmp_path / 'out.png'))
+        stego.extract_message(str(tmp_path / 'out.png'))
+        
+        collector.dump_profile(str(tmp_path / 'run.prof'))
+        assert (tmp_path / 'run.prof').stat().st_size > 0
+        assert 'cumulative' in collector.profile_text(5)
+        
+        merged = {row['stage']: row for row in merge_summaries([collector.summary(), collector.summary()])}
+        assert merged['decode']['calls'] == 2 * {r['stage']: r for r in collector.summary()}['decode']['calls']
+    
+    def test_disabled_by_default(self):
+        """Без сборщика используются пустые замеры"""
+        stego = Steganography()
+        assert stego.instrumentation is NULL_INSTRUMENTATION
+        assert stego.lsb_algorithm.instrumentation is NULL_INSTRUMENTATION
+        with NULL_INSTRUMENTATION.stage('embed', bytes=1) as stage:
+            stage.add(bytes=1)
+
+
+class TestBenchmark:
+    """Тесты нагрузочных замеров"""
+    
+    @pytest.mark.parametrize('encrypted', [False, True])
+    def test_run_case_reports_stages(self, tmp_path, encrypted):
+        """Вариант замера возвращает время этапов, скорость и память"""
+        cover = str(tmp_path / 'cover.png')
+        benchmark.synthetic_cover(cover, 0.01)
+        case = {'megapixels': 0.01, 'payload_bytes': 500, 'bits_per_channel': 2, 'encrypted': encrypted,
+                'kdf_iterations': 1000, 'repeat': 1, 'legacy': False}
+        
+        result = benchmark.run_case(case, cover)
+        
+        assert result['status'] == 'ok'
+        expected = set(benchmark.STAGES) - (set() if encrypted else {'kdf'})
+        assert set(result['stages']) == expected
+        assert result['embed_mb_s'] > 0 and result['extract_mb_s'] > 0
+        json.dumps(result)
+    
+    def test_peak_rss_excludes_parent(self):
+        """Пиковая память варианта не включает память родительского процесса"""
+        ballast = np.ones(200 * 1024 * 1024, dtype=np.uint8)
+        case = {'megapixels': 0.01, 'payload_bytes': 100, 'bits_per_channel': 1, 'encrypted': False,
+                'kdf_iterations': 1000, 'repeat': 1, 'legacy': False}
+
+        report = benchmark.run_benchmark([case])
+
+        assert ballast.sum() > 0
+        assert report['cases'][0]['status'] == 'ok'
+        peak = report['cases'][0]['peak_rss_mb']
+        assert peak is None or peak < 200
+
+    def test_oversized_payload_skipped(self, tmp_path):
+        """Нагрузка больше вместимости пропускается, а не считается ошибкой"""
+        cover = str(tmp_path / 'cover.png')
+        benchmark.synthetic_cover(cover, 0.001)
+        case = {'megapixels': 0.001, 'payload_bytes': 10 ** 6, 'bits_per_channel': 1, 'encrypted': False,
+                'kdf_iterations': 1000, 'repeat': 1, 'legacy': False}
+        assert benchmark.run_case(case, cover)['status'] == 'skipped'
+
+
+class TestECC:
+    """Тесты кода коррекции ошибок"""
+    
+    def test_codec_corrects_half_of_parity(self):
+        """Исправляется до nsym / 2 байт в слове, больше - ошибка"""
+        rng = np.random.default_rng(5)
+        codec = ReedSolomonCodec(16)
+        blocks = rng.integers(0, 256, (20, codec.data_size), dtype=np.uint8)
+        codewords = codec.encode_blocks(blocks)
+        assert not codec.syndromes(codewords).any()
+        
+        damaged = codewords.copy()
+        for row in range(len(damaged)):
+            positions = rng.choice(255, row % 9, replace=False)
+            damaged[row, positions] ^= rng.integers(1, 256, len(positions), dtype=np.uint8)
+        data, corrected = codec.decode_blocks(damaged)
+        assert np.array_equal(data, blocks)
+        assert corrected == sum(row % 9 for row in range(20))
+        
+        damaged = codewords[:1].copy()
+        damaged[0, :9] ^= 0xFF
+        with pytest.raises(ValueError):
+            codec.decode_blocks(damaged)
+    
+    @pytest.mark.parametrize('size', [0, 1, 222, 223, 5000])
+    def test_stream_roundtrip_with_burst(self, size):
+        """Поток восстанавливается после пакета ошибок в пределах глубины чередования"""
+        data = os.urandom(size)
+        encoded = bytearray(ecc_encode(data, 8, 4))
+        assert len(encoded) == EccEncoder(8, 4).encoded_length(size)
+        # По 4 исправимых байта в каждом из чередованных слов группы
+        words = min(4, size // 247 + 1)
+        encoded[20:20 + 4 * words] = bytes(4 * words)
+        assert ecc_decode(bytes(encoded)) == data
+    
+    def test_capacity_accounts_for_parity(self):
+        """Вместимость с кодом коррекции меньше и данные этого размера помещаются"""
+        plain = LSBAlgorithm(1).calculate_max_bytes(100, 100)
+        protected = LSBAlgorithm(1, ecc_symbols=32)
+        max_bytes = protected.calculate_max_bytes(100, 100)
+        assert max_bytes < plain
+        assert EccEncoder(32).encoded_length(max_bytes) <= plain
+    
+    @pytest.mark.parametrize('strip_height', [None, 16])
+    def test_embedded_file_survives_damage(self, tmp_path, strip_height):
+        """Зашифрованный файл извлекается после порчи младших битов изображения"""
+        rng = np.random.default_rng(6)
+        cover = tmp_path / 'cover.png'
+        Image.fromarray(rng.integers(0, 256, (120, 120, 3), dtype=np.uint8)).save(cover)
+        output = str(tmp_path / 'out.png')
+        data = os.urandom(3000)
+        stego = Steganography(kdf_iterations=1000, strip_height=strip_height, ecc_symbols=32, ecc_depth=8)
+        length = stego.embed_file(str(cover), io.BytesIO(data), output, 'pass')
+        
+        pixels = np.array(Image.open(output))
+        flat = pixels.reshape(-1)
+        # Каналы после заголовка: случайные одиночные ошибки и пакет подряд
+        flat[rng.choice(np.arange(200, length * 8), 60, replace=False)] ^= 1
+        flat[4000:4400] ^= 1
+        Image.fromarray(pixels).save(output)
+        
+        target = io.BytesIO()
+        Steganography(strip_height=strip_height).extract_file(output, target, 'pass')
+        assert target.getvalue() == data
+    
+    def test_message_with_ecc(self, tmp_path):
+        """Сообщение с кодом коррекции извлекается без указания параметров кода"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (100, 100), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        Steganography(ecc_symbols=16).embed_message(str(cover), 'Защищено кодом', output)
+        
+        pixels = np.array(Image.open(output))
+        pixels.reshape(-1)[300:340] ^= 1
+        Image.fromarray(pixels).save(output)
+        
+        assert Steganography().extract_message(output) == 'Защищено кодом'
+    
+    def test_invalid_parameters(self):
+        """Нечетное число проверочных байт отклоняется сразу"""
+        with pytest.raises(Exception):
+            Steganography(ecc_symbols=7)
+
+
+class TestCompression:
+    """Тесты сжатия нагрузки перед встраиванием"""
+    
+    @pytest.mark.parametrize('codec', available_codecs())
+    def test_codec_roundtrip(self, codec):
+        """Каждый алгоритм восстанавливает данные, несжимаемые данные не сжимаются"""
+        data = 'Повторяющийся текст. '.encode('utf-8') * 200
+        compressed = compress_payload(data, codec)
+        assert len(compressed) < len(data)
+        assert decompress_payload(compressed) == data
+        assert compress_payload(os.urandom(1000), codec) is None
+    
+    def test_stream_decision(self):
+        """Поток сжимается по решению на его начале"""
+        chunks, compressed = compress_stream([b'a' * 100000, b'b' * 100000])
+        assert compressed
+        assert decompress_payload(b''.join(chunks)) == b'a' * 100000 + b'b' * 100000
+        chunks, compressed = compress_stream([os.urandom(100000)])
+        assert not compressed
+    
+    def test_fewer_channels_changed(self, tmp_path):
+        """Сжатый текст изменяет меньше каналов и извлекается без настроек"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (100, 100), color='gray').save(cover)
+        text = 'Строка отчета, которая повторяется много раз. ' * 40
+        changed = {}
+        for method in ('auto', 'none'):
+            output = str(tmp_path / f'{method}.png')
+            Steganography(compression=method).embed_message(str(cover), text, output, 'pass')
+            changed[method] = np.count_nonzero(np.asarray(Image.open(output)) != 128)
+            assert Steganography().extract_message(output, 'pass') == text
+        assert changed['auto'] * 4 < changed['none']
+        
+        header = LSBAlgorithm().read_header(np.asarray(Image.open(tmp_path / 'auto.png')).reshape(-1))
+        assert header.flags & FLAG_COMPRESSED
+    
+    @pytest.mark.parametrize('strip_height', [None, 16])
+    def test_text_larger_than_capacity(self, tmp_path, strip_height):
+        """Сжимаемый текст больше вместимости помещается в изображение"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (40, 40), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        stego = Steganography(strip_height=strip_height)
+        text = 'abc' * (stego.lsb_algorithm.calculate_max_bytes(40, 40) // 2)
+        
+        stego.embed_message(str(cover), text, output)
+        
+        assert Steganography(strip_height=strip_height).extract_message(output) == text
+    
+    def test_file_stream_with_encryption_and_ecc(self, tmp_path):
+        """Сжатие, шифрование и код коррекции совместимы при потоковой обработке файла"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (100, 100), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        data = b'0123456789' * 5000
+        
+        length = Steganography(kdf_iterations=1000, ecc_symbols=16).embed_file(
+            str(cover), io.BytesIO(data), output, 'pass')
+        
+        assert length < len(data) // 10
+        target = io.BytesIO()
+        assert Steganography().extract_file(output, target, 'pass', chunk_size=64) == len(data)
+        assert target.getvalue() == data
+
+    @pytest.mark.parametrize('codec', available_codecs())
+    def test_decompression_bomb_rejected(self, codec):
+        """Распаковка останавливается, как только данные превышают предел"""
+        bomb = compress_payload(bytes(1 << 24), codec)
+        assert len(bomb) < 1 << 16
+
+        with pytest.raises(ValueError, match="больше допустимых"):
+            decompress_payload(bomb, max_size=1 << 20)
+        assert len(decompress_payload(bomb, max_size=1 << 24)) == 1 << 24
+
+    @pytest.mark.parametrize('binary', [False, True])
+    def test_extract_respects_limit(self, tmp_path, binary):
+        """Извлечение сжатой нагрузки больше предела завершается ошибкой"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (100, 100), color='gray').save(cover)
+        output = str(tmp_path / 'out.png')
+        data = b'0' * 200000
+        if binary:
+            Steganography().embed_file(str(cover), io.BytesIO(data), output)
+        else:
+            Steganography().embed_message(str(cover), data.decode(), output)
+
+        limited = Steganography(max_decompressed_size=100000)
+        with pytest.raises(Exception, match="больше допустимых"):
+            if binary:
+                limited.extract_file(output, io.BytesIO())
+            else:
+                limited.extract_message(output)
+
+
+class TestParallelBands:
+    """Тесты параллельной записи и чтения полосами каналов"""
+    
+    @pytest.fixture(autouse=True)
+    def small_bands(self, monkeypatch):
+        # Маленькие полосы, чтобы параллельный путь работал на небольших изображениях
+        monkeypatch.setattr(bit_stream, 'PARALLEL_MIN_CHANNELS', 512)
+    
+    @pytest.mark.parametrize('bits_per_channel', [1, 3, 4])
+    @pytest.mark.parametrize('head', [0, 1, 11])
+    def test_writer_and_reader_match_serial(self, bits_per_channel, head):
+        """Полосы дают те же каналы и байты, что и последовательная обработка"""
+        rng = np.random.default_rng(bits_per_channel)
+        channels = rng.integers(0, 256, 20000, dtype=np.uint8)
+        prefix, data = os.urandom(head), os.urandom(20000 * bits_per_channel // 8 - head - 5)
+        results = []
+        for workers in (1, 4):
+            target = channels.copy()
+            writer = LSBWriter(target, bits_per_channel, workers=workers)
+            writer.write(prefix)
+            writer.write(data)
+            writer.flush()
+            results.append(target)
+            reader = LSBReader(target, bits_per_channel, workers=workers)
+            assert reader.read(head) == prefix
+            assert reader.read(len(data)) == data
+        assert np.array_equal(results[0], results[1])
+    
+    @pytest.mark.parametrize('strip_height', [None, 40])
+    def test_images_identical(self, tmp_path, strip_height):
+        """Результат встраивания в потоках совпадает побайтно"""
+        rng = np.random.default_rng(8)
+        cover = tmp_path / 'cover.png'
+        Image.fromarray(rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)).save(cover)
+        data = os.urandom(5000)
+        outputs = []
+        for workers in (1, 3):
+            output = tmp_path / f'out{workers}.png'
+            stego = Steganography(bits_per_channel=2, strip_height=strip_height, workers=workers)
+            stego.embed_file(str(cover), io.BytesIO(data), str(output))
+            outputs.append(np.asarray(Image.open(output)))
+            target = io.BytesIO()
+            stego.extract_file(str(output), target)
+            assert target.getvalue() == data
+        assert np.array_equal(outputs[0], outputs[1])
+
+
+class TestSteganalysis:
+    """Тесты стегоанализа"""
+    
+    def _natural(self, path, seed=1):
+        """Гладкое изображение с шумом, похожее на фотографию"""
+        rng = np.random.default_rng(seed)
+        yy, xx = np.mgrid[0:240, 0:320]
+        base = np.stack([128 + 60 * np.sin(xx / 37) * np.cos(yy / 53), 100 + 80 * np.sin((xx + yy) / 71),
+                         90 + 50 * np.cos(xx / 29 - yy / 41)], axis=-1)
+        image = Image.fromarray(np.clip(base + rng.normal(0, 6, base.shape), 0, 255).astype(np.uint8))
+        image.filter(ImageFilter.GaussianBlur(1)).save(path)
+    
+    def test_clean_and_embedded(self, tmp_path):
+        """Чистое изображение не подозрительно, оценки RS и SPA близки к доле встраивания"""
+        cover = str(tmp_path / 'cover.png')
+        self._natural(cover)
+        clean = steganalysis.analyze_image(cover)
+        assert not clean['suspicious']
+        assert clean['rs'] < 0.05 and clean['spa'] < 0.05
+        
+        output = str(tmp_path / 'stego.png')
+        stego = Steganography(compression='none')
+        capacity = stego.lsb_algorithm.calculate_max_bytes(320, 240)
+        stego.embed_file(cover, io.BytesIO(os.urandom(capacity // 2)), output)
+        
+        result = steganalysis.analyze_image(output)
+        assert result['suspicious']
+        assert abs(result['rs'] - 0.5) < 0.1 and abs(result['spa'] - 0.5) < 0.1
+        # Длина по хи-квадрат - оценка сверху
+        assert clean['chi_square_length'] < 0.5 <= result['chi_square_length']
+    
+    def test_chi_square_profile(self):
+        """p-значение высоко в заполненном начале потока и падает после него"""
+        rng = np.random.default_rng(2)
+        # Неравные частоты в парах значений 2i, 2i+1
+        values = (rng.integers(0, 128, 100000) * 2 + (rng.random(100000) < 0.2)).astype(np.uint8)
+        values[:30000] = (values[:30000] & 0xFE) | rng.integers(0, 2, 30000, dtype=np.uint8)
+        profile = steganalysis.chi_square_profile(values, 10)
+        assert profile[:3].min() > steganalysis.CHI_SQUARE_P
+        assert profile[-1] < 1e-6
+        assert steganalysis.chi_square_attack(values, 10)['length'] == 0.3
+    
+    def test_layout_channels(self, tmp_path):
+        """Анализируются только каналы маски: альфа-канал по умолчанию пропускается"""
+        pixels = np.zeros((16, 16, 4), dtype=np.uint8)
+        pixels[..., 3] = np.random.default_rng(3).integers(0, 256, (16, 16))
+        result = steganalysis.analyze_pixels(pixels, ChannelLayout('RGBA'))
+        assert result['score'] == 0 and not result['suspicious']
+    
+    def test_cli_scan(self, tmp_path, capsys):
+        """Команда scan выводит балл и вердикт для каждого изображения"""
+        self._natural(tmp_path / 'a.png')
+        Steganography(compression='none').embed_file(str(tmp_path / 'a.png'), io.BytesIO(os.urandom(20000)),
+                                                     str(tmp_path / 'b.png'))
+        
+        code = run_cli(['scan', '--input', str(tmp_path), '--workers', '1', '--quiet',
+                        '--results', str(tmp_path / 'scan.jsonl')])
+        
+        assert code == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert [line.split('\t')[2] for line in lines] == ['чисто', 'ПОДОЗРИТЕЛЬНО']
+        records = [json.loads(line) for line in open(tmp_path / 'scan.jsonl', encoding='utf-8')]
+        assert {'rs', 'spa', 'chi_square_p', 'score'} <= set(records[0])
+
+
+class TestProbe:
+    """Тесты быстрой проверки заголовка"""
+    
+    def test_probe_detects_depth_without_full_decode(self, tmp_path, monkeypatch):
+        """Глубина и флаги определяются по первым пикселям, изображение целиком не загружается"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'stego.png')
+        Image.fromarray(np.random.default_rng(4).integers(0, 256, (120, 160, 3), dtype=np.uint8)).save(cover)
+        Steganography(bits_per_channel=3, kdf_iterations=1000).embed_message(cover, 'Секрет', output, 'пароль')
+        
+        def forbidden(self, *args, **kwargs):
+            raise AssertionError("Изображение не должно загружаться целиком")
+        monkeypatch.setattr(ImageProcessor, 'load_image', forbidden)
+        
+        result = Steganography().probe(output)
+        assert result['found'] and result['version'] == 2
+        assert result['bits_per_channel'] == 3
+        assert result['encrypted'] and result['key_check'] and not result['file']
+        assert result['length'] > 0
+        assert Steganography().probe(cover) == {'found': False}
+    
+    @pytest.mark.parametrize("name,mode", [('a.png', 'RGB'), ('b.bmp', 'RGB'), ('c.png', 'LA'), ('d.tif', 'L')])
+    def test_read_head_matches_full_decode(self, tmp_path, name, mode):
+        """Начало изображения совпадает с полным декодированием"""
+        path = str(tmp_path / name)
+        channels = len(mode)
+        data = np.random.default_rng(5).integers(0, 256, (50, 7, channels), dtype=np.uint8)
+        Image.fromarray(data.squeeze(-1) if channels == 1 else data, mode).save(path)
+        
+        head, head_mode = ImageProcessor.read_head(path, 20)
+        assert head_mode == mode and head.shape == (3, 7, channels)
+        assert np.array_equal(head, data[:3])
+    
+    def test_probe_jpeg_and_cli(self, tmp_path, capsys):
+        """Заголовок JPEG-результата и вывод команды probe"""
+        cover = str(tmp_path / 'cover.png')
+        Image.fromarray(np.random.default_rng(6).integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(cover)
+        Steganography().embed_message(cover, 'JPEG', str(tmp_path / 'stego.jpg'))
+        Steganography(bits_per_channel=2, scatter=True).embed_message(cover, 'PNG', str(tmp_path / 'stego.png'),
+                                                                       'пароль')
+        
+        code = run_cli(['probe', '--input', str(tmp_path), '--workers', '1', '--quiet'])
+        
+        assert code == 0
+        lines = [line.split('\t') for line in capsys.readouterr().out.splitlines()]
+        assert lines[0][1] == 'нет данных'
+        assert lines[1][1:3] == ['v2', '1 бит']
+        assert lines[2][2] == '2 бит' and 'scattered' in lines[2][4] and 'encrypted' in lines[2][4]
+
+    def test_probe_jpeg_decodes_only_head(self, tmp_path, monkeypatch):
+        """Для JPEG декодируются только первые коэффициенты, а не весь скан"""
+        cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'stego.jpg')
+        Image.fromarray(np.random.default_rng(7).integers(0, 256, (256, 256, 3), dtype=np.uint8)).save(cover)
+        Steganography().embed_message(cover, 'JPEG', output)
+        full = JPEGCoefficients.from_file(output)
+
+        decoded = []
+        original = JPEGCoefficients._decode
+        def counting(self, scan, count=None):
+            positions, negative = original(self, scan, count)
+            decoded.append(len(positions))
+            return positions, negative
+        monkeypatch.setattr(JPEGCoefficients, '_decode', counting)
+
+        head = JPEGCoefficients.from_file(output, PROBE_CHANNELS)
+        assert np.array_equal(head.channels(), full.channels()[:PROBE_CHANNELS])
+
+        decoded.clear()
+        assert Steganography().probe(output)['found']
+        assert sum(decoded) == PROBE_CHANNELS < full.capacity_bits() // 100
+
+
+class TestCLI:
+    """Тесты пакетного режима командной строки"""
+    
+    def test_batch_manifest_records_errors(self, tmp_path):
+        """Ошибка в одном задании попадает в файл результатов, остальные выполняются"""
+        cover = tmp_path / 'cover.png'
+        Image.new('RGB', (60, 60), color='green').save(cover)
+        payload = tmp_path / 'message.txt'
+        payload.write_text('Пакетное сообщение', encoding='utf-8')
+        manifest = tmp_path / 'jobs.csv'
+        manifest.write_text(
+            'cover,payload,output\n'
+            f'{cover},{payload},{tmp_path / "out.png"}\n'
+            f'{tmp_path / "missing.png"},{payload},{tmp_path / "out2.png"}\n',
+            encoding='utf-8')
+        results = tmp_path / 'results.jsonl'
+        
+        code = run_cli(['embed', '--manifest', str(manifest), '--workers', '1',
+                        '--results', str(results), '--quiet'])
+        
+        assert code == 1
+        records = [json.loads(line) for line in results.read_text(encoding='utf-8').splitlines()]
+        assert [r['status'] for r in records] == ['ok', 'error']
+        assert Steganography().extract_message(str(tmp_path / 'out.png')) == 'Пакетное сообщение'
+
+    def test_output_dir_keeps_lossless_format(self, tmp_path):
+        """В каталоге результатов BMP и TIFF сохраняют формат, остальные становятся PNG"""
+        covers = tmp_path / 'covers'
+        covers.mkdir()
+        for name in ('a.bmp', 'b.tiff', 'c.jpg'):
+            Image.new('RGB', (60, 60), color='green').save(covers / name)
+        out = tmp_path / 'out'
+
+        code = run_cli(['embed', '--input', str(covers), '--output-dir', str(out), '--message', 'Формат',
+                        '--workers', '1', '--quiet'])
+
+        assert code == 0
+        assert sorted(os.listdir(out)) == ['a.bmp', 'b.tiff', 'c.png']
+        assert Image.open(out / 'a.bmp').format == 'BMP'
+        for name in os.listdir(out):
+            assert Steganography().extract_message(str(out / name)) == 'Формат'
+
+    def test_output_dir_keeps_subdirectories(self, tmp_path):
+        """Одноименные изображения из разных каталогов не перезаписывают результаты друг друга"""
+        for index, folder in enumerate(('a', 'b', 'b/c')):
+            (tmp_path / 'covers' / folder).mkdir(parents=True)
+            Image.new('RGB', (60, 60), color=(index, 0, 0)).save(tmp_path / 'covers' / folder / 'img.png')
+        out = tmp_path / 'out'
+
+        code = run_cli(['embed', '--input', str(tmp_path / 'covers' / '**' / '*.png'), '--output-dir', str(out),
+                        '--message', 'Каталоги', '--workers', '1', '--quiet'])
+
+        assert code == 0
+        for folder in ('a', 'b', 'b/c'):
+            assert Steganography().extract_message(str(out / folder / 'img.png')) == 'Каталоги'
+
+    def test_duplicate_outputs_reported(self, tmp_path):
+        """Задания с общим выходным файлом завершаются ошибкой, остальные выполняются"""
+        for name in ('img.png', 'img.bmp', 'other.png'):
+            Image.new('RGB', (60, 60), color='green').save(tmp_path / name)
+        manifest = tmp_path / 'jobs.csv'
+        manifest.write_text(
+            'cover,output\n'
+            f'{tmp_path / "img.png"},{tmp_path / "out.png"}\n'
+            f'{tmp_path / "img.bmp"},{tmp_path / "out.png"}\n'
+            f'{tmp_path / "other.png"},{tmp_path / "other_out.png"}\n',
+            encoding='utf-8')
+        results = tmp_path / 'results.jsonl'
+
+        code = run_cli(['embed', '--manifest', str(manifest), '--message', 'x', '--workers', '1',
+                        '--results', str(results), '--quiet'])
+
+        assert code == 1
+        records = [json.loads(line) for line in results.read_text(encoding='utf-8').splitlines()]
+        assert sorted(r['status'] for r in records) == ['error', 'error', 'ok']
+        assert not (tmp_path / 'out.png').exists()
+
+    def test_capacity_reads_header_only(self, tmp_path, monkeypatch, capsys):
+        """Команда capacity не декодирует пиксели"""
+        for name, size in (('a.png', (40, 30)), ('b.bmp', (10, 10))):
+            Image.new('RGB', size).save(tmp_path / name)
+        
+        def forbidden(self, *args, **kwargs):
+            raise AssertionError("Пиксели не должны декодироваться")
+        monkeypatch.setattr(Image.Image, 'load', forbidden)
+        
+        code = run_cli(['capacity', '--input', str(tmp_path), '--bits', '2'])
+        
+        assert code == 0
+        lines = capsys.readouterr().out.splitlines()
+        # Заголовок занимает 88 каналов по 1 биту
+        assert lines[0].split('\t')[1:] == ['40x30', 'RGB', str((40 * 30 * 3 - 88) * 2 // 8)]
+        assert len(lines) == 2
+
 if __name__ == "__main__":
     # Запуск тестов с детальным выводом
     print("=" * 60)